@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for chunk_markdown.
+
+Compares the single-pass SentenceSplitter against the original
+placeholder-based split_into_sentences implementation, both on the lines of
+a Markdown file and on one long synthetic line, reports how long a fresh
+interpreter takes to import chunk_markdown, and compares the size and parse
+time of each output format.
+
+Usage:
+    python bench_chunk_markdown.py
+    python bench_chunk_markdown.py --file tests/CBT/Self_Administered_CBT.md --repeat 20
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from chunk_markdown import (
+    OUTPUT_EXTENSIONS,
+    OUTPUT_WRITERS,
+    chunk_markdown_file,
+    read_records,
+    split_into_sentences,
+)
+
+
+def legacy_split_into_sentences(text):
+    """The original placeholder-based splitter, kept as the benchmark baseline."""
+    abbreviations = {
+        'Dr', 'Mr', 'Mrs', 'Ms', 'Prof', 'Rev', 'Fr', 'Sr', 'Jr',
+        'Ph.D', 'M.D', 'B.A', 'M.A', 'B.S', 'M.S', 'PhD', 'MD',
+        'U.S', 'U.K', 'U.S.A', 'U.K', 'EU', 'UN', 'NATO', 'FBI', 'CIA',
+        'Jan', 'Feb', 'Mar', 'Apr', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+        'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun',
+        'a.m', 'p.m', 'AM', 'PM', 'etc', 'i.e', 'e.g', 'vs', 'vol', 'no',
+        'Inc', 'Corp', 'Ltd', 'Co', 'LLC'
+    }
+
+    protected_text = text
+    abbrev_replacements = {}
+    replacement_counter = 0
+
+    for abbrev in abbreviations:
+        pattern = rf'\b{re.escape(abbrev)}\.'
+        matches = list(re.finditer(pattern, protected_text, re.IGNORECASE))
+        for match in reversed(matches):
+            placeholder = f"__ABBREV_{replacement_counter}__"
+            abbrev_replacements[placeholder] = match.group(0)
+            protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
+            replacement_counter += 1
+
+    for match in reversed(list(re.finditer(r'\b\d+\.\d+\b', protected_text))):
+        placeholder = f"__DECIMAL_{replacement_counter}__"
+        abbrev_replacements[placeholder] = match.group(0)
+        protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
+        replacement_counter += 1
+
+    for match in reversed(list(re.finditer(r'\b[A-Z]\.', protected_text))):
+        start_pos = match.start()
+        if start_pos > 0:
+            before_match = protected_text[:start_pos].strip()
+            if before_match and (before_match[-1].isalpha() or before_match.endswith('.')):
+                placeholder = f"__INITIAL_{replacement_counter}__"
+                abbrev_replacements[placeholder] = match.group(0)
+                protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
+                replacement_counter += 1
+
+    for match in reversed(list(re.finditer(r'\b\w+\.[a-zA-Z]{2,4}\b', protected_text))):
+        matched_text = match.group(0)
+        if '.' in matched_text and not matched_text[0].isupper():
+            placeholder = f"__EXT_{replacement_counter}__"
+            abbrev_replacements[placeholder] = matched_text
+            protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
+            replacement_counter += 1
+
+    sentences = re.split(r'([.!?]+)\s+(?=[A-Z]|$)', protected_text)
+
+    reconstructed_sentences = []
+    for i in range(0, len(sentences), 2):
+        sentence_text = sentences[i].strip()
+        if i + 1 < len(sentences):
+            sentence_text += sentences[i + 1]
+        if sentence_text:
+            reconstructed_sentences.append(sentence_text)
+
+    final_sentences = []
+    for sentence in reconstructed_sentences:
+        for placeholder, original in abbrev_replacements.items():
+            sentence = sentence.replace(placeholder, original)
+        final_sentences.append(sentence.strip())
+
+    return [s for s in final_sentences if s.strip()]
+
+
+def bench(label, func, lines, repeat):
+    """Time func over every line and print the best run."""
+    best = min(timeit.repeat(lambda: [func(line) for line in lines], number=1, repeat=repeat))
+    print(f"  {label:<10} {best * 1000:10.2f} ms")
+    return best
+
+
+def bench_split_into_sentences(lines, repeat):
+    """Benchmark and cross-check the legacy and current sentence splitters."""
+    mismatches = sum(1 for line in lines if legacy_split_into_sentences(line) != split_into_sentences(line))
+    legacy = bench('legacy', legacy_split_into_sentences, lines, repeat)
+    current = bench('current', split_into_sentences, lines, repeat)
+    print(f"  speedup    {legacy / current:10.1f}x  ({mismatches} mismatching lines)")
+
+
+def bench_import_time(repeat):
+    """Report the best cumulative import time of chunk_markdown in a fresh interpreter."""
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import chunk_markdown'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        # Last line is chunk_markdown itself: "import time: self | cumulative | name"
+        timings.append(int(result.stderr.strip().splitlines()[-1].split('|')[1]))
+    print(f"  import     {min(timings) / 1000:10.2f} ms")
+
+
+def bench_output_formats(file_path, repeat):
+    """Report the size and parse time of each output format for one markdown file."""
+    records = chunk_markdown_file(file_path, os.path.basename(file_path))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for output_format, write_records in OUTPUT_WRITERS.items():
+            output_path = os.path.join(temp_dir, 'records' + OUTPUT_EXTENSIONS[output_format])
+            write_records(records, output_path)
+            best = min(timeit.repeat(lambda: list(read_records(output_path)), number=1, repeat=repeat))
+            print(f"  {output_format:<10} {os.path.getsize(output_path) / 1024:10.1f} KB {best * 1000:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for chunk_markdown')
+    parser.add_argument(
+        '--file',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'CBT', 'Self_Administered_CBT.md'),
+        help='Markdown file whose lines are used as benchmark input'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing runs (best is reported)')
+    args = parser.parse_args()
+
+    with open(args.file, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    print(f"split_into_sentences: {len(lines)} lines from {args.file}")
+    bench_split_into_sentences(lines, args.repeat)
+
+    long_line = ' '.join(lines)
+    print(f"split_into_sentences: one line of {len(long_line)} characters")
+    bench_split_into_sentences([long_line], args.repeat)
+
+    print("import chunk_markdown (cumulative, fresh interpreter)")
+    bench_import_time(args.repeat)
+
+    print("output formats: size and read_records time")
+    bench_output_formats(args.file, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,211 @@
+#!/usr/bin/env python3
+"""
+Markdown Chunker
+
+Splits markdown files into sentence (or semantic chunk / paragraph) records
+that keep their chapter, section and subsection headings, and writes one
+JSON, JSON Lines or compact JSON Lines file per markdown file. The
+hierarchical strategy writes section, semantic chunk and sentence records
+together, each numbered so it can be linked to the ones it contains.
+
+Files are first split into blocks (see iter_markdown_blocks): paragraphs,
+list items and block quotes are prose and are split into sentences; code
+fences and tables are skipped, or kept whole as one record each with
+--keep-blocks; front matter and horizontal rules are skipped.
+
+Usage:
+    python chunk_markdown.py docs/ --output-dir chunks/ --workers 8
+    python chunk_markdown.py "books/**/*.md" --strategy semantic --format compact
+    python chunk_markdown.py docs/ --strategy hierarchical --format jsonl
+    python chunk_markdown.py docs/ --keep-blocks code --keep-blocks table
+    python chunk_markdown.py --gui
+"""
+
+import functools
+import glob
+import hashlib
 import os
+import io
 import json
-import tkinter as tk
-from tkinter import filedialog
+import itertools
 import re
 
+# Common abbreviations that shouldn't trigger sentence splits
+ABBREVIATIONS = frozenset({
+    # Titles
+    'Dr', 'Mr', 'Mrs', 'Ms', 'Prof', 'Rev', 'Fr', 'Sr', 'Jr',
+    # Academic and professional
+    'Ph.D', 'M.D', 'B.A', 'M.A', 'B.S', 'M.S', 'PhD', 'MD',
+    # Geographic and organizational
+    'U.S', 'U.K', 'U.S.A', 'EU', 'UN', 'NATO', 'FBI', 'CIA',
+    # Time and measurements
+    'Jan', 'Feb', 'Mar', 'Apr', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+    'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun',
+    'a.m', 'p.m', 'AM', 'PM', 'etc', 'i.e', 'e.g', 'vs', 'vol', 'no',
+    # Technical
+    'Inc', 'Corp', 'Ltd', 'Co', 'LLC'
+})
+
+
+# Files larger than this are split at headings for parallel chunking
+DEFAULT_SPLIT_BYTES = 4 * 1024 * 1024
+
+# Bump when a change to the chunker changes its output, so incremental runs
+# re-chunk everything
+CHUNKER_VERSION = 4
+
+# Chunking strategies: the smart_chunk_text strategies plus hierarchical
+STRATEGIES = ('sentence', 'semantic', 'paragraph', 'hierarchical')
+
+# Record levels of the hierarchical strategy, coarsest first
+LEVELS = ('section', 'chunk', 'sentence')
+
+# Blocks of iter_markdown_blocks whose text is split into sentences
+PROSE_BLOCKS = ('paragraph', 'list_item', 'quote')
+
+# Non-prose blocks that can be kept whole as one record instead of skipped
+KEEPABLE_BLOCKS = ('code', 'table')
+
+# Section records of the hierarchical strategy hold at most this many
+# characters of the section (whole sentences), to stay within embedding limits
+MAX_SECTION_CHARS = 6000
+
+# Manifest of chunked files kept in the output directory by --incremental
+MANIFEST_FILENAME = '.chunk_manifest.json'
+
+# Header tag of the compact (dictionary-encoded JSON Lines) output format
+COMPACT_FORMAT = 'md-qd-compact'
+
+# Version of the compact format, in its header; read_records rejects others
+COMPACT_VERSION = 1
+
+# Record fields that repeat across records and are stored once in compact output
+COMPACT_INDEXED_FIELDS = ('source_file', 'chapter_name', 'section_name', 'subsection_name', 'level')
+
+
+class SentenceSplitter:
+    """
+    Sentence splitter whose protection rules are compiled once per
+    abbreviation set.
+
+    Splitting works on character offsets: one pass collects the intervals of
+    protected tokens (abbreviations, decimals, initials, file extensions), a
+    second pass finds sentence boundaries that fall outside them. The text
+    itself is never rewritten, so both passes are linear in its length.
+    """
+
+    def __init__(self, abbreviations=ABBREVIATIONS):
+        # Longest first so that e.g. 'U.S.A' wins over 'U.S'
+        abbrev_alternation = '|'.join(
+            re.escape(abbr) for abbr in sorted(set(abbreviations), key=len, reverse=True)
+        )
+
+        # One alternation, tried in priority order at every word start.
+        # Protected tokens all run into a period, which the leading
+        # lookahead checks once before trying the alternatives:
+        # - abbreviation followed by period, case insensitive
+        # - decimal numbers (e.g., 3.14, 12.5)
+        # - single-letter initials (e.g., "John T.", "J. R. R.")
+        # - file extensions and domains, but not capitalised sentence starts
+        #   and not when the suffix is itself an abbreviation ("foo.co.")
+        self._protected_pattern = re.compile(
+            r'\b(?=\w+\.)(?:'
+            rf'(?P<abbrev>(?i:{abbrev_alternation})\.)'
+            r'|(?P<decimal>\d+\.\d+\b)'
+            r'|(?P<initial>[A-Z]\.)'
+            rf'|(?P<extension>(?![A-Z])\w+\.(?!(?i:{abbrev_alternation})\.)[a-zA-Z]{{2,4}}\b)'
+            r')'
+        )
+        # Sentence ending punctuation + whitespace + capital letter (or end)
+        self._boundary_pattern = re.compile(r'([.!?]+)\s+(?=[A-Z]|$)')
+
+    def protected_intervals(self, text):
+        """Return sorted (start, end) offsets of tokens that must not end a sentence."""
+        intervals = []
+        # End of the last abbreviation or decimal; an initial right after one
+        # does not count as following a name
+        last_token_end = -1
+
+        for match in self._protected_pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == 'initial':
+                # Only protect initials that follow a word (name) or another
+                # initial, i.e. the previous non-space character is a letter
+                # or a free-standing period
+                pos = match.start() - 1
+                while pos >= 0 and text[pos].isspace():
+                    pos -= 1
+                if pos < 0 or pos < last_token_end:
+                    continue
+                if not (text[pos].isalpha() or text[pos] == '.'):
+                    continue
+            elif kind != 'extension':
+                last_token_end = match.end()
+            intervals.append(match.span())
+
+        return intervals
+
+    def spans(self, text):
+        """Return (start, end) offsets of each sentence in text."""
+        intervals = self.protected_intervals(text)
+        protected_starts = {start for start, _ in intervals}
+        spans = []
+        sentence_start = 0
+        index = 0
+
+        for match in self._boundary_pattern.finditer(text):
+            punct_start, punct_end = match.span(1)
+            next_start = match.end()
+
+            # Punctuation that belongs to a protected token doesn't count
+            while index < len(intervals) and intervals[index][1] <= punct_start:
+                index += 1
+            if index < len(intervals) and intervals[index][0] <= punct_start:
+                punct_start = intervals[index][1]
+                if punct_start >= punct_end:
+                    continue
+
+            # Neither does a boundary followed by a protected token ("... Dr. Smith")
+            if next_start in protected_starts:
+                continue
+
+            start = sentence_start
+            while text[start].isspace():
+                start += 1
+            spans.append((start, punct_end))
+            sentence_start = next_start
+
+        start, end = sentence_start, len(text)
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            spans.append((start, end))
+        return spans
+
+    def split(self, text):
+        """Split text into a list of sentences."""
+        return [text[start:end] for start, end in self.spans(text)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_sentence_splitter(abbreviations=ABBREVIATIONS):
+    """
+    Return the SentenceSplitter for an abbreviation set, compiling it on
+    first use so that importing this module does not pay for it.
+    """
+    return SentenceSplitter(frozenset(abbreviations))
+
+
+def sentence_spans(text):
+    """
+    Return the (start, end) character offsets of each sentence in text,
+    using the same rules as split_into_sentences.
+    """
+    return get_sentence_splitter().spans(text)
+
+
 def split_into_sentences(text):
     """
     Split text into sentences using improved regex pattern that handles:
@@ -13,111 +215,7 @@ def split_into_sentences(text):
     - File extensions and URLs (.com, .py)
     - Multiple sentence endings (!!, ??)
     """
-    # Common abbreviations that shouldn't trigger sentence splits
-    abbreviations = {
-        # Titles
-        'Dr', 'Mr', 'Mrs', 'Ms', 'Prof', 'Rev', 'Fr', 'Sr', 'Jr',
-        # Academic and professional
-        'Ph.D', 'M.D', 'B.A', 'M.A', 'B.S', 'M.S', 'PhD', 'MD',
-        # Geographic and organizational  
-        'U.S', 'U.K', 'U.S.A', 'U.K', 'EU', 'UN', 'NATO', 'FBI', 'CIA',
-        # Time and measurements
-        'Jan', 'Feb', 'Mar', 'Apr', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
-        'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun',
-        'a.m', 'p.m', 'AM', 'PM', 'etc', 'i.e', 'e.g', 'vs', 'vol', 'no',
-        # Technical
-        'Inc', 'Corp', 'Ltd', 'Co', 'LLC'
-    }
-    
-    # Create a pattern for abbreviations - case insensitive matching
-    abbrev_pattern = '|'.join(re.escape(abbr) for abbr in abbreviations)
-    
-    # Enhanced sentence splitting pattern:
-    # - Look for sentence ending punctuation (.!?)
-    # - Followed by whitespace and capital letter (or end of string)
-    # - But NOT if preceded by known abbreviations
-    # - Handle multiple punctuation marks (e.g., "Really?!" or "Wait...")
-    
-    # First, protect abbreviations by temporarily replacing them
-    protected_text = text
-    abbrev_replacements = {}
-    replacement_counter = 0
-    
-    # Protect common abbreviations
-    for abbrev in abbreviations:
-        # Match abbreviation followed by period, case insensitive
-        pattern = rf'\b{re.escape(abbrev)}\.'
-        matches = list(re.finditer(pattern, protected_text, re.IGNORECASE))
-        for match in reversed(matches):  # Process in reverse to maintain positions
-            placeholder = f"__ABBREV_{replacement_counter}__"
-            abbrev_replacements[placeholder] = match.group(0)
-            protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
-            replacement_counter += 1
-    
-    # Protect decimal numbers (e.g., 3.14, 12.5)
-    decimal_pattern = r'\b\d+\.\d+\b'
-    decimal_matches = list(re.finditer(decimal_pattern, protected_text))
-    for match in reversed(decimal_matches):
-        placeholder = f"__DECIMAL_{replacement_counter}__"
-        abbrev_replacements[placeholder] = match.group(0)
-        protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
-        replacement_counter += 1
-    
-    # Protect single-letter initials (e.g., "John T.", "Dr. Aaron T.", "J. R. R.")
-    # This handles cases where initials follow names or titles
-    initial_pattern = r'\b[A-Z]\.'
-    initial_matches = list(re.finditer(initial_pattern, protected_text))
-    for match in reversed(initial_matches):
-        # Check if this initial follows a word (name) or another initial
-        start_pos = match.start()
-        if start_pos > 0:
-            # Look at the character before to see if it's part of a name
-            before_match = protected_text[:start_pos].strip()
-            if before_match and (before_match[-1].isalpha() or before_match.endswith('.')):
-                placeholder = f"__INITIAL_{replacement_counter}__"
-                abbrev_replacements[placeholder] = match.group(0)
-                protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
-                replacement_counter += 1
-    
-    # Protect file extensions and URLs (basic protection)
-    extension_pattern = r'\b\w+\.[a-zA-Z]{2,4}\b'
-    extension_matches = list(re.finditer(extension_pattern, protected_text))
-    for match in reversed(extension_matches):
-        # Only protect if it looks like a file extension or domain
-        matched_text = match.group(0)
-        if '.' in matched_text and not matched_text[0].isupper():  # Avoid protecting sentence starts
-            placeholder = f"__EXT_{replacement_counter}__"
-            abbrev_replacements[placeholder] = matched_text
-            protected_text = protected_text[:match.start()] + placeholder + protected_text[match.end():]
-            replacement_counter += 1
-    
-    # Now split sentences on the protected text
-    # Split on: sentence ending punctuation + whitespace + capital letter (or end)
-    sentence_pattern = r'([.!?]+)\s+(?=[A-Z]|$)'
-    sentences = re.split(sentence_pattern, protected_text)
-    
-    # Reconstruct sentences (the split creates alternating text and punctuation)
-    reconstructed_sentences = []
-    for i in range(0, len(sentences), 2):
-        sentence_text = sentences[i].strip()
-        if i + 1 < len(sentences):
-            # Add back the punctuation
-            sentence_text += sentences[i + 1]
-        
-        if sentence_text:  # Only add non-empty sentences
-            reconstructed_sentences.append(sentence_text)
-    
-    # Restore protected abbreviations and numbers
-    final_sentences = []
-    for sentence in reconstructed_sentences:
-        for placeholder, original in abbrev_replacements.items():
-            sentence = sentence.replace(placeholder, original)
-        final_sentences.append(sentence.strip())
-    
-    # Final cleanup - remove empty sentences
-    final_sentences = [s for s in final_sentences if s.strip()]
-    
-    return final_sentences
+    return get_sentence_splitter().split(text)
 
 
 def create_semantic_chunks(sentences, max_chunk_size=3, max_chars=500):
@@ -132,6 +230,11 @@ def create_semantic_chunks(sentences, max_chunk_size=3, max_chars=500):
     Returns:
         List of text chunks (each chunk is a string of combined sentences)
     """
+    return [' '.join(group) for group in group_semantic_chunks(sentences, max_chunk_size, max_chars)]
+
+
+def group_semantic_chunks(sentences, max_chunk_size=3, max_chars=500):
+    """Like create_semantic_chunks, but return each chunk as its list of sentences."""
     if not sentences:
         return []
     
@@ -148,7 +251,7 @@ def create_semantic_chunks(sentences, max_chunk_size=3, max_chars=500):
         
         # If adding this sentence would exceed limits and we have content, finalize current chunk
         if (will_exceed_size or will_exceed_chars) and current_chunk:
-            chunks.append(' '.join(current_chunk))
+            chunks.append(current_chunk)
             current_chunk = []
             current_char_count = 0
         
@@ -158,7 +261,7 @@ def create_semantic_chunks(sentences, max_chunk_size=3, max_chars=500):
     
     # Add the final chunk if it has content
     if current_chunk:
-        chunks.append(' '.join(current_chunk))
+        chunks.append(current_chunk)
     
     return chunks
 
@@ -341,92 +444,973 @@ def process_heading_line_with_content(line, level):
     
     return title.strip(), content.strip()
 
-def chunk_markdown_file(file_path, filename):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+_FENCE_RE = re.compile(r'(`{3,}|~{3,})(.*)')
+_FENCE_CLOSE_RE = re.compile(r'(`{3,}|~{3,})\s*')
+_RULE_RE = re.compile(r'([-*_])(\s*\1){2,}')
+_LIST_ITEM_RE = re.compile(r'(?:[-*+]|\d{1,9}[.)])\s+(.*)')
+_QUOTE_RE = re.compile(r'(?:>\s?)+')
+_TABLE_DELIMITER_RE = re.compile(r'\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)+\|?|\|\s*:?-+:?\s*\|')
 
-    sentences_data = []
-    
-    # Initialize heading contexts - only track H1, H2, and H3
-    current_h1 = None
-    current_h2 = None
-    current_h3 = None
-
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if not line:  # Skip empty lines
+
+def _opening_fence(line):
+    """The backtick or tilde run opening a code fence on a stripped line, or None."""
+    match = _FENCE_RE.fullmatch(line)
+    if not match or (match.group(1)[0] == '`' and '`' in match.group(2)):
+        # Backticks in the info string make it inline code, not a fence
+        return None
+    return match.group(1)
+
+
+def _closes_fence(line, fence):
+    """Whether a stripped line closes the code fence opened by fence."""
+    match = _FENCE_CLOSE_RE.fullmatch(line)
+    return bool(match) and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence)
+
+
+def iter_markdown_blocks(lines, front_matter=True):
+    """
+    Split markdown lines into blocks, yielding (kind, text) pairs in order.
+
+    Kinds are 'heading' (the stripped heading line), the prose blocks
+    'paragraph', 'list_item' and 'quote' (their lines joined with spaces,
+    without list markers or '>'), and 'code' (the lines between the fences,
+    indentation kept), 'table' (its stripped rows), 'front_matter' (a block
+    between '---' lines at the start, if front_matter is set) and 'rule'.
+    Blank lines end blocks; lines that start no block of their own continue
+    the open paragraph, list item or quote. Indented lines are read like
+    unindented ones, since indented lists are far more common in chunked
+    documents than indented code. Blocks are yielded as soon as they end, so
+    only the current block is held in memory.
+    """
+    kind = None
+    buffer = []
+    fence = None
+    first = front_matter
+
+    def flush():
+        nonlocal kind, buffer
+        block = None
+        if kind is not None:
+            block = (kind, '\n'.join(buffer) if kind in ('code', 'table', 'front_matter') else ' '.join(buffer))
+        kind, buffer = None, []
+        return block
+
+    for raw_line in lines:
+        line = raw_line.rstrip('\r\n')
+        stripped = line.strip()
+        at_start, first = first, False
+
+        if fence is not None:
+            if _closes_fence(stripped, fence):
+                fence = None
+                yield flush()
+            else:
+                buffer.append(line)
+            continue
+        if kind == 'front_matter':
+            if stripped in ('---', '...'):
+                yield flush()
+            else:
+                buffer.append(line)
+            continue
+        if at_start and stripped == '---':
+            kind = 'front_matter'
             continue
 
-        # Check if the line starts with a hash, indicating a markdown heading
-        if line.startswith('#'):
-            match = re.match(r'^(#+)\s*(.*)', line)
-            if match:
-                level = len(match.group(1))
-                title, content = process_heading_line_with_content(line, level)
-
-                # Only track H1, H2, and H3 levels
-                if level == 1:
-                    current_h1 = title
-                    current_h2 = None
-                    current_h3 = None
-                elif level == 2:
-                    current_h2 = title
-                    current_h3 = None
-                elif level == 3:
-                    current_h3 = title
-                # Ignore H4, H5, and H6 levels
-                
-                # If there's content on the same line as the heading, process it
-                if content:
-                    raw_sentences = split_into_sentences(content)
-                    for sentence in raw_sentences:
-                        sentence = sentence.strip()
-                        if sentence:  # Ensure sentence is not empty
-                            sentences_data.append({
-                                'text': sentence,
-                                'source_file': filename,
-                                'chapter_name': current_h1,
-                                'section_name': current_h2,
-                                'subsection_name': current_h3
-                            })
+        if not stripped:
+            block = flush()
+            if block:
+                yield block
+            continue
+
+        opening = _opening_fence(stripped)
+        if opening is not None:
+            block = flush()
+            if block:
+                yield block
+            fence, kind = opening, 'code'
+            continue
+
+        if stripped.startswith('#'):
+            new_block = ('heading', stripped)
+        elif _RULE_RE.fullmatch(stripped):
+            new_block = ('rule', stripped)
+        elif stripped.startswith('|') or (
+                kind == 'paragraph' and len(buffer) == 1 and '|' in buffer[0]
+                and _TABLE_DELIMITER_RE.fullmatch(stripped)):
+            # A row, or the delimiter row turning a one-line paragraph into a table header
+            if kind == 'paragraph':
+                kind = 'table'
+            if kind != 'table':
+                block = flush()
+                if block:
+                    yield block
+                kind = 'table'
+            buffer.append(stripped)
+            continue
+        elif (match := _LIST_ITEM_RE.fullmatch(stripped)) is not None:
+            block = flush()
+            if block:
+                yield block
+            kind, buffer = 'list_item', [match.group(1).strip()]
+            continue
+        elif stripped.startswith('>'):
+            content = _QUOTE_RE.sub('', stripped, count=1).strip()
+            if kind != 'quote' or not content:
+                # An empty quote line separates paragraphs of the quote
+                block = flush()
+                if block:
+                    yield block
+            if content:
+                kind = 'quote'
+                buffer.append(content)
+            continue
         else:
-            # Process non-heading text into sentences
-            raw_sentences = split_into_sentences(line)
-            for sentence in raw_sentences:
-                sentence = sentence.strip()
-                if sentence:  # Ensure sentence is not empty
-                    sentences_data.append({
-                        'text': sentence,
-                        'source_file': filename,
-                        'chapter_name': current_h1,
-                        'section_name': current_h2,
-                        'subsection_name': current_h3
-                    })
-    
-    return sentences_data
+            if kind not in PROSE_BLOCKS:
+                block = flush()
+                if block:
+                    yield block
+                kind = 'paragraph'
+            buffer.append(stripped)
+            continue
+
+        block = flush()
+        if block:
+            yield block
+        yield new_block
+
+    if kind == 'front_matter':
+        # Never closed, so the first '---' was a rule and the rest is ordinary markdown
+        yield ('rule', '---')
+        yield from iter_markdown_blocks(buffer, front_matter=False)
+        return
+    block = flush()
+    if block:
+        yield block
+
+
+def _record(text, filename, headings):
+    current_h1, current_h2, current_h3 = headings
+    return {
+        'text': text,
+        'source_file': filename,
+        'chapter_name': current_h1,
+        'section_name': current_h2,
+        'subsection_name': current_h3
+    }
+
+
+def _text_records(text, filename, headings, strategy='sentence'):
+    """Yield one record per chunk of text under the given (H1, H2, H3) headings."""
+    for chunk in smart_chunk_text(text, strategy):
+        chunk = chunk.strip()
+        if chunk:  # Ensure chunk is not empty
+            yield _record(chunk, filename, headings)
+
+
+def _update_headings(line, headings):
+    """
+    Apply a stripped markdown line to the (H1, H2, H3) heading context.
+
+    Returns the new heading context and any content that shares the line with
+    the heading, or None as content if the line is not a heading.
+    """
+    # Check if the line starts with a hash, indicating a markdown heading
+    if not line.startswith('#'):
+        return headings, None
+    match = re.match(r'^(#+)\s*(.*)', line)
+    if not match:
+        return headings, None
+
+    current_h1, current_h2, current_h3 = headings
+    level = len(match.group(1))
+    title, content = process_heading_line_with_content(line, level)
+
+    # Only track H1, H2, and H3 levels
+    if level == 1:
+        current_h1 = title
+        current_h2 = None
+        current_h3 = None
+    elif level == 2:
+        current_h2 = title
+        current_h3 = None
+    elif level == 3:
+        current_h3 = title
+    # Ignore H4, H5, and H6 levels
+
+    return (current_h1, current_h2, current_h3), content
+
+
+def _level_record(level, text, filename, headings):
+    return dict(_record(text, filename, headings), level=level)
+
+
+def _section_records(blocks, filename, headings):
+    """
+    Yield the hierarchical records of one section, given the sentences of
+    each of its blocks: the section record, then each semantic chunk record
+    followed by the sentence records it holds.
+    """
+    chunks = [group for sentences in blocks for group in group_semantic_chunks(sentences)]
+    if not chunks:
+        return
+    section_text = ''
+    for sentence in itertools.chain.from_iterable(chunks):
+        if section_text and len(section_text) + len(sentence) + 1 > MAX_SECTION_CHARS:
+            break
+        section_text = f"{section_text} {sentence}" if section_text else sentence
+    yield _level_record('section', section_text, filename, headings)
+    for group in chunks:
+        yield _level_record('chunk', ' '.join(group), filename, headings)
+        for sentence in group:
+            yield _level_record('sentence', sentence, filename, headings)
+
+
+def _sentences(text):
+    return [sentence.strip() for sentence in split_into_sentences(text) if sentence.strip()]
+
+
+def _iter_hierarchical_records(blocks, filename, headings=(None, None, None), keep_blocks=()):
+    """
+    Yield section, chunk and sentence records for markdown blocks. A section
+    is the text between two headings; its record comes before the records
+    it contains, and each chunk record before its sentences. Kept blocks
+    are one "sentence" each.
+    """
+    section = []
+    for kind, text in blocks:
+        if kind == 'heading':
+            yield from _section_records(section, filename, headings)
+            headings, content = _update_headings(text, headings)
+            section = [_sentences(content)] if content else []
+        elif kind in PROSE_BLOCKS:
+            section.append(_sentences(text))
+        elif kind in keep_blocks:
+            section.append([text])
+    yield from _section_records(section, filename, headings)
+
+
+def _iter_line_records(lines, filename, headings=(None, None, None), strategy='sentence', keep_blocks=(),
+                       front_matter=True):
+    """
+    Yield records for markdown lines, starting from the given heading
+    context. Prose blocks are chunked with strategy, code and table blocks
+    in keep_blocks become one record each, and other blocks are skipped.
+    front_matter says whether the lines start a file (see iter_markdown_blocks).
+    """
+    blocks = iter_markdown_blocks(lines, front_matter)
+    if strategy == 'hierarchical':
+        yield from _iter_hierarchical_records(blocks, filename, headings, keep_blocks)
+        return
+    for kind, text in blocks:
+        if kind == 'heading':
+            headings, content = _update_headings(text, headings)
+            if content:
+                # If there's content on the same line as the heading, process it
+                yield from _text_records(content, filename, headings, strategy)
+        elif kind in PROSE_BLOCKS:
+            yield from _text_records(text, filename, headings, strategy)
+        elif kind in keep_blocks:
+            yield _record(text, filename, headings)
+
+
+def number_records(records):
+    """
+    Set each record's sentence_index: its position (from 0) among the
+    records of its file, so neighbouring sentences can be looked up.
+
+    Hierarchical records (with a level) are numbered per level instead, and
+    also get the indexes of the section and chunk they belong to: every one
+    has section_index, chunk_index and sentence_index, None where they don't
+    apply.
+    """
+    counts = dict.fromkeys(LEVELS, 0)
+    current = dict.fromkeys(LEVELS)
+    for index, record in enumerate(records):
+        level = record.get('level')
+        if level is None:
+            record['sentence_index'] = index
+            yield record
+            continue
+        current[level] = counts[level]
+        counts[level] += 1
+        # Finer levels start again under a new section or chunk
+        for finer in LEVELS[LEVELS.index(level) + 1:]:
+            current[finer] = None
+        for numbered in LEVELS:
+            record[f'{numbered}_index'] = current[numbered]
+        yield record
+
+
+def iter_chunk_markdown_file(file_path, filename, strategy='sentence', keep_blocks=()):
+    """
+    Stream records from a markdown file, one per chunk produced by the
+    given smart_chunk_text strategy (or section, chunk and sentence records
+    for the hierarchical strategy), numbered by number_records. Code and
+    table blocks are skipped unless their kind is in keep_blocks.
+
+    The file is read line by line and each record is yielded as soon as it is
+    produced, so memory use does not grow with the size of the file.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from number_records(_iter_line_records(f, filename, strategy=strategy, keep_blocks=keep_blocks))
+
+
+def chunk_markdown_file(file_path, filename, strategy='sentence', keep_blocks=()):
+    """Chunk a markdown file into a list of sentence records."""
+    return list(iter_chunk_markdown_file(file_path, filename, strategy, keep_blocks))
+
+
+def write_json_records(records, output_path):
+    """
+    Write records to output_path as a JSON array, one record at a time.
+
+    The output is identical to json.dump(list(records), f, indent=4,
+    ensure_ascii=False) but only one record is held in memory.
+    Returns the number of records written.
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            encoded = json.dumps(record, indent=4, ensure_ascii=False)
+            f.write('[\n    ' if count == 0 else ',\n    ')
+            f.write(encoded.replace('\n', '\n    '))
+            count += 1
+        f.write('\n]' if count else '[]')
+    return count
+
+
+def write_jsonl_records(records, output_path):
+    """Write records to output_path as JSON Lines, one record per line."""
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def write_compact_records(records, output_path):
+    """
+    Write records to output_path as dictionary-encoded JSON Lines.
+
+    The first line is a header naming the record fields. Each distinct value
+    of an indexed field (source file and headings) is written once, as a
+    bare JSON line, the first time it appears; records are JSON arrays in
+    field order that refer to those values by index. Like the other writers
+    this streams, holding only the table of distinct values in memory.
+    Returns the number of records written.
+    """
+    count = 0
+    fields = None
+    indexed = ()
+    value_index = {}
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            if fields is None:
+                fields = list(record)
+                indexed = [field for field in fields if field in COMPACT_INDEXED_FIELDS]
+                f.write(json.dumps({'format': COMPACT_FORMAT, 'version': COMPACT_VERSION, 'fields': fields, 'indexed': indexed}))
+                f.write('\n')
+
+            row = []
+            for field in fields:
+                value = record.get(field)
+                if value is not None and field in indexed:
+                    index = value_index.get(value)
+                    if index is None:
+                        index = value_index[value] = len(value_index)
+                        f.write(json.dumps(value, ensure_ascii=False))
+                        f.write('\n')
+                    value = index
+                row.append(value)
+            f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+
+        if fields is None:
+            f.write(json.dumps({'format': COMPACT_FORMAT, 'version': COMPACT_VERSION, 'fields': [], 'indexed': []}))
+            f.write('\n')
+    return count
+
+
+OUTPUT_WRITERS = {
+    'json': write_json_records,
+    'jsonl': write_jsonl_records,
+    'compact': write_compact_records,
+}
+
+OUTPUT_EXTENSIONS = {
+    'json': '.json',
+    'jsonl': '.jsonl',
+    'compact': '.compact.jsonl',
+}
+
+
+def _iter_json_lines(f, block_size=1024):
+    """Parse JSON Lines from f, decoding blocks of lines with one json.loads call each."""
+    while True:
+        block = list(itertools.islice(f, block_size))
+        if not block:
+            return
+        lines = [line for line in block if line.strip()]
+        if lines:
+            yield from json.loads('[' + ','.join(lines) + ']')
+
+
+def _iter_json_array(f, chunk_size=64 * 1024):
+    """
+    Incrementally parse a top-level JSON array from f, yielding one element
+    at a time while holding only a chunk-sized window of the text in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    expect = '['
+
+    while True:
+        # Skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer = f.read(chunk_size)
+            pos = 0
+            eof = not buffer
+
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        char = buffer[pos]
+
+        if expect == '[':
+            if char != '[':
+                raise ValueError("JSON data must be a list of objects")
+            pos += 1
+            expect = 'first'
+            continue
+        if char == ']' and expect in ('first', ','):
+            return
+        if expect == ',':
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            pos += 1
+            expect = 'value'
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # A value not yet followed by a delimiter (e.g. a number) may be cut short
+            complete = eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]')
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            more = f.read(chunk_size)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+
+        yield item
+        pos = end
+        expect = ','
+        # Drop the consumed part of the buffer
+        if pos >= chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def read_records(file_path):
+    """
+    Yield records from a file written in any of the OUTPUT_WRITERS formats.
+
+    The format is detected from the content: a JSON array (parsed
+    incrementally), a compact header line, or plain JSON Lines. An empty
+    file, as written for a markdown file without prose, has no records.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+        if first_line.lstrip().startswith('['):
+            f.seek(0)
+            yield from _iter_json_array(f)
+            return
+        if not first_line.strip():
+            return
+
+        header = json.loads(first_line)
+        if not (isinstance(header, dict) and header.get('format') == COMPACT_FORMAT):
+            # Plain JSON Lines: the first line was already a record
+            yield header
+            yield from _iter_json_lines(f)
+            return
+        if header.get('version') != COMPACT_VERSION:
+            raise ValueError(
+                f"Unsupported {COMPACT_FORMAT} version {header.get('version')!r} in {file_path} "
+                f"(expected {COMPACT_VERSION})"
+            )
+
+        fields = header['fields']
+        indexed = [i for i, field in enumerate(fields) if field in header['indexed']]
+        values = []
+        for item in _iter_json_lines(f):
+            if not isinstance(item, list):
+                values.append(item)
+                continue
+            for i in indexed:
+                if item[i] is not None:
+                    item[i] = values[item[i]]
+            yield dict(zip(fields, item))
+
+
+def file_sha256(file_path):
+    """Return the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunker_config_hash(**config):
+    """
+    Hash the chunker version and settings that affect its output, so that
+    changing any of them invalidates previously chunked files.
+    """
+    config = dict(config, version=CHUNKER_VERSION, abbreviations=sorted(ABBREVIATIONS))
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ChunkManifest:
+    """
+    Record of chunked source files kept in the output tree.
+
+    Each source file is stored with its size, mtime and SHA-256 and the path
+    of its output. A file is current when its size and mtime are unchanged
+    (or, if only the mtime moved, its content hash is) and its output still
+    exists, and the manifest was written with the same chunker config hash.
+    """
+
+    def __init__(self, path, config_hash):
+        self.path = os.fspath(path)
+        self.config_hash = config_hash
+        self.files = {}
+        self._fingerprints = {}
+        self._config_changed = False
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+            self._config_changed = data.get('config_hash') != config_hash
+
+    def _output_path(self, entry):
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), entry['output'])
+
+    def fingerprint(self, source_path):
+        """Return (size, mtime_ns, sha256) for a source file, hashing it at most once per run."""
+        key = os.path.abspath(source_path)
+        if key not in self._fingerprints:
+            stat = os.stat(source_path)
+            self._fingerprints[key] = (stat.st_size, stat.st_mtime_ns, file_sha256(source_path))
+        return self._fingerprints[key]
+
+    def is_current(self, source_path, output_path):
+        """Check whether output_path is up to date with source_path."""
+        entry = self.files.get(os.path.abspath(source_path))
+        if self._config_changed or entry is None or not os.path.exists(output_path):
+            return False
+        if os.path.abspath(self._output_path(entry)) != os.path.abspath(output_path):
+            return False
+
+        stat = os.stat(source_path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+
+        # Touched but possibly unchanged: fall back to the content hash
+        size, mtime_ns, sha256 = self.fingerprint(source_path)
+        if sha256 != entry['sha256']:
+            return False
+        entry['mtime_ns'] = mtime_ns
+        return True
+
+    def record(self, source_path, output_path):
+        """Record that output_path was written from the current contents of source_path."""
+        size, mtime_ns, sha256 = self.fingerprint(source_path)
+        manifest_directory = os.path.dirname(os.path.abspath(self.path))
+
+        # Drop the previous output if it was written elsewhere (e.g. another format)
+        previous = self.files.get(os.path.abspath(source_path))
+        if previous is not None:
+            previous_path = self._output_path(previous)
+            if os.path.abspath(previous_path) != os.path.abspath(output_path) and os.path.exists(previous_path):
+                os.remove(previous_path)
+
+        self.files[os.path.abspath(source_path)] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': sha256,
+            'output': os.path.relpath(os.path.abspath(output_path), manifest_directory)
+        }
+
+    def remove_deleted_sources(self):
+        """Delete outputs whose source file no longer exists and return their paths."""
+        removed = []
+        for source_path, entry in list(self.files.items()):
+            if os.path.exists(source_path):
+                continue
+            output_path = self._output_path(entry)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                removed.append(output_path)
+            del self.files[source_path]
+        return removed
+
+    def save(self):
+        """Write the manifest atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'config_hash': self.config_hash, 'files': self.files}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self._config_changed = False
+
+
+def plan_file_segments(file_path, split_bytes=DEFAULT_SPLIT_BYTES):
+    """
+    Split a markdown file into byte ranges that can be chunked independently.
+
+    Files up to split_bytes are a single segment. Larger files are cut at a
+    heading line (outside code fences and front matter) once the current
+    segment reaches split_bytes, and each segment carries the (H1, H2, H3)
+    context in effect where it starts, so chunking the segments in order
+    gives the same records as chunking the whole file.
+
+    Returns a list of (start, end, headings) tuples; end is None for the
+    last segment.
+    """
+    segment_start = 0
+    segment_headings = (None, None, None)
+    if not split_bytes or os.path.getsize(file_path) <= split_bytes:
+        return [(segment_start, None, segment_headings)]
+
+    segments = []
+    headings = segment_headings
+    offset = 0
+    # Open code fence, and whether the file's front matter is still open,
+    # tracked as iter_markdown_blocks does
+    fence = None
+    front_matter = False
+
+    with open(file_path, 'rb') as f:
+        for raw_line in f:
+            if offset == 0 or front_matter or fence is not None or any(
+                    marker in raw_line for marker in (b'#', b'`', b'~')):
+                # Decode with universal newlines, as the text-mode reader does
+                text_lines = io.StringIO(raw_line.decode('utf-8'), newline=None)
+                for index, line in enumerate(text_lines):
+                    line = line.strip()
+                    if offset == 0 and index == 0 and line == '---':
+                        front_matter = True
+                    elif front_matter:
+                        front_matter = line not in ('---', '...')
+                    elif fence is not None:
+                        if _closes_fence(line, fence):
+                            fence = None
+                    elif (opening := _opening_fence(line)) is not None:
+                        fence = opening
+                    elif line.startswith('#'):
+                        # Segments can only start where a raw line starts
+                        if index == 0 and offset - segment_start >= split_bytes:
+                            segments.append((segment_start, offset, segment_headings))
+                            segment_start = offset
+                            segment_headings = headings
+                        headings, _ = _update_headings(line, headings)
+            offset += len(raw_line)
+
+    segments.append((segment_start, None, segment_headings))
+    return segments
+
+
+def _chunk_segment(task):
+    """Process pool worker: chunk one (file, byte range) segment into a list of unnumbered records."""
+    file_path, filename, start, end, headings, strategy, keep_blocks = task
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    lines = io.StringIO(data.decode('utf-8'), newline=None)
+    return list(_iter_line_records(lines, filename, headings, strategy, keep_blocks, front_matter=start == 0))
+
+
+def find_markdown_files(inputs):
+    """
+    Resolve markdown files, directories and glob patterns to markdown files.
+
+    Yields (path, relative_path) pairs. Files under a directory input keep
+    their path relative to that directory; files given directly or matched
+    by a glob are relative to their own directory.
+    """
+    for input_path in inputs:
+        input_path = os.fspath(input_path)
+        matches = glob.glob(input_path, recursive=True) if glob.has_magic(input_path) else [input_path]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    for filename in files:
+                        if filename.endswith(".md"):
+                            md_file_path = os.path.join(root, filename)
+                            yield md_file_path, os.path.relpath(md_file_path, match)
+            elif match.endswith(".md"):
+                yield match, os.path.basename(match)
+
+
+def _output_path(md_file_path, relative_path, output_directory, output_format='json'):
+    """Return the output path for a markdown file, next to it or mirrored under output_directory."""
+    extension = OUTPUT_EXTENSIONS[output_format]
+    if output_directory is None:
+        return os.path.splitext(md_file_path)[0] + extension
+    output_path = os.path.join(output_directory, os.path.splitext(relative_path)[0] + extension)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return output_path
+
+
+def chunk_files(md_files, output_directory=None, strategy='sentence', workers=None, chunksize=1,
+                split_bytes=DEFAULT_SPLIT_BYTES, manifest_path=None, output_format='json', keep_blocks=()):
+    """
+    Chunk (path, relative_path) markdown files into record files.
+
+    Each record's source_file is the file's relative path (with '/'
+    separators), which tells apart same-named files in different
+    directories.
+
+    Code and table blocks are skipped unless their kind is in keep_blocks,
+    in which case each becomes one record.
+
+    Output is written in output_format (see OUTPUT_WRITERS) next to each
+    source file, or under output_directory at the file's relative path. With workers=1 files are processed one after
+    another in this process. Otherwise file segments (see plan_file_segments)
+    are spread over a ProcessPoolExecutor with the given number of workers
+    (None means one per CPU) and chunksize, and reassembled in order, so the
+    output is the same as the serial path.
+
+    With a manifest_path, only files that are new or changed since the last
+    run (see ChunkManifest) are chunked, and outputs whose source has been
+    deleted are removed.
+
+    Returns the number of files processed.
+    """
+    md_files = list(md_files)
+    source_files = {md_file_path: relative_path.replace(os.sep, '/') for md_file_path, relative_path in md_files}
+    jobs = [
+        (md_file_path, _output_path(md_file_path, relative_path, output_directory, output_format))
+        for md_file_path, relative_path in md_files
+    ]
+
+    manifest = None
+    if manifest_path is not None:
+        manifest = ChunkManifest(manifest_path, chunker_config_hash(strategy=strategy, output_format=output_format,
+                                                                    keep_blocks=sorted(keep_blocks)))
+        for output_path in manifest.remove_deleted_sources():
+            print(f"Removed {output_path} (source deleted)")
+        changed_jobs = [job for job in jobs if not manifest.is_current(*job)]
+        for md_file_path, _ in changed_jobs:
+            # Fingerprint before chunking so edits made meanwhile are seen next run
+            manifest.fingerprint(md_file_path)
+        if len(changed_jobs) < len(jobs):
+            print(f"Skipped {len(jobs) - len(changed_jobs)} unchanged files")
+        jobs = changed_jobs
+
+    try:
+        chunked = _chunk_jobs(jobs, source_files, strategy, workers, chunksize, split_bytes,
+                              OUTPUT_WRITERS[output_format], keep_blocks)
+        for md_file_path, output_path in chunked:
+            print(f"Processed {md_file_path} -> {output_path}")
+            if manifest is not None:
+                manifest.record(md_file_path, output_path)
+    finally:
+        if manifest is not None:
+            manifest.save()
+
+    return len(jobs)
+
+
+def _chunk_jobs(jobs, source_files, strategy, workers, chunksize, split_bytes, write_records, keep_blocks=()):
+    """
+    Chunk (markdown path, output path) jobs, yielding each job once its
+    output is written. source_files maps markdown paths to the source_file
+    of their records.
+    """
+    if workers == 1 or not jobs:
+        for md_file_path, output_path in jobs:
+            records = iter_chunk_markdown_file(md_file_path, source_files[md_file_path], strategy, keep_blocks)
+            write_records(records, output_path)
+            yield md_file_path, output_path
+        return
+
+    # Imported here so that importing the chunking functions stays cheap
+    from concurrent.futures import ProcessPoolExecutor
+
+    tasks = []
+    for md_file_path, _ in jobs:
+        filename = source_files[md_file_path]
+        for start, end, headings in plan_file_segments(md_file_path, split_bytes):
+            tasks.append((md_file_path, filename, start, end, headings, strategy, tuple(keep_blocks)))
+    output_paths = dict(jobs)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = zip(tasks, executor.map(_chunk_segment, tasks, chunksize=chunksize))
+        # Results come back in task order, so each file's segments are adjacent
+        for md_file_path, file_results in itertools.groupby(results, key=lambda result: result[0][0]):
+            output_path = output_paths[md_file_path]
+
+            records = itertools.chain.from_iterable(records for _, records in file_results)
+            write_records(number_records(records), output_path)
+            yield md_file_path, output_path
+
+
+def chunk_directory(input_directory, output_directory=None, **kwargs):
+    """Chunk every markdown file under input_directory; see chunk_files for options."""
+    return chunk_files(find_markdown_files([input_directory]), output_directory, **kwargs)
+
+
+def select_directory_gui():
+    """Ask for an input directory with a Tk file dialog."""
+    # Tk is only needed for the dialog, so it is not imported with the module
+    import tkinter as tk
+    from tkinter import filedialog
 
-def main():
     root = tk.Tk()
     root.withdraw()
+    try:
+        return filedialog.askdirectory(title="Select Input Directory")
+    finally:
+        root.destroy()
+
+
+def main(argv=None):
+    """Parse command line arguments and chunk the selected markdown files."""
+    # Only the command line needs argparse; keep library imports cheap
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Chunk markdown files into JSON records with heading context'
+    )
+
+    parser.add_argument(
+        'inputs',
+        nargs='*',
+        help='Markdown files, directories or glob patterns to chunk'
+    )
 
-    input_directory = filedialog.askdirectory(title="Select Input Directory")
+    parser.add_argument(
+        '--output-dir', '-o',
+        type=str,
+        help='Directory for the JSON output (default: next to each markdown file)'
+    )
 
-    if not input_directory:
-        print("No directory selected. Exiting.")
+    parser.add_argument(
+        '--strategy', '-s',
+        choices=STRATEGIES,
+        default='sentence',
+        help='Chunking strategy; hierarchical writes linked section, chunk and sentence records '
+             '(default: sentence)'
+    )
+
+    parser.add_argument(
+        '--keep-blocks',
+        action='append',
+        choices=KEEPABLE_BLOCKS,
+        default=[],
+        help='Keep code fences or tables whole as one record each instead of skipping them (may be repeated)'
+    )
+
+    parser.add_argument(
+        '--format', '-f',
+        dest='output_format',
+        choices=sorted(OUTPUT_WRITERS),
+        default='json',
+        help='Output format: indented JSON array, JSON Lines, or compact '
+             'dictionary-encoded JSON Lines (default: json)'
+    )
+
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        help='Number of worker processes, 1 to run serially (default: one per CPU)'
+    )
+
+    parser.add_argument(
+        '--chunksize',
+        type=int,
+        default=1,
+        help='Segments handed to a worker at a time (default: 1)'
+    )
+
+    parser.add_argument(
+        '--split-bytes',
+        type=int,
+        default=DEFAULT_SPLIT_BYTES,
+        help=f'Split files larger than this at headings, 0 to disable (default: {DEFAULT_SPLIT_BYTES})'
+    )
+
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help=f'Only chunk new or changed files, tracked in {MANIFEST_FILENAME} in the output directory'
+    )
+
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        help='Manifest path for incremental runs (implies --incremental)'
+    )
+
+    parser.add_argument(
+        '--gui',
+        action='store_true',
+        help='Select the input directory with a file dialog'
+    )
+
+    args = parser.parse_args(argv)
+
+    inputs = list(args.inputs)
+    if args.gui:
+        input_directory = select_directory_gui()
+        if not input_directory:
+            print("No directory selected. Exiting.")
+            return
+        inputs.append(input_directory)
+
+    if not inputs:
+        parser.error("at least one input path is required (or use --gui)")
+
+    manifest_path = args.manifest
+    if args.incremental and manifest_path is None:
+        if args.output_dir is None:
+            parser.error("--incremental needs --output-dir or --manifest")
+        manifest_path = os.path.join(args.output_dir, MANIFEST_FILENAME)
+
+    md_files = list(find_markdown_files(inputs))
+    if not md_files and manifest_path is None:
+        print("No markdown files found.")
         return
 
-    for root, _, files in os.walk(input_directory):
-        for filename in files:
-            if filename.endswith(".md"):
-                md_file_path = os.path.join(root, filename)
-                json_output = chunk_markdown_file(md_file_path, filename)
-                
-                json_file_path = os.path.join(root, os.path.splitext(filename)[0] + ".json")
-                
-                with open(json_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(json_output, f, indent=4, ensure_ascii=False)
-                
-                print(f"Processed {md_file_path} -> {json_file_path}")
+    chunk_files(
+        md_files,
+        output_directory=args.output_dir,
+        strategy=args.strategy,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        split_bytes=args.split_bytes,
+        manifest_path=manifest_path,
+        output_format=args.output_format,
+        keep_blocks=tuple(args.keep_blocks)
+    )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
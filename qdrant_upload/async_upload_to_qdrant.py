@@ -0,0 +1,347 @@
+"""
+Asyncio uploader for chunked JSON files.
+
+AsyncQdrantUploader takes the same configuration as QdrantUploader but runs
+embedding requests and upserts concurrently on one event loop, using
+AsyncQdrantClient and (for the OpenAI backend) AsyncOpenAI over pooled HTTP
+connections. Local embedding backends run in a worker thread. It is meant
+to be embedded in async services:
+
+    async with AsyncQdrantUploader(config) as uploader:
+        await uploader.create_collection(vector_size=1536)
+        await uploader.upload_stream(records)
+"""
+
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+from embedding_backends import create_embedding_backend
+from text_dedup import TextDeduplicator
+from upload_to_qdrant import (
+    collection_names,
+    collection_params,
+    describe_qdrant_connection,
+    level_collection,
+    link_entry,
+    link_hierarchy,
+    log_cache_stats,
+    log_rate_controller_stats,
+    logger,
+    lookup_embeddings,
+    make_points,
+    make_token_batcher,
+    models,
+    open_embedding_cache,
+    payload_index_fields,
+    point_id,
+    qdrant_connection_kwargs,
+    resolve_duplicates,
+    store_embeddings,
+)
+from token_batcher import TokenBatcher
+
+try:
+    from qdrant_client import AsyncQdrantClient
+except ImportError as e:
+    raise ImportError(f"{e}. AsyncQdrantUploader needs qdrant-client>=1.6") from e
+
+Records = Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]]
+
+
+async def aiter_batches(records: Records, batcher: TokenBatcher) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield the batches batcher packs from a sync or async iterable of entries."""
+    if not hasattr(records, '__aiter__'):
+        for batch in batcher.batches(records):
+            yield batch
+        return
+
+    async for entry in records:
+        for batch in batcher.push(entry):
+            yield batch
+    batch = batcher.flush()
+    if batch:
+        yield batch
+
+
+def link_records(records: Records) -> Records:
+    """Records linked to their sections and chunks (see link_hierarchy), as a sync or async iterable like records."""
+    if not hasattr(records, '__aiter__'):
+        return link_hierarchy(records)
+
+    async def linked_records():
+        state = {}
+        async for entry in records:
+            yield link_entry(entry, state)
+    return linked_records()
+
+
+def dedup_records(records: Records, deduplicator: TextDeduplicator) -> Records:
+    """The records deduplicator passes on to be embedded, as a sync or async iterable like records."""
+    if not hasattr(records, '__aiter__'):
+        return deduplicator.filter(records)
+
+    async def unique_records():
+        async for entry in records:
+            if deduplicator.push(entry):
+                yield entry
+    return unique_records()
+
+
+class AsyncQdrantUploader:
+    """Uploads chunk entries to Qdrant from an asyncio event loop."""
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize the uploader with the same configuration as QdrantUploader."""
+        self.config = config
+        self.collection_name = config.get('collection_name', 'default_collection')
+        # Sentence collection first, then the chunk and section ones if hierarchical
+        self.collection_names = collection_names(config)
+        self.embedding_concurrency = config.get('embedding_concurrency', 4)
+        self.upsert_concurrency = config.get('upsert_concurrency', 1)
+        self.max_pending_batches = config.get('max_pending_batches', 2)
+
+        try:
+            kwargs = qdrant_connection_kwargs(config)
+            if 'location' not in kwargs:
+                # Keep one pooled connection per concurrent upsert
+                kwargs['pool_size'] = self.upsert_concurrency
+            self.client = AsyncQdrantClient(**kwargs)
+            logger.info(f"Connected to Qdrant at {describe_qdrant_connection(config)}")
+        except Exception as e:
+            logger.error(f"Failed to connect to Qdrant: {e}")
+            raise
+
+        try:
+            # An OpenAI backend gets an AsyncOpenAI client with one pooled connection per request slot
+            self.embedding_backend = create_embedding_backend(config, asynchronous=True)
+            self.embedding_model_name = self.embedding_backend.model_name
+            self.rate_controller = self.embedding_backend.rate_controller
+            logger.info(f"Initialized embedding backend with model: {self.embedding_model_name}")
+        except Exception as e:
+            logger.error(f"Failed to initialize embedding backend: {e}")
+            raise
+
+        # Optional persistent cache of embeddings from earlier runs
+        self.embedding_cache = open_embedding_cache(config)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the pooled connections of the embedding backend and Qdrant client."""
+        await self.embedding_backend.aclose()
+        await self.client.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+
+    async def create_collection(self, vector_size: int = 1536, recreate: bool = False):
+        """Create or recreate the collection (and its hierarchical siblings) in Qdrant."""
+        try:
+            for collection_name in self.collection_names:
+                if recreate:
+                    # Delete existing collection if it exists
+                    try:
+                        await self.client.delete_collection(collection_name)
+                        logger.info(f"Deleted existing collection: {collection_name}")
+                    except Exception:
+                        pass  # Collection might not exist
+                elif await self.client.collection_exists(collection_name):
+                    # Keep existing points so re-uploads can update them in place
+                    logger.info(f"Using existing collection: {collection_name}")
+                    continue
+
+                await self.client.create_collection(
+                    collection_name=collection_name,
+                    **collection_params(self.config, vector_size)
+                )
+                logger.info(f"Created collection: {collection_name}")
+                for field, schema in payload_index_fields(self.config):
+                    await self.client.create_payload_index(
+                        collection_name=collection_name,
+                        field_name=field,
+                        field_schema=schema
+                    )
+
+        except Exception as e:
+            logger.error(f"Failed to create collection: {e}")
+            raise
+
+    async def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Generate embeddings for a list of texts with the embedding backend,
+        aligned with texts (None for texts that can't be embedded). Only texts
+        missing from the embedding cache (if one is configured) are sent to
+        the backend.
+        """
+        try:
+            cleaned, embeddings, missing = lookup_embeddings(texts, self.embedding_cache, self.embedding_model_name)
+            if not missing:
+                return embeddings
+
+            vectors = await self.embedding_backend.embed_async([cleaned[i] for i in missing])
+            return store_embeddings(embeddings, missing, cleaned, vectors,
+                                    self.embedding_cache, self.embedding_model_name)
+
+        except Exception as e:
+            logger.error(f"Failed to generate embeddings: {e}")
+            raise
+
+    async def _upload_batch(self, batch_number: int, batch: List[Dict[str, Any]],
+                            embedding_slots: asyncio.Semaphore, upsert_slots: asyncio.Semaphore) -> int:
+        """Embed and upsert one batch, holding a request slot for each call."""
+        async with embedding_slots:
+            embeddings = await self.generate_embeddings([entry['text'] for entry in batch])
+        points = make_points(batch, embeddings)
+        if not points:
+            logger.warning(f"Batch {batch_number}: No valid embeddings generated")
+            return 0
+
+        async with upsert_slots:
+            await self._upsert_points(points)
+        logger.info(f"Uploaded batch {batch_number}: {len(points)} points")
+        return len(points)
+
+    async def _upsert_points(self, points: List[models.PointStruct]):
+        """Upsert points, each to the collection of its level."""
+        by_collection = {}
+        for point in points:
+            collection_name = level_collection(self.config, point.payload.get('level'))
+            if collection_name not in self.collection_names:
+                raise ValueError(
+                    f"Got {point.payload.get('level')} records; set hierarchical to upload hierarchical chunk files"
+                )
+            by_collection.setdefault(collection_name, []).append(point)
+        for collection_name, collection_points in by_collection.items():
+            await self.client.upsert(collection_name=collection_name, points=collection_points)
+
+    async def _upload_duplicates(self, dedup: TextDeduplicator, batch_number: int, batch_size: int) -> int:
+        """Write the duplicates dedup held back, as QdrantUploader._upload_duplicates does."""
+        embedding_slots = asyncio.Semaphore(self.embedding_concurrency)
+        upsert_slots = asyncio.Semaphore(self.upsert_concurrency)
+        uploaded_count = 0
+        unresolved = []
+        for group in dedup.groups(batch_size):
+            found = {}
+            for collection_name in self.collection_names:
+                records = await self.client.retrieve(
+                    collection_name=collection_name,
+                    ids=list(group),
+                    with_payload=False,
+                    with_vectors=dedup.mode == 'fanout'
+                )
+                found.update((str(r.id), r.vector) for r in records)
+            points, payloads, missing = resolve_duplicates(group, found, dedup.mode)
+            if points:
+                batch_number += 1
+                await self._upsert_points(points)
+                logger.info(f"Uploaded batch {batch_number}: {len(points)} points")
+                uploaded_count += len(points)
+            if payloads:
+                await self.client.batch_update_points(
+                    collection_name=self.collection_name,
+                    update_operations=[
+                        models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[first_id]))
+                        for first_id, payload in payloads.items()
+                    ]
+                )
+                logger.info(f"Merged duplicates into {len(payloads)} points")
+            unresolved.extend(missing)
+
+        batcher = make_token_batcher(self.config, batch_size, self.embedding_model_name)
+        for batch in batcher.batches(unresolved):
+            batch_number += 1
+            uploaded_count += await self._upload_batch(batch_number, batch, embedding_slots, upsert_slots)
+        return uploaded_count
+
+    async def upload_stream(self, records: Records, batch_size: int = None) -> int:
+        """
+        Upload entries from a sync or async iterable, returning the number of
+        points written.
+
+        Batches hold up to batch_size entries and batch_max_tokens tokens of
+        text, as in QdrantUploader.upload_to_qdrant. At most
+        embedding_concurrency embedding requests and upsert_concurrency
+        upserts are in flight at once. Reading records pauses while the
+        embedding and upsert slots plus max_pending_batches batches are taken,
+        so memory stays bounded by a few batches. The first failing batch
+        cancels the rest and its exception is raised.
+
+        Entries repeating an earlier text are handled as the dedup setting
+        says (see text_dedup), after all other batches. Hierarchical entries
+        are linked and routed to the collection of their level, as in
+        QdrantUploader.upload_to_qdrant.
+        """
+        if batch_size is None:
+            batch_size = self.config.get('batch_size', 100)
+
+        # Created here so they belong to the running event loop
+        embedding_slots = asyncio.Semaphore(self.embedding_concurrency)
+        upsert_slots = asyncio.Semaphore(self.upsert_concurrency)
+        batch_slots = asyncio.Semaphore(
+            self.embedding_concurrency + self.upsert_concurrency + self.max_pending_batches
+        )
+
+        async def upload_batch(batch_number, batch):
+            try:
+                return await self._upload_batch(batch_number, batch, embedding_slots, upsert_slots)
+            finally:
+                batch_slots.release()
+
+        dedup = self.config.get('dedup', 'fanout')
+        if dedup == 'merge' and self.config.get('hierarchical'):
+            logger.warning("Using dedup 'fanout': merged duplicates would leave hierarchy links dangling")
+            dedup = 'fanout'
+        deduplicator = TextDeduplicator(dedup, entry_id=point_id)
+        batcher = make_token_batcher(self.config, batch_size, self.embedding_model_name)
+        uploaded_count = 0
+        batch_number = 0
+        tasks = set()
+        try:
+            async for batch in aiter_batches(dedup_records(link_records(records), deduplicator), batcher):
+                batch_number += 1
+                await batch_slots.acquire()
+                # Collect finished batches, raising the first failure
+                for task in [task for task in tasks if task.done()]:
+                    tasks.discard(task)
+                    uploaded_count += task.result()
+                tasks.add(asyncio.ensure_future(upload_batch(batch_number, batch)))
+                # Let the new batch start its request before reading on
+                await asyncio.sleep(0)
+
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    uploaded_count += task.result()
+
+            uploaded_count += await self._upload_duplicates(deduplicator, batch_number, batch_size)
+
+            logger.info(f"Successfully uploaded {uploaded_count} points to collection '{self.collection_name}'")
+            batcher.log_summary()
+            deduplicator.log_summary()
+            log_rate_controller_stats(self.rate_controller)
+            log_cache_stats(self.embedding_cache)
+            return uploaded_count
+
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if isinstance(e, Exception):
+                logger.error(f"Failed to upload to Qdrant: {e}")
+            raise
+
+    async def get_collection_info(self) -> Dict[str, Any]:
+        """Get information about the collection."""
+        try:
+            info = await self.client.get_collection(self.collection_name)
+            return {
+                'name': self.collection_name,
+                'points_count': info.points_count,
+                'status': info.status
+            }
+        except Exception as e:
+            logger.error(f"Failed to get collection info: {e}")
+            return {}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Memory and recall of collection settings.
+
+Uploads the same vectors into one collection per setting (quantization,
+on-disk vectors, HNSW parameters), waits for indexing, then compares
+approximate search against exact nearest neighbours computed with numpy.
+Reports the estimated RAM and disk per setting (see
+estimate_collection_memory) scaled to --scale-points, recall@k with and
+without rescoring, and the mean query latency.
+
+The vectors are synthetic (clustered Gaussian, like sentence embeddings of
+a few topics) unless --json-file is given, in which case its texts are
+embedded with the configured backend. Run it against a real Qdrant server:
+the in-process :memory: mode ignores quantization and HNSW and always
+searches exactly.
+
+Usage:
+    python bench_collection_settings.py --config qdrant_config.yaml --points 20000
+    python bench_collection_settings.py --host localhost --dimensions 1536 --scale-points 30000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from embedding_backends import create_embedding_backend
+from upload_to_qdrant import (
+    QdrantClient,
+    collection_params,
+    embeddable_text,
+    estimate_collection_memory,
+    iter_json_records,
+    load_config,
+    models,
+    qdrant_connection_kwargs,
+)
+
+# Settings compared, as overrides of the collection settings of the config
+SETTINGS = {
+    'float32': {},
+    'scalar': {'quantization': 'scalar'},
+    'binary': {'quantization': 'binary'},
+    'product-x16': {'quantization': 'product', 'product_compression': 'x16'},
+    'scalar+on-disk': {'quantization': 'scalar', 'vectors_on_disk': True},
+    'float32 m=32': {'hnsw_m': 32, 'hnsw_ef_construct': 200},
+}
+
+
+def synthetic_vectors(count: int, dimensions: int, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random cluster centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimensions))
+    vectors = centres[rng.integers(clusters, size=count)] + 0.6 * rng.normal(size=(count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def embedded_vectors(config, json_file: str, limit: int) -> np.ndarray:
+    """Unit vectors of the first limit texts of a chunk file."""
+    texts = [text for text in (embeddable_text(r.get('text')) for r in iter_json_records(json_file)) if text]
+    texts = texts[:limit]
+    backend = create_embedding_backend(config)
+    try:
+        vectors = np.array([v for i in range(0, len(texts), 100) for v in backend.embed(texts[i:i + 100])],
+                           dtype=np.float32)
+    finally:
+        backend.close()
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def wait_for_index(client, collection_name: str, timeout: float = 600):
+    """Wait until the optimizers have indexed the collection."""
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Collection {collection_name} wasn't indexed within {timeout}s")
+        time.sleep(0.5)
+
+
+def recall(found, expected) -> float:
+    """Mean fraction of the exact neighbours found, over all queries."""
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]))
+
+
+def bench_setting(client, name, config, vectors, queries, expected, args):
+    """Upload vectors with the setting's collection config and measure recall and latency."""
+    collection_name = f"bench_{name.replace(' ', '_').replace('=', '').replace('+', '_')}"
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        # Index small benchmark collections too
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+        **collection_params(config, vectors.shape[1])
+    )
+    try:
+        for start in range(0, len(vectors), 1000):
+            client.upsert(collection_name=collection_name, points=models.Batch(
+                ids=list(range(start, min(start + 1000, len(vectors)))),
+                vectors=vectors[start:start + 1000].tolist()
+            ))
+        wait_for_index(client, collection_name)
+
+        results = {}
+        for rescore in ((False, True) if config.get('quantization', 'none') != 'none' else (True,)):
+            search_params = models.SearchParams(
+                hnsw_ef=args.hnsw_ef,
+                quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=args.oversampling)
+            )
+            found = []
+            start = time.perf_counter()
+            for query in queries:
+                response = client.query_points(collection_name=collection_name, query=query.tolist(),
+                                               limit=args.k, search_params=search_params)
+                found.append([point.id for point in response.points])
+            latency = (time.perf_counter() - start) / len(queries)
+            results['rescored' if rescore else 'quantized only'] = (recall(found, expected), latency)
+        return results
+    finally:
+        if not args.keep:
+            client.delete_collection(collection_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory and recall of Qdrant collection settings')
+    parser.add_argument('--config', help='Uploader config (connection, embedding backend, base collection settings)')
+    parser.add_argument('--host', help='Qdrant host (overrides config; default localhost)')
+    parser.add_argument('--json-file', help='Embed the texts of this chunk file instead of synthetic vectors')
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--hnsw-ef', type=int, default=128)
+    parser.add_argument('--oversampling', type=float, default=2.0)
+    parser.add_argument('--scale-points', type=int, default=10_000_000,
+                        help='Collection size the memory estimates are given for')
+    parser.add_argument('--setting', action='append', choices=list(SETTINGS),
+                        help='Setting to run (may be repeated; default: all)')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark collections')
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else {'qdrant_host': 'localhost'}
+    if args.host:
+        config['qdrant_host'] = args.host
+    client = QdrantClient(**qdrant_connection_kwargs(config))
+
+    if args.json_file:
+        vectors = embedded_vectors(config, args.json_file, args.points + args.queries)
+    else:
+        vectors = synthetic_vectors(args.points + args.queries, args.dimensions)
+    vectors, queries = vectors[:-args.queries], vectors[-args.queries:]
+    # Exact neighbours: vectors are unit length, so cosine similarity is the dot product
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+
+    print(f"{len(vectors)} points of {vectors.shape[1]} dimensions, {len(queries)} queries, recall@{args.k}; "
+          f"memory estimated for {args.scale_points:,} points")
+    print(f"{'setting':<16} {'RAM':>9} {'disk':>9}  {'search':<15} {'recall':>7} {'latency':>9}")
+    for name in args.setting or SETTINGS:
+        setting = dict(config, **SETTINGS[name])
+        memory = estimate_collection_memory(setting, vectors.shape[1], args.scale_points)
+        results = bench_setting(client, name, setting, vectors, queries, expected, args)
+        for search, (setting_recall, latency) in results.items():
+            print(f"{name:<16} {memory['ram'] / 2**30:8.1f}G {memory['disk'] / 2**30:8.1f}G  "
+                  f"{search:<15} {setting_recall:7.3f} {latency * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Side-by-side throughput of the embedding backends.
+
+Embeds the texts of a chunk file with each requested backend, in batches of
+the uploader's batch_size, and reports texts per second. The OpenAI backend
+talks to the real API unless --fake-latency is given, in which case an
+in-process fake_embedding_server with that per-request latency stands in.
+The local backend needs sentence-transformers.
+
+Usage:
+    python bench_embedding_backends.py --json-file ../tests/CBT/Self_Administered_CBT.json --fake-latency 0.3
+    python bench_embedding_backends.py --backend local --local-threads 4 --limit 500
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+from embedding_backends import EMBEDDING_BACKENDS, create_embedding_backend
+from fake_embedding_server import FakeEmbeddingServer
+from upload_to_qdrant import embeddable_text, iter_json_records
+
+
+def bench_backend(config, texts, batch_size):
+    """Seconds to embed texts in batches of batch_size with the backend named in config."""
+    backend = create_embedding_backend(config)
+    try:
+        # Load the model / open the connection before timing
+        backend.embed(texts[:1])
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            backend.embed(texts[i:i + batch_size])
+        return time.perf_counter() - start
+    finally:
+        backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the throughput of the embedding backends')
+    parser.add_argument('--json-file', default=os.path.join('..', 'tests', 'CBT', 'Self_Administered_CBT.json'))
+    parser.add_argument('--backend', action='append', choices=EMBEDDING_BACKENDS,
+                        help='Backend to run (may be repeated; default: all)')
+    parser.add_argument('--limit', type=int, help='Only embed the first N texts')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--embedding-model', default='text-embedding-3-small')
+    parser.add_argument('--local-model', default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--local-batch-size', type=int, default=32)
+    parser.add_argument('--local-threads', type=int)
+    parser.add_argument('--fake-latency', type=float,
+                        help='Use a local fake OpenAI endpoint with this latency (seconds) per request')
+    args = parser.parse_args()
+
+    texts = [embeddable_text(record.get('text')) for record in iter_json_records(args.json_file)]
+    texts = list(itertools.islice((text for text in texts if text), args.limit))
+    config = {
+        'embedding_model': args.embedding_model,
+        'local_model': args.local_model,
+        'local_batch_size': args.local_batch_size,
+        'local_threads': args.local_threads,
+    }
+
+    fake_server = None
+    if args.fake_latency is not None:
+        fake_server = FakeEmbeddingServer(latency=args.fake_latency).start()
+        os.environ['OPENAI_BASE_URL'] = fake_server.base_url
+        os.environ.setdefault('OPENAI_API_KEY', 'fake')
+
+    print(f"{len(texts)} texts from {args.json_file}, batch size {args.batch_size}")
+    try:
+        for name in args.backend or EMBEDDING_BACKENDS:
+            try:
+                seconds = bench_backend(dict(config, embedding_backend=name), texts, args.batch_size)
+            except ImportError as e:
+                print(f"{name:>8}: skipped ({e})")
+                continue
+            print(f"{name:>8}: {seconds:7.2f}s  {len(texts) / seconds:8.1f} texts/s")
+    finally:
+        if fake_server is not None:
+            fake_server.stop()
+
+
+if __name__ == "__main__":
+    main()
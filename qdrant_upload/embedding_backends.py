@@ -0,0 +1,213 @@
+"""
+Embedding backends for the uploaders.
+
+A backend turns a list of non-empty texts into one vector per text, in
+order. Two are provided, selected with embedding_backend in the config:
+
+- openai: the OpenAI embeddings API (embedding_model), paced and retried by
+  a RateController;
+- local: a sentence-transformers model on the CPU (local_model), with
+  batched, length-sorted inference and a configurable thread count. It
+  needs `pip install sentence-transformers`.
+
+Cache keys, point payloads and the rest of the pipeline don't depend on the
+backend, so the same chunk files can be ingested (and benchmarked) with
+either.
+"""
+
+import abc
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from rate_controller import RateController
+from token_batcher import get_token_counter
+from upload_journal import SPEND_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+class EmbeddingSpend:
+    """Running totals of embedding requests, texts and tokens, safe to update from several threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = dict.fromkeys(SPEND_FIELDS, 0)
+
+    def add(self, text_count: int, tokens: int = 0):
+        """Count one embedding request for text_count texts."""
+        with self._lock:
+            self._totals['requests'] += 1
+            self._totals['texts'] += text_count
+            self._totals['tokens'] += tokens
+
+    def snapshot(self, since: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Copy of the current totals, or of the growth since an earlier snapshot."""
+        with self._lock:
+            if since is None:
+                return dict(self._totals)
+            return {field: total - since[field] for field, total in self._totals.items()}
+
+
+def response_vectors(response) -> List[List[float]]:
+    """Vectors of an OpenAI embeddings response, in input order."""
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class EmbeddingBackend(abc.ABC):
+    """Interface of the embedding backends; subclasses implement embed()."""
+
+    # Identifies the vectors' model, e.g. in the embedding cache
+    model_name: str = ''
+    # Vector size, if the backend knows it before embedding anything
+    dimensions: Optional[int] = None
+    # RateController pacing the requests, for backends that call an API
+    rate_controller: Optional[RateController] = None
+
+    def __init__(self, spend: Optional[EmbeddingSpend] = None):
+        self.spend = spend if spend is not None else EmbeddingSpend()
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Vectors for texts (all non-empty), one per text, in order."""
+
+    async def embed_async(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed(); by default runs it in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed, texts)
+
+    def close(self):
+        """Release clients and models."""
+
+    async def aclose(self):
+        """Async version of close()."""
+        self.close()
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI API; the API key comes from OPENAI_API_KEY."""
+
+    def __init__(self, config: Dict[str, Any], spend: Optional[EmbeddingSpend] = None,
+                 asynchronous: bool = False):
+        """Create a sync client, or an async one with pooled connections if asynchronous is set."""
+        super().__init__(spend)
+        import openai
+
+        self.model_name = config.get('embedding_model', 'text-embedding-3-small')
+        self.rate_controller = RateController.from_config(config)
+        self.count_tokens = get_token_counter(self.model_name)
+        # Retries are left to the rate controller
+        if asynchronous:
+            import httpx
+            concurrency = config.get('embedding_concurrency', 4)
+            self.client = openai.AsyncOpenAI(max_retries=0, http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            ))
+        else:
+            self.client = openai.OpenAI(max_retries=0)
+
+    def _request(self, texts: List[str]):
+        return self.client.embeddings.with_raw_response.create(input=texts, model=self.model_name)
+
+    def _vectors(self, raw_response, texts: List[str]) -> List[List[float]]:
+        response = raw_response.parse()
+        usage = getattr(response, 'usage', None)
+        self.spend.add(len(texts), getattr(usage, 'total_tokens', 0) or 0)
+        return response_vectors(response)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(map(self.count_tokens, texts))
+        raw_response = self.rate_controller.call(lambda: self._request(texts), tokens=tokens)
+        return self._vectors(raw_response, texts)
+
+    async def embed_async(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(map(self.count_tokens, texts))
+        raw_response = await self.rate_controller.call_async(lambda: self._request(texts), tokens=tokens)
+        return self._vectors(raw_response, texts)
+
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        result = self.client.close()
+        if asyncio.iscoroutine(result):
+            await result
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Embeddings from a local sentence-transformers model.
+
+    Each call sorts the texts by length and encodes them in batches of
+    batch_size, so texts of similar length share a batch and little compute
+    goes to padding; the vectors are returned in input order. threads sets
+    torch's intra-op thread count (None keeps its default).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL, batch_size: int = 32,
+                 threads: Optional[int] = None, device: str = 'cpu', normalize: bool = True,
+                 spend: Optional[EmbeddingSpend] = None, model=None):
+        super().__init__(spend)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        if model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    f"{e}. The local embedding backend needs: pip install sentence-transformers"
+                ) from e
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            model = SentenceTransformer(model_name, device=device)
+        self.model = model
+        self.dimensions = model.get_sentence_embedding_dimension()
+        # The model isn't safe to run from several threads at once
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], spend: Optional[EmbeddingSpend] = None) -> 'SentenceTransformerBackend':
+        """Backend for the local_* settings of an uploader config."""
+        return cls(
+            model_name=config.get('local_model', DEFAULT_LOCAL_MODEL),
+            batch_size=config.get('local_batch_size', 32),
+            threads=config.get('local_threads'),
+            device=config.get('local_device', 'cpu'),
+            spend=spend,
+        )
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        with self._lock:
+            for start in range(0, len(order), self.batch_size):
+                indices = order[start:start + self.batch_size]
+                encoded = self.model.encode(
+                    [texts[i] for i in indices],
+                    batch_size=len(indices),
+                    normalize_embeddings=self.normalize,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+                for i, vector in zip(indices, encoded):
+                    vectors[i] = vector.tolist()
+                self.spend.add(len(indices))
+        return vectors
+
+
+EMBEDDING_BACKENDS = ('openai', 'local')
+
+
+def create_embedding_backend(config: Dict[str, Any], spend: Optional[EmbeddingSpend] = None,
+                             asynchronous: bool = False) -> EmbeddingBackend:
+    """Backend named by embedding_backend in the config (default openai)."""
+    name = config.get('embedding_backend', 'openai')
+    if name == 'openai':
+        return OpenAIEmbeddingBackend(config, spend, asynchronous=asynchronous)
+    if name == 'local':
+        return SentenceTransformerBackend.from_config(config, spend)
+    raise ValueError(f"Unknown embedding_backend {name!r}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
@@ -0,0 +1,128 @@
+"""
+Persistent embedding cache.
+
+Embeddings are stored in a SQLite database keyed by (embedding model,
+sha256 of the text), so re-ingesting mostly unchanged documents only sends
+new or edited texts to the embeddings API. The cache is bounded to
+max_entries vectors and evicts the least recently used ones first.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+# SQLite limits the number of bound parameters per statement
+_MAX_QUERY_PARAMS = 900
+
+
+def text_hash(text: str) -> bytes:
+    """Cache key of a text: the SHA-256 digest of its UTF-8 encoding."""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU cache of embedding vectors, safe to share between threads."""
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        ''')
+        # Logical clock for LRU order, carried over between runs
+        self._clock, self._entries = self._db.execute(
+            'SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM embeddings'
+        ).fetchone()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up texts, returning a vector or None (a miss) for each, in order."""
+        keys = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), _MAX_QUERY_PARAMS):
+                chunk = unique_keys[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(self._db.execute(
+                    f'SELECT text_hash, vector FROM embeddings '
+                    f'WHERE model = ? AND text_hash IN ({placeholders})',
+                    [model, *chunk]
+                ))
+            if found:
+                self._clock += 1
+                self._db.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+                    [(self._clock, model, key) for key in found]
+                )
+                self._db.commit()
+
+            vectors = []
+            for key in keys:
+                blob = found.get(key)
+                vectors.append(array('f', blob).tolist() if blob is not None else None)
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store vectors for texts, evicting least recently used entries beyond max_entries."""
+        rows = {text_hash(text): array('f', vector).tobytes() for text, vector in zip(texts, vectors)}
+        with self._lock:
+            self._clock += 1
+            before = self._db.total_changes
+            self._db.executemany(
+                'INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)',
+                [(model, key, blob, self._clock) for key, blob in rows.items()]
+            )
+            self._entries += self._db.total_changes - before
+
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    'DELETE FROM embeddings WHERE (model, text_hash) IN ('
+                    'SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)',
+                    (excess,)
+                )
+                self._entries -= excess
+                self.evictions += excess
+            self._db.commit()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this session and the current cache size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': self._entries,
+            'evictions': self.evictions,
+        }
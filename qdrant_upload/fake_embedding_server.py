@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Local fake of the OpenAI embeddings endpoint.
+
+Returns deterministic vectors derived from each input text, optionally after
+a fixed latency, so the upload pipeline can be tested and benchmarked without
+network access or API spend. It can also act like a rate limited provider:
+answering 429 above a number of concurrent requests or requests per minute
+(with x-ratelimit-* and retry-after-ms headers) and failing a fraction of
+requests with a 5xx status.
+
+Usage:
+    python fake_embedding_server.py --port 8099 --latency 0.2
+    python fake_embedding_server.py --max-concurrency 2 --requests-per-minute 600 --failure-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=fake python upload_to_qdrant.py ...
+
+Or in-process:
+    with FakeEmbeddingServer(dimensions=8, latency=0.05) as server:
+        os.environ['OPENAI_BASE_URL'] = server.base_url
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from typing import Dict, List
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic vector for a text, derived from its SHA-256."""
+    values = []
+    counter = 0
+    while len(values) < dimensions:
+        digest = hashlib.sha256(f"{counter}:{text}".encode('utf-8')).digest()
+        values.extend(byte / 255.0 - 0.5 for byte in digest)
+        counter += 1
+    return values[:dimensions]
+
+
+def _error(message: str, code: str) -> Dict:
+    return {'error': {'message': message, 'type': code, 'param': None, 'code': code}}
+
+
+class FakeEmbeddingServer:
+    """Threaded HTTP server answering POST /v1/embeddings like the OpenAI API."""
+
+    def __init__(self, dimensions: int = 1536, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 max_concurrency: int = None, requests_per_minute: int = None,
+                 failure_rate: float = 0.0, failure_status: int = 503, seed: int = 0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = []
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._recent = deque()  # Times of the requests accepted in the last minute
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/embeddings'):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with server._lock:
+                    rejection = server._admit()
+                    if rejection is None:
+                        server.in_flight += 1
+                        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                        server.requests.append(body)
+                    else:
+                        server.rejected += 1
+                    headers = server._rate_limit_headers()
+                if rejection is not None:
+                    status, payload, retry_after = rejection
+                    if retry_after is not None:
+                        headers['retry-after-ms'] = str(int(retry_after * 1000))
+                    self._send_json(status, payload, headers)
+                    return
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    status, payload = server.handle_embeddings(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                self._send_json(status, payload, headers)
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _admit(self):
+        """None to serve a request, or the (status, payload, retry after) to reject it with."""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 60:
+            self._recent.popleft()
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return 429, _error('Too many concurrent requests', 'rate_limit_exceeded'), self.latency or 0.05
+        if self.requests_per_minute is not None and len(self._recent) >= self.requests_per_minute:
+            return 429, _error('Rate limit reached for requests', 'rate_limit_exceeded'), 60 - (now - self._recent[0])
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            return self.failure_status, _error('The server is overloaded', 'server_error'), None
+        self._recent.append(now)
+        return None
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        if self.requests_per_minute is None:
+            return {}
+        reset = 60 - (time.monotonic() - self._recent[0]) if self._recent else 0
+        return {
+            'x-ratelimit-limit-requests': str(self.requests_per_minute),
+            'x-ratelimit-remaining-requests': str(max(0, self.requests_per_minute - len(self._recent))),
+            'x-ratelimit-reset-requests': f"{reset:.3f}s",
+        }
+
+    def handle_embeddings(self, body):
+        """Build the (status, JSON payload) answer for one embeddings request."""
+        inputs = body['input']
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get('dimensions') or self.dimensions
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text, dimensions)
+            if body.get('encoding_format') == 'base64':
+                vector = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode('ascii')
+            data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+        tokens = sum(len(text.split()) for text in inputs)
+        return 200, {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake OpenAI embeddings server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    parser.add_argument('--max-concurrency', type=int, help='Answer 429 above this many concurrent requests')
+    parser.add_argument('--requests-per-minute', type=int, help='Answer 429 above this many requests per minute')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests failed with a 503')
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(args.dimensions, args.latency, args.host, args.port,
+                                 max_concurrency=args.max_concurrency,
+                                 requests_per_minute=args.requests_per_minute,
+                                 failure_rate=args.failure_rate)
+    print(f"Fake embeddings endpoint at {server.base_url}/embeddings")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
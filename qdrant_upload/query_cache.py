@@ -0,0 +1,221 @@
+"""
+Query embedding cache for the retrieval path.
+
+Chat front ends send the same questions over and over. QueryEmbeddingCache
+sits in front of the embedding backend of a searcher:
+
+- an in-memory LRU of up to max_entries query vectors, each kept for ttl
+  seconds;
+- an optional on-disk tier, an EmbeddingCache SQLite file that several
+  searcher processes can share (vectors don't go stale for a given model,
+  so it has no TTL);
+- coalescing of identical in-flight queries: a query already being embedded
+  for another caller (thread or task) is waited for instead of sent again.
+
+Queries are compared, and embedded, after normalize_text (Unicode
+normalization and whitespace collapsing), so near-identical spellings share
+an entry. metrics
+reports hits per tier, coalesced queries and the latency hits saved.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from embedding_cache import EmbeddingCache
+from text_dedup import normalize_text
+
+Vector = List[float]
+
+
+class QueryEmbeddingCache:
+    """Two-tier, coalescing cache of query embeddings, safe to share between threads and tasks."""
+
+    def __init__(self, model_name: str, max_entries: int = 10_000, ttl: Optional[float] = 3600.0,
+                 disk_cache: Optional[EmbeddingCache] = None, clock: Callable[[], float] = time.monotonic):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self.clock = clock
+        self._memory: 'OrderedDict[str, Tuple[Vector, float]]' = OrderedDict()
+        # Queries being embedded -> future of their vector
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.embed_requests = 0
+        self.embed_seconds = 0.0
+
+    # Memory tier
+
+    def _get_memory(self, key: str) -> Optional[Vector]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        vector, expires = entry
+        if expires < self.clock():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return vector
+
+    def _put_memory(self, key: str, vector: Vector):
+        expires = self.clock() + self.ttl if self.ttl is not None else float('inf')
+        self._memory[key] = (vector, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # Lookup
+
+    def _claim(self, keys: Sequence[str]):
+        """
+        Sort unique keys into memory hits, keys in flight for another caller
+        (with their futures) and keys this caller now owns.
+        """
+        found = {}
+        waiting = {}
+        owned = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._get_memory(key)
+                if vector is not None:
+                    found[key] = vector
+                    self.memory_hits += 1
+                elif key in self._in_flight:
+                    waiting[key] = self._in_flight[key]
+                    self.coalesced += 1
+                else:
+                    owned[key] = self._in_flight[key] = Future()
+        return found, waiting, owned
+
+    def _lookup_disk(self, owned: Dict[str, Future]) -> Dict[str, Vector]:
+        if self.disk_cache is None or not owned:
+            return {}
+        keys = list(owned)
+        found = {
+            key: vector
+            for key, vector in zip(keys, self.disk_cache.get_many(self.model_name, keys))
+            if vector is not None
+        }
+        with self._lock:
+            self.disk_hits += len(found)
+        return found
+
+    def _put_disk(self, vectors: Dict[str, Vector], embedded: Sequence[str]):
+        if self.disk_cache is not None and embedded:
+            self.disk_cache.put_many(self.model_name, embedded, [vectors[key] for key in embedded])
+
+    def _store(self, vectors: Dict[str, Vector], embedded: Sequence[str], seconds: Optional[float]):
+        """Cache vectors in memory and release their in-flight entries (futures are resolved by the caller)."""
+        with self._lock:
+            for key, vector in vectors.items():
+                self._put_memory(key, vector)
+                self._in_flight.pop(key, None)
+            if seconds is not None:
+                self.misses += len(embedded)
+                self.embed_requests += 1
+                self.embed_seconds += seconds
+
+    def _abandon(self, owned: Dict[str, Future]):
+        with self._lock:
+            for key in owned:
+                self._in_flight.pop(key, None)
+
+    def get_many(self, texts: Sequence[str], embed: Callable[[List[str]], List[Vector]]) -> List[Vector]:
+        """
+        Vectors of texts, in order. Texts not cached or in flight are
+        embedded with one embed(texts) call.
+        """
+        keys = [normalize_text(text) for text in texts]
+        found, waiting, owned = self._claim(keys)
+        try:
+            found.update(self._lookup_disk(owned))
+            missing = [key for key in owned if key not in found]
+            seconds = None
+            if missing:
+                started = time.perf_counter()
+                found.update(zip(missing, _checked(embed(missing), missing)))
+                seconds = time.perf_counter() - started
+            self._put_disk(found, missing)
+        except BaseException as e:
+            self._abandon(owned)
+            for future in owned.values():
+                future.set_exception(e)
+            raise
+        self._store({key: found[key] for key in owned}, missing, seconds)
+        for key, future in owned.items():
+            future.set_result(found[key])
+
+        for key, future in waiting.items():
+            found[key] = future.result()
+        return [found[key] for key in keys]
+
+    async def get_many_async(self, texts: Sequence[str],
+                             embed: Callable[[List[str]], Awaitable[List[Vector]]]) -> List[Vector]:
+        """
+        Async version of get_many(); embed returns an awaitable. Disk tier
+        reads and writes run in the loop's default executor, so SQLite I/O
+        doesn't block the event loop.
+        """
+        keys = [normalize_text(text) for text in texts]
+        found, waiting, owned = self._claim(keys)
+        loop = asyncio.get_running_loop()
+        try:
+            if self.disk_cache is not None and owned:
+                found.update(await loop.run_in_executor(None, self._lookup_disk, owned))
+            missing = [key for key in owned if key not in found]
+            seconds = None
+            if missing:
+                started = time.perf_counter()
+                found.update(zip(missing, _checked(await embed(missing), missing)))
+                seconds = time.perf_counter() - started
+                if self.disk_cache is not None:
+                    await loop.run_in_executor(None, self._put_disk, found, missing)
+        except BaseException as e:
+            self._abandon(owned)
+            for future in owned.values():
+                future.set_exception(e)
+            raise
+        self._store({key: found[key] for key in owned}, missing, seconds)
+        for key, future in owned.items():
+            future.set_result(found[key])
+
+        for key, future in waiting.items():
+            # In-flight futures are thread-safe, so this works whichever thread or loop owns them
+            found[key] = await asyncio.wrap_future(future)
+        return [found[key] for key in keys]
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        """Hit counts per tier, coalesced queries, hit rate and the embedding latency hits saved."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.coalesced + self.misses
+            mean_latency = self.embed_seconds / self.embed_requests if self.embed_requests else 0.0
+            return {
+                'lookups': lookups,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'embed_requests': self.embed_requests,
+                'mean_embed_latency': mean_latency,
+                # Each hit would otherwise have waited for an embedding request
+                'latency_saved': hits * mean_latency,
+                'entries': len(self._memory),
+            }
+
+
+def _checked(vectors: List[Vector], texts: Sequence[str]) -> List[Vector]:
+    if len(vectors) != len(texts):
+        raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(texts)} texts")
+    return vectors
+
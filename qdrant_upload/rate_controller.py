@@ -0,0 +1,303 @@
+"""
+Retry, rate-limit and adaptive concurrency control for embedding requests.
+
+RateController wraps each embeddings API call:
+
+- requests wait for a slot under an AIMD concurrency limit: every success
+  while the limit is in use raises it by 1/limit (about one slot per round
+  of requests), every rate limit response halves it, down to
+  min_concurrency and up to max_concurrency;
+- requests also wait for room in per-minute request and token budgets,
+  taken from the config or learned from the x-ratelimit-* response headers;
+- 429s, 5xx responses and connection errors are retried with full-jitter
+  exponential backoff, waiting at least as long as retry-after says.
+
+It is thread-safe for the threaded uploader and has async variants of the
+waiting calls for AsyncQdrantUploader.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+try:
+    import openai
+except ImportError:  # Only needed to classify API errors
+    openai = None
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+# Statuses worth retrying besides 5xx
+_RETRY_STATUSES = {408, 409, 429}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a rate limit reset header such as '20ms', '1s' or '6m0s'."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds the server asked to wait (retry-after-ms or retry-after), if any."""
+    if not headers:
+        return None
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get('retry-after'))
+
+
+def _wake(future: asyncio.Future):
+    """Resolve a waiter's future unless it timed out or was cancelled meanwhile."""
+    if not future.done():
+        future.set_result(None)
+
+
+class _MinuteBudget:
+    """Token bucket refilled at limit per minute; the limit can change as headers arrive."""
+
+    def __init__(self, limit: Optional[float], clock: Callable[[], float]):
+        self.limit = limit
+        self.level = limit
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        if self.limit is not None:
+            self.level = min(self.limit, self.level + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount fits (a request larger than the whole budget waits for a full bucket)."""
+        if self.limit is None:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.limit)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.limit
+
+    def take(self, amount: float):
+        if self.limit is not None:
+            self.level -= amount
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str]):
+        """Follow the server's view of the budget from x-ratelimit-* headers."""
+        self._refill()
+        try:
+            if limit is not None:
+                new_limit = float(limit)
+                if self.limit is None:
+                    self.level = new_limit
+                self.limit = new_limit
+            if remaining is not None and self.limit is not None:
+                self.level = min(self.level, float(remaining))
+        except ValueError:
+            return
+        reset_seconds = parse_duration(reset)
+        if reset_seconds and self.limit is not None and self.level < 1:
+            # Nothing left until the reset: make the bucket refill exactly then
+            self.level = min(self.level, 1 - reset_seconds * self.limit / 60)
+
+
+class RateController:
+    """Gates, paces and retries embedding requests; see the module docstring."""
+
+    def __init__(self, max_concurrency: int = 4, min_concurrency: int = 1,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 6, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+        self.in_flight = 0
+        self.requests = _MinuteBudget(requests_per_minute, clock)
+        self.tokens = _MinuteBudget(tokens_per_minute, clock)
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'errors': 0, 'waited': 0.0}
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+        # (loop, future) of acquire_async() calls waiting for release()
+        self._async_waiters = []
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'RateController':
+        """Controller for the embedding_* settings of an uploader config."""
+        return cls(
+            max_concurrency=config.get('embedding_concurrency', 4),
+            min_concurrency=config.get('embedding_min_concurrency', 1),
+            requests_per_minute=config.get('embedding_requests_per_minute'),
+            tokens_per_minute=config.get('embedding_tokens_per_minute'),
+            max_retries=config.get('embedding_max_retries', 6),
+        )
+
+    # Admission
+
+    def _try_acquire(self, tokens: int) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Take a slot and budget for a request. Returns (start time, 0), or
+        (None, seconds to wait) when out of budget, or (None, None) when all
+        slots are taken and release() will wake the waiter.
+        """
+        if self.in_flight >= max(self.min_concurrency, int(self.limit)):
+            return None, None  # Woken up by release()
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait > 0:
+            return None, wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        return self.clock(), 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of about tokens tokens may be sent; returns a ticket for release()."""
+        started = self.clock()
+        with self._condition:
+            while True:
+                ticket, wait = self._try_acquire(tokens)
+                if ticket is not None:
+                    self.stats['waited'] += self.clock() - started
+                    return ticket
+                self._condition.wait(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """
+        Async version of acquire(): waits on a future that release() resolves
+        (from any thread), or until the budget allows the request.
+        """
+        started = self.clock()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                ticket, wait = self._try_acquire(tokens)
+                if ticket is not None:
+                    self.stats['waited'] += self.clock() - started
+                    return ticket
+                woken = loop.create_future()
+                self._async_waiters.append((loop, woken))
+            try:
+                await asyncio.wait_for(woken, wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket: float, headers: Optional[Mapping[str, str]] = None, rate_limited: bool = False):
+        """Return the request's slot and adapt the limits to how it went."""
+        with self._condition:
+            self.in_flight -= 1
+            self.stats['requests'] += 1
+            if headers:
+                self.requests.update(headers.get('x-ratelimit-limit-requests'),
+                                     headers.get('x-ratelimit-remaining-requests'),
+                                     headers.get('x-ratelimit-reset-requests'))
+                self.tokens.update(headers.get('x-ratelimit-limit-tokens'),
+                                   headers.get('x-ratelimit-remaining-tokens'),
+                                   headers.get('x-ratelimit-reset-tokens'))
+            if rate_limited:
+                self.stats['rate_limited'] += 1
+                # Halve once per round: ignore 429s of requests sent before the last decrease
+                if ticket > self._last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = self.clock()
+                    logger.info(f"Rate limited: embedding concurrency lowered to {int(self.limit)}")
+            elif self.in_flight + 1 >= int(self.limit):
+                # The limit was in use, so there may be room for more
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            for loop, woken in self._async_waiters:
+                loop.call_soon_threadsafe(_wake, woken)
+            self._async_waiters.clear()
+
+    # Retries
+
+    def backoff_delay(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        """Full-jitter exponential backoff, but no shorter than retry-after."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(headers) or 0.0)
+
+    def _classify(self, error: Exception):
+        """(retryable, rate_limited, headers) for an exception from the API client."""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+        if openai is not None and isinstance(error, openai.APIConnectionError):
+            return True, False, headers
+        if status is None:
+            return False, False, headers
+        return status in _RETRY_STATUSES or status >= 500, status == 429, headers
+
+    def call(self, request: Callable[[], Any], tokens: int = 0) -> Any:
+        """
+        Run request() under the controller, retrying transient failures.
+
+        request must return the raw API response (with .headers), as
+        client.embeddings.with_raw_response.create does, and should not
+        retry on its own.
+        """
+        for attempt in range(self.max_retries + 1):
+            ticket = self.acquire(tokens)
+            try:
+                response = request()
+            except Exception as e:
+                delay = self._failed(ticket, e, attempt)
+                self.sleep(delay)
+                continue
+            except BaseException:
+                # KeyboardInterrupt and the like: return the slot, don't retry
+                self.release(ticket)
+                raise
+            self.release(ticket, getattr(response, 'headers', None))
+            return response
+
+    async def call_async(self, request: Callable[[], Any], tokens: int = 0) -> Any:
+        """Async version of call(); request returns an awaitable."""
+        for attempt in range(self.max_retries + 1):
+            ticket = await self.acquire_async(tokens)
+            try:
+                response = await request()
+            except Exception as e:
+                delay = self._failed(ticket, e, attempt)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. when another batch failed): return the slot
+                self.release(ticket)
+                raise
+            self.release(ticket, getattr(response, 'headers', None))
+            return response
+
+    def _failed(self, ticket: float, error: Exception, attempt: int) -> float:
+        """Release after a failed attempt; returns the backoff delay or re-raises."""
+        retryable, rate_limited, headers = self._classify(error)
+        self.release(ticket, headers, rate_limited=rate_limited)
+        if not retryable or attempt >= self.max_retries:
+            with self._condition:
+                self.stats['errors'] += 1
+            raise error
+        delay = self.backoff_delay(attempt, headers)
+        with self._condition:
+            self.stats['retries'] += 1
+            self.stats['waited'] += delay
+        logger.warning(f"Embedding request failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+        return delay
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Filtered semantic search over an uploaded collection.
+
+QdrantSearcher takes the same configuration as QdrantUploader. search_batch
+embeds all queries with one embedding request and sends them to Qdrant as
+one batch query, each with its own optional heading filter, so a RAG service
+answers many filtered queries per round trip:
+
+    searcher = QdrantSearcher(config)
+    results = searcher.search_batch(
+        ['What is a thought record?', 'How do I stop avoiding things?'],
+        [{'chapter_name': 'Thought Records'}, {'source_file': ['a.md', 'b.md']}]
+    )
+
+Filters match the keyword-indexed heading path fields (see
+PAYLOAD_INDEX_FIELDS); a list matches any of its values. AsyncQdrantSearcher
+does the same from an asyncio event loop.
+
+With a context window k, every hit also gets the k sentences before and
+after it in its file (by sentence_index), fetched for all hits with one more
+batch query, so a search takes a fixed three round trips (embedding, search,
+context) however many queries and hits it has. Query vectors are cached and
+identical in-flight queries coalesced by a QueryEmbeddingCache (see
+query_cache), whose counters query_cache_metrics() returns.
+
+Hierarchical uploads (hierarchical in the config) can be searched coarse to
+fine with search_coarse_to_fine: the best sections first, then the best
+sentences (or chunks) inside them, with the same query vectors.
+
+Usage:
+    python search_qdrant.py --config qdrant_config.yaml "What is a thought record?"
+    python search_qdrant.py --config qdrant_config.yaml "Avoidance" "Relapse" --chapter "Part 2" --limit 3
+    python search_qdrant.py --config qdrant_config.yaml "Core beliefs" --sections 3
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from embedding_backends import create_embedding_backend
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache
+from upload_to_qdrant import (
+    PAYLOAD_INDEX_FIELDS,
+    QdrantClient,
+    describe_qdrant_connection,
+    embeddable_text,
+    level_collection,
+    load_config,
+    logger,
+    models,
+    qdrant_connection_kwargs,
+)
+
+try:
+    from qdrant_client import AsyncQdrantClient
+except ImportError:  # Only needed by AsyncQdrantSearcher
+    AsyncQdrantClient = None
+
+# A filter: payload field -> value, or list of accepted values
+HeadingFilter = Dict[str, Union[str, Sequence[str]]]
+Filters = Union[None, HeadingFilter, Sequence[Optional[HeadingFilter]]]
+
+
+def heading_filter(conditions: Optional[HeadingFilter]) -> Optional[models.Filter]:
+    """Qdrant filter requiring every field to match its value (or one of its values)."""
+    if not conditions:
+        return None
+    must = []
+    for field, value in conditions.items():
+        if isinstance(value, (list, tuple, set)):
+            match = models.MatchAny(any=list(value))
+        else:
+            match = models.MatchValue(value=value)
+        must.append(models.FieldCondition(key=field, match=match))
+    return models.Filter(must=must)
+
+
+def per_query(filters: Filters, count: int) -> List[Optional[HeadingFilter]]:
+    """One heading filter per query: filters is None, one filter for all queries, or one per query."""
+    if filters is None or isinstance(filters, dict):
+        return [filters] * count
+    if len(filters) != count:
+        raise ValueError(f"Got {len(filters)} filters for {count} queries")
+    return list(filters)
+
+
+def query_filters(filters: Filters, count: int) -> List[Optional[models.Filter]]:
+    """One Qdrant filter per query (see per_query)."""
+    return [heading_filter(conditions) for conditions in per_query(filters, count)]
+
+
+def search_params(config: Dict[str, Any]) -> Optional[models.SearchParams]:
+    """Search parameters from search_hnsw_ef / search_rescore / search_oversampling in the config."""
+    params = {}
+    if config.get('search_hnsw_ef') is not None:
+        params['hnsw_ef'] = config['search_hnsw_ef']
+    if config.get('quantization', 'none') not in (None, 'none'):
+        params['quantization'] = models.QuantizationSearchParams(
+            rescore=config.get('search_rescore', True),
+            oversampling=config.get('search_oversampling')
+        )
+    return models.SearchParams(**params) if params else None
+
+
+def query_texts(queries: Sequence[str]) -> List[str]:
+    """Queries cleaned for embedding; empty queries are an error."""
+    texts = [embeddable_text(query) for query in queries]
+    empty = [i for i, text in enumerate(texts) if text is None]
+    if empty:
+        raise ValueError(f"Queries {empty} are empty")
+    return texts
+
+
+def query_requests(vectors: List[List[float]], filters: Filters, limit: int,
+                   params: Optional[models.SearchParams]) -> List[models.QueryRequest]:
+    """Batch query requests for the query vectors and their filters."""
+    return [
+        models.QueryRequest(query=vector, filter=query_filter, limit=limit, params=params, with_payload=True)
+        for vector, query_filter in zip(vectors, query_filters(filters, len(vectors)))
+    ]
+
+
+def section_key(hit: Dict[str, Any]) -> str:
+    """The ID children link to for a section hit: that of the whole section, if the hit is a piece of it."""
+    return hit.get('split_from') or hit['id']
+
+
+def section_requests(vectors: List[List[float]], filters: Filters, sections: List[List[Dict[str, Any]]],
+                     limit: int, params: Optional[models.SearchParams]) -> List[Optional[models.QueryRequest]]:
+    """
+    Second pass of a coarse-to-fine search: per query, a request for the
+    points of the sections found for it (by section_id) that also match its
+    filter; None for queries no section was found for.
+    """
+    return [
+        models.QueryRequest(
+            query=vector,
+            filter=heading_filter(dict(conditions or {}, section_id=[section_key(hit) for hit in hits])),
+            limit=limit,
+            params=params,
+            with_payload=True
+        ) if hits else None
+        for vector, conditions, hits in zip(vectors, per_query(filters, len(vectors)), sections)
+    ]
+
+
+def section_results(sections: List[List[Dict[str, Any]]], pending: List[int],
+                    responses: List[models.QueryResponse]) -> List[List[Dict[str, Any]]]:
+    """Hits of the second pass per query, each with the score of the section it was found in."""
+    results = [[] for _ in sections]
+    for i, response in zip(pending, responses):
+        section_scores = {}
+        for hit in sections[i]:
+            section_scores.setdefault(section_key(hit), hit['score'])
+        results[i] = [
+            dict(hit, section_score=section_scores.get(hit.get('section_id')))
+            for hit in map(search_hit, response.points)
+        ]
+    return results
+
+
+def open_query_cache(config: Dict[str, Any], model_name: str) -> Optional[QueryEmbeddingCache]:
+    """
+    Query embedding cache for the query_cache_* settings: query_cache_max_entries
+    vectors in memory (0 disables the cache) for query_cache_ttl seconds, over
+    the SQLite file query_cache_path if set.
+    """
+    max_entries = config.get('query_cache_max_entries', 10_000)
+    if not max_entries:
+        return None
+    disk_cache = None
+    if config.get('query_cache_path'):
+        disk_cache = EmbeddingCache(config['query_cache_path'],
+                                    max_entries=config.get('query_cache_disk_max_entries', 1_000_000))
+    return QueryEmbeddingCache(model_name, max_entries=max_entries, ttl=config.get('query_cache_ttl', 3600),
+                               disk_cache=disk_cache)
+
+
+def context_request(hit: Dict[str, Any], window: int) -> Optional[models.QueryRequest]:
+    """Request for the points within window sentences of hit in its file, if it has a sentence_index."""
+    index = hit.get('sentence_index')
+    if index is None:
+        return None
+    return models.QueryRequest(
+        filter=models.Filter(must=[
+            models.FieldCondition(key='source_file', match=models.MatchValue(value=hit.get('source_file') or '')),
+            models.FieldCondition(key='sentence_index', range=models.Range(gte=index - window, lte=index + window)),
+        ]),
+        # Room for texts split into several points with the same sentence_index
+        limit=(2 * window + 1) * 4,
+        with_payload=True
+    )
+
+
+def context_requests(results: List[List[Dict[str, Any]]], window: int):
+    """Context requests for every hit that has a sentence_index, with the hits they belong to."""
+    hits = [hit for hits in results for hit in hits]
+    requests = [context_request(hit, window) for hit in hits]
+    return [(hit, request) for hit, request in zip(hits, requests) if request is not None]
+
+
+def context_passage(response: models.QueryResponse) -> List[Dict[str, Any]]:
+    """The points of a context request, in sentence order, as dicts of ID and payload."""
+    points = sorted(response.points, key=lambda point: (point.payload or {}).get('sentence_index', 0))
+    return [{'id': str(point.id), **(point.payload or {})} for point in points]
+
+
+def search_hit(point: models.ScoredPoint) -> Dict[str, Any]:
+    """A search result as a dict: point ID, score and payload fields."""
+    return {'id': str(point.id), 'score': point.score, **(point.payload or {})}
+
+
+class QdrantSearcher:
+    """Runs filtered semantic searches against the configured collection."""
+
+    def __init__(self, config: Dict[str, Any], client: Optional[QdrantClient] = None):
+        """Connect to Qdrant (unless a client is given) and set up the embedding backend."""
+        self.config = config
+        self.collection_name = config.get('collection_name', 'default_collection')
+        self.limit = config.get('search_limit', 5)
+        self.context_window = config.get('search_context_window', 0)
+        self.sections = config.get('search_sections', 3)
+        self.search_params = search_params(config)
+
+        try:
+            self.client = client or QdrantClient(**qdrant_connection_kwargs(config))
+            logger.info(f"Searching Qdrant at {describe_qdrant_connection(config)}")
+        except Exception as e:
+            logger.error(f"Failed to connect to Qdrant: {e}")
+            raise
+
+        try:
+            self.embedding_backend = create_embedding_backend(config)
+            self.query_cache = open_query_cache(config, self.embedding_backend.model_name)
+        except Exception as e:
+            logger.error(f"Failed to initialize embedding backend: {e}")
+            raise
+
+    def close(self):
+        """Close the embedding backend and the query cache's disk tier."""
+        self.embedding_backend.close()
+        if self.query_cache is not None and self.query_cache.disk_cache is not None:
+            self.query_cache.disk_cache.close()
+
+    def query_cache_metrics(self) -> Dict[str, Any]:
+        """Hit rate, coalescing and latency saved by the query embedding cache."""
+        return self.query_cache.metrics if self.query_cache is not None else {}
+
+    def embed_queries(self, queries: Sequence[str]) -> List[List[float]]:
+        """Vectors of queries, through the query cache if there is one."""
+        texts = query_texts(queries)
+        if self.query_cache is None:
+            return self.embedding_backend.embed(texts)
+        return self.query_cache.get_many(texts, self.embedding_backend.embed)
+
+    def create_payload_indexes(self, fields: Sequence[str] = PAYLOAD_INDEX_FIELDS):
+        """Create keyword indexes on fields, e.g. for a collection uploaded without them."""
+        for field in fields:
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=models.PayloadSchemaType.KEYWORD
+            )
+
+    def search_batch(self, queries: Sequence[str], filters: Filters = None, limit: Optional[int] = None,
+                     context_window: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries at once, returning the hits of each query
+        (best first, up to limit or search_limit). filters is one heading
+        filter for all queries or a list with one (or None) per query. With
+        a context_window (default search_context_window), hits get their
+        neighbouring sentences; see add_context().
+        """
+        if not queries:
+            return []
+        if context_window is None:
+            context_window = self.context_window
+        try:
+            vectors = self.embed_queries(queries)
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=query_requests(vectors, filters, limit or self.limit, self.search_params)
+            )
+            results = [[search_hit(point) for point in response.points] for response in responses]
+            if context_window:
+                self.add_context(results, context_window)
+            return results
+        except Exception as e:
+            logger.error(f"Failed to search Qdrant: {e}")
+            raise
+
+    def add_context(self, results: List[List[Dict[str, Any]]], window: int) -> List[List[Dict[str, Any]]]:
+        """
+        Give every hit a 'context' list: the points of its file from window
+        sentences before to window sentences after it (itself included), in
+        order, fetched with one batch query. Hits without a sentence_index
+        (uploaded before it existed) get no context.
+        """
+        pending = context_requests(results, window)
+        if pending:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[request for _, request in pending]
+            )
+            for (hit, _), response in zip(pending, responses):
+                hit['context'] = context_passage(response)
+        return results
+
+    def search_coarse_to_fine(self, queries: Sequence[str], filters: Filters = None, limit: Optional[int] = None,
+                              sections: Optional[int] = None, level: str = 'sentence',
+                              context_window: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search a hierarchical upload in two batch queries: the best sections
+        (up to sections or search_sections) of each query, then its best
+        points of level ('sentence' or 'chunk') within those sections. Both
+        passes apply the query's filter. Hits carry the section_score of the
+        section they were found in; sentence hits get context as in
+        search_batch().
+        """
+        if not queries:
+            return []
+        if context_window is None:
+            context_window = self.context_window
+        try:
+            vectors = self.embed_queries(queries)
+            responses = self.client.query_batch_points(
+                collection_name=level_collection(self.config, 'section'),
+                requests=query_requests(vectors, filters, sections or self.sections, self.search_params)
+            )
+            found = [[search_hit(point) for point in response.points] for response in responses]
+            requests = section_requests(vectors, filters, found, limit or self.limit, self.search_params)
+            pending = [i for i, request in enumerate(requests) if request is not None]
+            responses = []
+            if pending:
+                responses = self.client.query_batch_points(
+                    collection_name=level_collection(self.config, level),
+                    requests=[requests[i] for i in pending]
+                )
+            results = section_results(found, pending, responses)
+            if context_window and level == 'sentence':
+                self.add_context(results, context_window)
+            return results
+        except Exception as e:
+            logger.error(f"Failed to search Qdrant: {e}")
+            raise
+
+    def search(self, query: str, filters: Optional[HeadingFilter] = None, limit: Optional[int] = None,
+               context_window: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for one query."""
+        return self.search_batch([query], [filters], limit, context_window)[0]
+
+
+class AsyncQdrantSearcher:
+    """QdrantSearcher for asyncio services, with AsyncQdrantClient and async embedding."""
+
+    def __init__(self, config: Dict[str, Any], client: Optional['AsyncQdrantClient'] = None):
+        """Same arguments as QdrantSearcher, with an AsyncQdrantClient."""
+        if AsyncQdrantClient is None:
+            raise ImportError("AsyncQdrantSearcher needs qdrant-client>=1.6")
+        self.config = config
+        self.collection_name = config.get('collection_name', 'default_collection')
+        self.limit = config.get('search_limit', 5)
+        self.context_window = config.get('search_context_window', 0)
+        self.sections = config.get('search_sections', 3)
+        self.search_params = search_params(config)
+        try:
+            # Only close clients created here
+            self._owns_client = client is None
+            self.client = client or AsyncQdrantClient(**qdrant_connection_kwargs(config))
+            self.embedding_backend = create_embedding_backend(config, asynchronous=True)
+            self.query_cache = open_query_cache(config, self.embedding_backend.model_name)
+        except Exception as e:
+            logger.error(f"Failed to initialize searcher: {e}")
+            raise
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the embedding backend, query cache and the Qdrant client, if it was created here."""
+        await self.embedding_backend.aclose()
+        if self.query_cache is not None and self.query_cache.disk_cache is not None:
+            self.query_cache.disk_cache.close()
+        if self._owns_client:
+            await self.client.close()
+
+    def query_cache_metrics(self) -> Dict[str, Any]:
+        """Hit rate, coalescing and latency saved by the query embedding cache."""
+        return self.query_cache.metrics if self.query_cache is not None else {}
+
+    async def embed_queries(self, queries: Sequence[str]) -> List[List[float]]:
+        """Vectors of queries, through the query cache if there is one."""
+        texts = query_texts(queries)
+        if self.query_cache is None:
+            return await self.embedding_backend.embed_async(texts)
+        return await self.query_cache.get_many_async(texts, self.embedding_backend.embed_async)
+
+    async def create_payload_indexes(self, fields: Sequence[str] = PAYLOAD_INDEX_FIELDS):
+        """Create keyword indexes on fields."""
+        for field in fields:
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=models.PayloadSchemaType.KEYWORD
+            )
+
+    async def search_batch(self, queries: Sequence[str], filters: Filters = None, limit: Optional[int] = None,
+                           context_window: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Search for several queries at once, as QdrantSearcher.search_batch does."""
+        if not queries:
+            return []
+        if context_window is None:
+            context_window = self.context_window
+        try:
+            vectors = await self.embed_queries(queries)
+            responses = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=query_requests(vectors, filters, limit or self.limit, self.search_params)
+            )
+            results = [[search_hit(point) for point in response.points] for response in responses]
+            if context_window:
+                await self.add_context(results, context_window)
+            return results
+        except Exception as e:
+            logger.error(f"Failed to search Qdrant: {e}")
+            raise
+
+    async def add_context(self, results: List[List[Dict[str, Any]]], window: int) -> List[List[Dict[str, Any]]]:
+        """Give every hit its neighbouring sentences, as QdrantSearcher.add_context does."""
+        pending = context_requests(results, window)
+        if pending:
+            responses = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[request for _, request in pending]
+            )
+            for (hit, _), response in zip(pending, responses):
+                hit['context'] = context_passage(response)
+        return results
+
+    async def search_coarse_to_fine(self, queries: Sequence[str], filters: Filters = None,
+                                    limit: Optional[int] = None, sections: Optional[int] = None,
+                                    level: str = 'sentence',
+                                    context_window: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Search sections, then points within them, as QdrantSearcher.search_coarse_to_fine does."""
+        if not queries:
+            return []
+        if context_window is None:
+            context_window = self.context_window
+        try:
+            vectors = await self.embed_queries(queries)
+            responses = await self.client.query_batch_points(
+                collection_name=level_collection(self.config, 'section'),
+                requests=query_requests(vectors, filters, sections or self.sections, self.search_params)
+            )
+            found = [[search_hit(point) for point in response.points] for response in responses]
+            requests = section_requests(vectors, filters, found, limit or self.limit, self.search_params)
+            pending = [i for i, request in enumerate(requests) if request is not None]
+            responses = []
+            if pending:
+                responses = await self.client.query_batch_points(
+                    collection_name=level_collection(self.config, level),
+                    requests=[requests[i] for i in pending]
+                )
+            results = section_results(found, pending, responses)
+            if context_window and level == 'sentence':
+                await self.add_context(results, context_window)
+            return results
+        except Exception as e:
+            logger.error(f"Failed to search Qdrant: {e}")
+            raise
+
+    async def search(self, query: str, filters: Optional[HeadingFilter] = None, limit: Optional[int] = None,
+                     context_window: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for one query."""
+        return (await self.search_batch([query], [filters], limit, context_window))[0]
+
+
+def main():
+    """Search the collection from the command line, printing the hits as JSON Lines."""
+    parser = argparse.ArgumentParser(description='Search a Qdrant collection of uploaded chunks')
+    parser.add_argument('queries', nargs='+', help='Queries, searched as one batch')
+    parser.add_argument('--config', '-f', type=str, required=True, help='Path to configuration YAML file')
+    parser.add_argument('--limit', '-n', type=int, help='Hits per query (default: search_limit or 5)')
+    parser.add_argument('--context', '-k', type=int,
+                        help='Also return this many sentences before and after each hit (default: search_context_window)')
+    parser.add_argument('--source-file', action='append', help='Only search these source files')
+    parser.add_argument('--chapter', action='append', help='Only search these chapters')
+    parser.add_argument('--section', action='append', help='Only search these sections')
+    parser.add_argument('--subsection', action='append', help='Only search these subsections')
+    parser.add_argument('--sections', type=int,
+                        help='Search a hierarchical upload coarse to fine: the best N sections first, '
+                             'then sentences within them')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    conditions = {
+        field: values
+        for field, values in zip(PAYLOAD_INDEX_FIELDS, (args.source_file, args.chapter, args.section, args.subsection))
+        if values
+    }
+    searcher = QdrantSearcher(config)
+    try:
+        if args.sections:
+            results = searcher.search_coarse_to_fine(args.queries, conditions, args.limit, args.sections,
+                                                     context_window=args.context)
+        else:
+            results = searcher.search_batch(args.queries, conditions, args.limit, args.context)
+        for query, hits in zip(args.queries, results):
+            for hit in hits:
+                print(json.dumps({'query': query, **hit}, ensure_ascii=False))
+    finally:
+        searcher.close()
+
+
+if __name__ == "__main__":
+    main()
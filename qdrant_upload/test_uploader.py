@@ -0,0 +1,908 @@
+"""Offline tests for the Qdrant uploader (no network access needed)."""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chunk_markdown
+from chunk_markdown import OUTPUT_EXTENSIONS, OUTPUT_WRITERS, read_records
+from embedding_backends import EmbeddingBackend, SentenceTransformerBackend
+from embedding_cache import EmbeddingCache
+from fake_embedding_server import FakeEmbeddingServer, fake_embedding
+from query_cache import QueryEmbeddingCache
+from rate_controller import RateController, parse_duration
+from search_qdrant import QdrantSearcher
+from token_batcher import TokenBatcher
+from upload_journal import UploadJournal
+import upload_to_qdrant
+from upload_to_qdrant import QdrantUploader, _iter_json_array, find_chunk_files, link_hierarchy, point_id
+
+VECTOR_SIZE = 8
+
+
+def make_entries(count):
+    """Create chunk entries shaped like chunk_markdown.py output."""
+    return [
+        {
+            'text': f"Sentence number {i}.",
+            'source_file': 'test.md',
+            'chapter_name': 'Introduction',
+            'section_name': f"Section {i // 10}",
+            'subsection_name': None
+        }
+        for i in range(count)
+    ]
+
+
+def embedding_server_vector(text):
+    """Vector the fake server returns for text, normalised like Qdrant's cosine distance."""
+    vector = fake_embedding(text, VECTOR_SIZE)
+    norm = sum(x * x for x in vector) ** 0.5
+    return [x / norm for x in vector]
+
+
+@pytest.fixture
+def embedding_server(monkeypatch):
+    """Fake OpenAI embeddings endpoint that the uploader's OpenAI client talks to."""
+    with FakeEmbeddingServer(dimensions=VECTOR_SIZE, latency=0.05) as server:
+        monkeypatch.setenv('OPENAI_BASE_URL', server.base_url)
+        monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+        yield server
+
+
+@pytest.fixture
+def uploader(embedding_server):
+    """Uploader against the fake embedding server and an in-process Qdrant."""
+    uploader = QdrantUploader({
+        'qdrant_host': ':memory:',
+        'collection_name': 'test_collection',
+        'embedding_model': 'text-embedding-3-small',
+    })
+    uploader.create_collection(vector_size=VECTOR_SIZE)
+    return uploader
+
+
+def test_iter_json_data_filters_and_validates_lazily(tmp_path):
+    entries = make_entries(5)
+    entries[2]['text'] = '   '
+    json_file = tmp_path / 'data.json'
+    json_file.write_text(json.dumps(entries + [{'source_file': 'x.md'}]), encoding='utf-8')
+
+    uploader = QdrantUploader.__new__(QdrantUploader)
+    stream = uploader.iter_json_data(str(json_file))
+    assert [next(stream)['text'] for _ in range(4)] == [entries[i]['text'] for i in (0, 1, 3, 4)]
+    with pytest.raises(ValueError, match="Entry 5 missing required field 'text'"):
+        next(stream)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_iter_json_array_streams_elements(chunk_size):
+    data = make_entries(25) + [1.5e10, "text", None, [1, {'a': True}]]
+    text = json.dumps(data, indent=4, ensure_ascii=False)
+
+    assert list(_iter_json_array(io.StringIO(text), chunk_size)) == data
+
+
+@pytest.mark.parametrize('output_format', sorted(OUTPUT_WRITERS))
+def test_reader_matches_chunker_reader(tmp_path, output_format):
+    assert (upload_to_qdrant.COMPACT_FORMAT, upload_to_qdrant.COMPACT_VERSION) == (
+        chunk_markdown.COMPACT_FORMAT, chunk_markdown.COMPACT_VERSION)
+
+    entries = make_entries(5)
+    entries[3]['subsection_name'] = None
+    for records in (entries, []):
+        output_path = tmp_path / (f'chunks{len(records)}' + OUTPUT_EXTENSIONS[output_format])
+        OUTPUT_WRITERS[output_format](iter(records), output_path)
+        assert list(upload_to_qdrant.iter_json_records(output_path)) == list(read_records(output_path)) == records
+
+
+@pytest.mark.parametrize('output_format', sorted(OUTPUT_WRITERS))
+def test_chunker_output_formats_load(uploader, tmp_path, output_format):
+    entries = make_entries(5)
+    entries[3]['subsection_name'] = None
+    output_path = tmp_path / ('chunks' + OUTPUT_EXTENSIONS[output_format])
+    OUTPUT_WRITERS[output_format](iter(entries), output_path)
+
+    assert list(find_chunk_files([str(tmp_path)])) == [str(output_path)]
+    assert uploader.load_json_data(str(output_path)) == entries
+
+
+def test_empty_chunk_files_have_no_entries(uploader, tmp_path):
+    for output_format, write_records in OUTPUT_WRITERS.items():
+        write_records(iter([]), tmp_path / ('empty' + OUTPUT_EXTENSIONS[output_format]))
+
+    paths = sorted(find_chunk_files([str(tmp_path)]))
+    assert len(paths) == 3
+    assert list(uploader.iter_files_data(paths)) == []
+
+
+def test_unknown_compact_version_is_rejected(uploader, tmp_path):
+    compact_file = tmp_path / 'chunks.compact.jsonl'
+    compact_file.write_text(
+        '{"format": "md-qd-compact", "version": 2, "fields": ["text"], "indexed": []}\n["Hello."]\n',
+        encoding='utf-8',
+    )
+
+    with pytest.raises(ValueError, match='version 2'):
+        uploader.load_json_data(str(compact_file))
+
+
+def test_pipelined_upload_overlaps_embedding_requests(uploader, embedding_server):
+    entries = make_entries(95)
+
+    uploaded = uploader.upload_to_qdrant(iter(entries), batch_size=10, embedding_concurrency=4)
+
+    assert uploaded == 95
+    assert uploader.client.count('test_collection').count == 95
+    assert embedding_server.max_in_flight > 1
+    point = uploader.client.retrieve('test_collection', [point_id(entries[42])], with_payload=True)[0]
+    assert point.payload['text'] == entries[42]['text']
+
+
+def test_pipelined_upload_stops_on_failure(uploader, embedding_server):
+    def entries():
+        yield from make_entries(30)
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        uploader.upload_to_qdrant(entries(), batch_size=10, embedding_concurrency=2)
+
+
+def test_async_upload_stream(embedding_server):
+    from async_upload_to_qdrant import AsyncQdrantUploader
+
+    entries = make_entries(95)
+
+    async def records():
+        for entry in entries:
+            yield entry
+
+    async def upload():
+        config = {
+            'qdrant_host': ':memory:',
+            'collection_name': 'test_collection',
+            'embedding_concurrency': 4,
+        }
+        async with AsyncQdrantUploader(config) as uploader:
+            await uploader.create_collection(vector_size=VECTOR_SIZE)
+            uploaded = await uploader.upload_stream(records(), batch_size=10)
+            count = (await uploader.client.count('test_collection')).count
+            point = (await uploader.client.retrieve('test_collection', [point_id(entries[42])], with_payload=True))[0]
+            return uploaded, count, point
+
+    uploaded, count, point = asyncio.run(upload())
+
+    assert uploaded == count == 95
+    assert point.payload['text'] == entries[42]['text']
+    assert 1 < embedding_server.max_in_flight <= 4
+
+
+def test_async_upload_stream_stops_on_failure(embedding_server):
+    from async_upload_to_qdrant import AsyncQdrantUploader
+
+    def records():
+        yield from make_entries(30)
+        raise RuntimeError("source failed")
+
+    async def upload():
+        async with AsyncQdrantUploader({'qdrant_host': ':memory:', 'collection_name': 'test_collection'}) as uploader:
+            await uploader.create_collection(vector_size=VECTOR_SIZE)
+            await uploader.upload_stream(records(), batch_size=10)
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        asyncio.run(upload())
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with EmbeddingCache(path, max_entries=3) as cache:
+        for text, value in [('a', 0.5), ('b', 1.5), ('c', 2.5)]:
+            cache.put_many('model', [text], [[value]])
+        assert cache.get_many('model', ['a', 'x']) == [[0.5], None]
+        assert cache.get_many('other-model', ['a']) == [None]
+        cache.put_many('model', ['d'], [[3.5]])
+        assert cache.stats == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'entries': 3, 'evictions': 1}
+
+    # Entries and LRU order persist across sessions
+    with EmbeddingCache(path, max_entries=3) as cache:
+        assert cache.get_many('model', ['a', 'b', 'c', 'd']) == [[0.5], None, [2.5], [3.5]]
+
+
+def test_upload_sends_only_cache_misses(embedding_server, tmp_path):
+    config = {
+        'qdrant_host': ':memory:',
+        'collection_name': 'test_collection',
+        'embedding_cache': str(tmp_path / 'cache.sqlite'),
+    }
+    entries = make_entries(30)
+
+    uploader = QdrantUploader(config)
+    uploader.create_collection(vector_size=VECTOR_SIZE)
+    uploader.upload_to_qdrant(iter(entries[:20]), batch_size=10)
+    assert sum(len(body['input']) for body in embedding_server.requests) == 20
+
+    embedding_server.requests.clear()
+    uploader = QdrantUploader(config)
+    uploader.create_collection(vector_size=VECTOR_SIZE)
+    assert uploader.upload_to_qdrant(iter(entries), batch_size=10) == 30
+    assert [len(body['input']) for body in embedding_server.requests] == [10]
+    assert uploader.embedding_cache.stats['hits'] == 20
+    vector = uploader.client.retrieve('test_collection', [point_id(entries[5])], with_vectors=True)[0].vector
+    assert vector == pytest.approx(embedding_server_vector(entries[5]['text']), abs=1e-6)
+
+
+def test_point_ids_are_content_addressed():
+    entry = make_entries(1)[0]
+
+    assert point_id(entry) == point_id(dict(entry))
+    assert point_id(entry) != point_id(dict(entry, text='Other sentence.'))
+    assert point_id(entry) != point_id(dict(entry, section_name='Section 9'))
+    assert point_id(entry) == point_id(dict(entry, subsection_name=''))
+
+
+def test_sync_only_embeds_changes_and_deletes_vanished_points(uploader, embedding_server):
+    entries = make_entries(20)
+    other_file = [dict(entry, source_file='other.md') for entry in make_entries(5)]
+    uploader.upload_to_qdrant(iter(entries + other_file), batch_size=10)
+    embedding_server.requests.clear()
+
+    edited = entries[:3] + entries[4:]          # entry 3 removed
+    edited[0] = dict(edited[0], text='Rewritten first sentence.')
+    edited.append(dict(entries[0], text='A brand new sentence.'))
+
+    counts = uploader.sync_to_qdrant(iter(edited), batch_size=10)
+
+    assert counts == {'uploaded': 2, 'unchanged': 18, 'deleted': 2}
+    assert [body['input'] for body in embedding_server.requests] == [
+        ['Rewritten first sentence.', 'A brand new sentence.']
+    ]
+    # Points from other source files are left alone
+    assert uploader.client.count('test_collection').count == 20 + 5
+    assert not uploader.client.retrieve('test_collection', [point_id(entries[3])])
+
+
+def test_sync_keeps_pieces_of_split_entries(uploader, embedding_server):
+    uploader.config['max_input_tokens'] = 10
+    long_entry = dict(make_entries(1)[0], text=' '.join(f"word{i}" for i in range(40)))
+    entries = make_entries(2) + [long_entry]
+    uploader.upload_to_qdrant(iter(entries), batch_size=10)
+    points = uploader.client.count('test_collection').count
+    assert points > 3
+    embedding_server.requests.clear()
+
+    counts = uploader.sync_to_qdrant(iter(entries), batch_size=10)
+
+    assert counts == {'uploaded': 0, 'unchanged': 3, 'deleted': 0}
+    assert not embedding_server.requests
+    assert uploader.client.count('test_collection').count == points
+
+    # Editing the long entry replaces all of its pieces
+    counts = uploader.sync_to_qdrant(iter(entries[:2] + [dict(long_entry, text='Short now.')]), batch_size=10)
+    assert counts == {'uploaded': 1, 'unchanged': 2, 'deleted': points - 2}
+
+
+def write_chunk_files(directory):
+    """Write chunk files of 7, 8 and 10 entries in the layouts chunk_markdown.py produces."""
+    entries = make_entries(25)
+    (directory / 'nested').mkdir()
+    (directory / 'a.json').write_text(json.dumps(entries[:7]), encoding='utf-8')
+    (directory / 'nested' / 'b.jsonl').write_text(
+        ''.join(json.dumps(entry) + '\n' for entry in entries[7:15]), encoding='utf-8')
+    (directory / 'nested' / 'c.json').write_text(json.dumps(entries[15:]), encoding='utf-8')
+    (directory / '.chunk_manifest.json').write_text('{"version": 1}', encoding='utf-8')
+    (directory / 'notes.md').write_text('# Not a chunk file', encoding='utf-8')
+    return entries
+
+
+def test_find_chunk_files(tmp_path):
+    write_chunk_files(tmp_path)
+
+    found = list(find_chunk_files([str(tmp_path), str(tmp_path / 'nested' / '*.jsonl')]))
+
+    assert [os.path.relpath(path, tmp_path) for path in found] == [
+        'a.json', os.path.join('nested', 'b.jsonl'), os.path.join('nested', 'c.json'),
+        os.path.join('nested', 'b.jsonl'),
+    ]
+
+
+def test_main_uploads_directory_in_full_batches(tmp_path, embedding_server, monkeypatch):
+    write_chunk_files(tmp_path)
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_text(
+        "qdrant_host: ':memory:'\ncollection_name: test_collection\n"
+        f"batch_size: 10\nvector_size: {VECTOR_SIZE}\n",
+        encoding='utf-8'
+    )
+    uploaders = []
+    monkeypatch.setattr(upload_to_qdrant, 'QdrantUploader',
+                        lambda config: uploaders.append(QdrantUploader(config)) or uploaders[-1])
+    monkeypatch.setattr('sys.argv', ['upload_to_qdrant.py', str(tmp_path), '--config', str(config_file)])
+    monkeypatch.chdir(tmp_path / 'nested')  # the default journal is written to the working directory
+
+    upload_to_qdrant.main()
+
+    assert len(uploaders) == 1
+    assert sorted(len(body['input']) for body in embedding_server.requests) == [5, 10, 10]
+    assert uploaders[0].client.count('test_collection').count == 25
+    # The default journal is kept per collection
+    assert (tmp_path / 'nested' / 'upload_journal.test_collection.jsonl').exists()
+
+
+def count_words(text):
+    """Token counter for tests: one token per word."""
+    return len(text.split())
+
+
+def test_token_batcher_packs_up_to_budget_and_item_cap():
+    texts = ['one two three', 'four five', 'six', 'seven eight nine ten', 'a', 'b', 'c', 'd', 'e']
+    batcher = TokenBatcher(max_tokens=6, max_items=4, count_tokens=count_words)
+
+    batches = list(batcher.batches({'text': text} for text in texts))
+
+    assert [[entry['text'] for entry in batch] for batch in batches] == [
+        ['one two three', 'four five', 'six'],
+        ['seven eight nine ten', 'a', 'b'],
+        ['c', 'd', 'e'],
+    ]
+    summary = batcher.summary()
+    assert summary['batches'] == 3 and summary['items'] == 9 and summary['tokens'] == 15
+    assert summary['items_per_batch']['max'] == 3
+    assert summary['tokens_per_batch'] == {'min': 3, 'median': 6, 'max': 6, 'mean': 5.0}
+
+
+def test_token_batcher_splits_oversized_texts():
+    entry = make_entries(1)[0]
+    entry['text'] = ' '.join(f"w{i}" for i in range(10))
+    batcher = TokenBatcher(max_tokens=8, max_items=100, max_input_tokens=4, count_tokens=count_words)
+
+    batches = list(batcher.batches([entry]))
+
+    assert [[part['text'] for part in batch] for batch in batches] == [
+        ['w0 w1 w2 w3', 'w4 w5 w6 w7'], ['w8 w9']
+    ]
+    assert all(part['section_name'] == entry['section_name'] for batch in batches for part in batch)
+    assert batcher.summary()['split_inputs'] == 1
+
+
+def test_upload_batches_by_token_budget(uploader, embedding_server):
+    uploader.config['batch_max_tokens'] = 40
+    entries = make_entries(10)
+
+    assert uploader.upload_to_qdrant(iter(entries), batch_size=100) == 10
+    # Each "Sentence number N." is estimated at 6 tokens, so 6 fit in 40
+    assert sorted(len(body['input']) for body in embedding_server.requests) == [4, 6]
+
+
+def test_generate_embeddings_is_index_aligned(uploader):
+    texts = ['First.', '   ', None, ' Second. ', '']
+
+    embeddings = uploader.generate_embeddings(texts)
+
+    assert embeddings[1:3] == [None, None] and embeddings[4] is None
+    assert embeddings[0] == pytest.approx(fake_embedding('First.', VECTOR_SIZE))
+    assert embeddings[3] == pytest.approx(fake_embedding('Second.', VECTOR_SIZE))
+
+
+def test_upload_keeps_vectors_aligned_around_empty_texts(uploader):
+    entries = make_entries(10)
+    entries[2]['text'] = '  '
+    entries[5]['text'] = None
+
+    assert uploader.upload_to_qdrant(iter(entries), batch_size=10) == 8
+    for entry in (entries[3], entries[9]):
+        point = uploader.client.retrieve('test_collection', [point_id(entry)], with_vectors=True)[0]
+        assert point.vector == pytest.approx(embedding_server_vector(entry['text']), abs=1e-6)
+
+
+def test_resume_skips_batches_recorded_in_journal(uploader, embedding_server, tmp_path):
+    entries = make_entries(50)
+    journal_path = tmp_path / 'journal.jsonl'
+
+    with UploadJournal(str(journal_path), 'test_collection', uploader.embedding_model_name) as journal:
+        uploader.upload_to_qdrant(iter(entries[:30]), batch_size=10, journal=journal)
+    # A crash while writing the next batch leaves a partial line behind
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"batch": 4, "ids": ["0f1e')
+    embedding_server.requests.clear()
+
+    with UploadJournal(str(journal_path), 'test_collection', uploader.embedding_model_name, resume=True) as journal:
+        assert journal.completed_batches == 3
+        assert journal.previous_spend == {'requests': 3, 'texts': 30, 'tokens': 90}
+        uploaded = uploader.upload_to_qdrant(iter(entries), batch_size=10, journal=journal)
+
+    assert uploaded == 20
+    assert sorted(len(body['input']) for body in embedding_server.requests) == [10, 10]
+    assert uploader.client.count('test_collection').count == 50
+
+    with UploadJournal(str(journal_path), 'test_collection', uploader.embedding_model_name, resume=True) as journal:
+        assert journal.completed_batches == 5
+        assert journal.previous_spend['texts'] == 50
+
+    with pytest.raises(ValueError, match="belongs to collection 'test_collection'"):
+        UploadJournal(str(journal_path), 'other_collection', uploader.embedding_model_name, resume=True)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_controller_adapts_concurrency():
+    clock = FakeClock()
+    controller = RateController(max_concurrency=8, clock=clock)
+    tickets = [controller.acquire() for _ in range(8)]
+    assert controller._try_acquire(0) == (None, None)
+
+    clock.now = 1.0
+    controller.release(tickets[0], rate_limited=True)
+    assert controller.limit == 4
+    # Requests sent before the decrease don't halve it again
+    for ticket in tickets[1:5]:
+        controller.release(ticket, rate_limited=True)
+    assert controller.limit == 4
+    # 3 still in flight: one more fits under the new limit
+    tickets = tickets[5:] + [controller.acquire()]
+    assert controller._try_acquire(0) == (None, None)
+
+    # Successes while the limit is in use raise it additively
+    for ticket in tickets:
+        controller.release(ticket)
+    tickets = [controller.acquire() for _ in range(4)]
+    for ticket in tickets:
+        controller.release(ticket)
+    assert 4 < controller.limit < 6
+
+
+def test_async_acquire_waits_for_release():
+    controller = RateController(max_concurrency=1)
+    ticket = controller.acquire()
+
+    async def acquire_after_release():
+        waiter = asyncio.create_task(controller.acquire_async())
+        await asyncio.sleep(0.05)
+        assert not waiter.done() and len(controller._async_waiters) == 1
+        # Released from another thread, as the threaded uploader does
+        threading.Thread(target=controller.release, args=(ticket,)).start()
+        return await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(acquire_after_release())
+    assert controller.in_flight == 1 and controller._async_waiters == []
+
+
+def test_cancelled_request_returns_its_slot():
+    controller = RateController(max_concurrency=1)
+    started = asyncio.Event()
+
+    async def hanging_request():
+        started.set()
+        await asyncio.sleep(60)
+
+    async def cancel_mid_request():
+        task = asyncio.create_task(controller.call_async(hanging_request))
+        await started.wait()
+        assert controller.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert controller.in_flight == 0
+        # The slot is free again for the next request
+        await asyncio.wait_for(controller.acquire_async(), 1)
+
+    asyncio.run(cancel_mid_request())
+
+
+def test_rate_controller_follows_rate_limit_headers():
+    clock = FakeClock()
+    controller = RateController(max_concurrency=4, tokens_per_minute=6000, clock=clock)
+    controller.release(controller.acquire(tokens=100), headers={
+        'x-ratelimit-limit-requests': '60',
+        'x-ratelimit-remaining-requests': '0',
+        'x-ratelimit-reset-requests': '2s',
+    })
+
+    assert controller._try_acquire(10) == (None, pytest.approx(2.0))
+    clock.now = 2.0
+    assert controller._try_acquire(10)[0] == 2.0
+    # 6000 tokens per minute: a 6000-token request waits for the bucket to refill
+    assert controller.tokens.wait_time(6000) == pytest.approx(0.1)
+    assert parse_duration('6m0.5s') == 360.5 and parse_duration('20ms') == 0.02
+
+
+def test_upload_backs_off_when_rate_limited(monkeypatch):
+    with FakeEmbeddingServer(dimensions=VECTOR_SIZE, latency=0.05, max_concurrency=2,
+                             failure_rate=0.2) as server:
+        monkeypatch.setenv('OPENAI_BASE_URL', server.base_url)
+        monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+        uploader = QdrantUploader({
+            'qdrant_host': ':memory:',
+            'collection_name': 'test_collection',
+            'embedding_concurrency': 6,
+            'embedding_max_retries': 10,
+        })
+        uploader.rate_controller.backoff_base = 0.01
+        uploader.create_collection(vector_size=VECTOR_SIZE)
+
+        assert uploader.upload_to_qdrant(iter(make_entries(150)), batch_size=10) == 150
+
+    stats = uploader.rate_controller.stats
+    assert server.rejected > 0 and server.max_in_flight <= 2
+    assert stats['rate_limited'] > 0 and stats['retries'] == server.rejected
+    assert uploader.rate_controller.limit < 6
+    assert uploader.client.count('test_collection').count == 150
+
+
+class RecordingModel:
+    """Stands in for a SentenceTransformer: records its batches, embeds text as [length, 1]."""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        import numpy
+        self.batches.append(list(texts))
+        return numpy.array([[len(text), 1.0] for text in texts])
+
+
+def test_backends_must_implement_embed():
+    class NoEmbed(EmbeddingBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoEmbed()
+
+
+def test_local_backend_sorts_batches_by_length():
+    model = RecordingModel()
+    backend = SentenceTransformerBackend('test-model', batch_size=2, model=model)
+    texts = ['medium text', 'a', 'the longest text of all', 'bb', 'ccc']
+
+    vectors = backend.embed(texts)
+
+    assert model.batches == [['a', 'bb'], ['ccc', 'medium text'], ['the longest text of all']]
+    assert vectors == [[len(text), 1.0] for text in texts]
+    assert backend.dimensions == 2
+    assert backend.spend.snapshot() == {'requests': 3, 'texts': 5, 'tokens': 0}
+
+
+def test_uploader_with_local_backend(uploader, embedding_server):
+    uploader.embedding_backend = SentenceTransformerBackend('test-model', batch_size=4, model=RecordingModel())
+    uploader.embedding_model_name = 'test-model'
+    uploader.client.delete_collection('test_collection')
+    uploader.create_collection(vector_size=2)
+
+    assert uploader.upload_to_qdrant(iter(make_entries(10)), batch_size=10) == 10
+    assert not embedding_server.requests
+
+
+def make_repeated_entries():
+    """Entries where an exercise prompt recurs in three sections, once with different spacing."""
+    entries = make_entries(6)
+    for i, text in ((1, 'Write down the thought.'), (3, 'Write down the thought.'), (5, 'Write  down the\nthought. ')):
+        entries[i]['text'] = text
+    for i, entry in enumerate(entries):
+        entry['section_name'] = f"Section {i}"
+    return entries
+
+
+def test_dedup_fans_vectors_out_to_duplicates(uploader, embedding_server):
+    entries = make_repeated_entries()
+
+    assert uploader.upload_to_qdrant(iter(entries), batch_size=10) == 6
+    sent = [text for body in embedding_server.requests for text in body['input']]
+    assert sorted(sent) == sorted(['Sentence number 0.', 'Write down the thought.',
+                                   'Sentence number 2.', 'Sentence number 4.'])
+    for entry in (entries[3], entries[5]):
+        point = uploader.client.retrieve('test_collection', [point_id(entry)], with_vectors=True)[0]
+        assert point.payload['text'] == entry['text']
+        assert point.vector == pytest.approx(embedding_server_vector('Write down the thought.'), abs=1e-6)
+
+
+def test_dedup_merges_duplicates_into_first_point(uploader, embedding_server):
+    uploader.config['dedup'] = 'merge'
+    entries = make_repeated_entries()
+
+    assert uploader.upload_to_qdrant(iter(entries), batch_size=10) == 4
+    assert sum(len(body['input']) for body in embedding_server.requests) == 4
+    point = uploader.client.retrieve('test_collection', [point_id(entries[1])])[0]
+    assert [d['section_name'] for d in point.payload['duplicates']] == ['Section 3', 'Section 5']
+    assert not uploader.client.retrieve('test_collection', [point_id(entries[3])])
+
+
+def test_dedup_off_embeds_every_entry(uploader, embedding_server):
+    assert uploader.upload_to_qdrant(iter(make_repeated_entries()), batch_size=10, dedup='off') == 6
+    assert sum(len(body['input']) for body in embedding_server.requests) == 6
+
+
+def test_create_collection_applies_storage_settings(uploader):
+    uploader.config.update({'quantization': 'scalar', 'quantization_quantile': 0.99, 'vectors_on_disk': True,
+                            'payload_on_disk': True, 'hnsw_m': 32, 'hnsw_ef_construct': 200})
+    uploader.create_collection(vector_size=VECTOR_SIZE, recreate=True)
+
+    params = upload_to_qdrant.collection_params(uploader.config, VECTOR_SIZE)
+    assert params['vectors_config'].on_disk is True
+    assert params['quantization_config'].scalar.quantile == 0.99
+    assert params['hnsw_config'].m == 32 and 'shard_number' not in params
+    config = uploader.client.get_collection('test_collection').config
+    assert config.params.vectors.on_disk is True
+    assert uploader.upload_to_qdrant(iter(make_entries(3)), batch_size=10) == 3
+
+
+def test_memory_estimate_shrinks_with_quantization_and_disk():
+    plain = upload_to_qdrant.estimate_collection_memory({}, 1536, 1_000_000)
+    binary = upload_to_qdrant.estimate_collection_memory(
+        {'quantization': 'binary', 'vectors_on_disk': True}, 1536, 1_000_000)
+
+    assert plain['ram'] == 1536 * 4 * 1_000_000 + 2 * 16 * 4 * 1_000_000
+    assert binary['ram'] == (1536 // 8 + 2 * 16 * 4) * 1_000_000
+    assert binary['disk'] > plain['disk']
+
+
+def test_search_batch_embeds_once_and_filters_per_query(uploader, embedding_server):
+    entries = make_entries(30)
+    uploader.upload_to_qdrant(iter(entries), batch_size=10)
+    embedding_server.requests.clear()
+    searcher = QdrantSearcher(uploader.config, client=uploader.client)
+
+    results = searcher.search_batch(
+        ['Sentence number 3.', 'Sentence number 3.', 'Sentence number 25.'],
+        [None, {'section_name': 'Section 1'}, {'section_name': ['Section 0', 'Section 2']}],
+        limit=2
+    )
+
+    # The repeated query is embedded once
+    assert [body['input'] for body in embedding_server.requests] == [['Sentence number 3.', 'Sentence number 25.']]
+    assert results[0][0]['text'] == 'Sentence number 3.'
+    assert all(hit['section_name'] == 'Section 1' for hit in results[1])
+    assert results[2][0]['id'] == point_id(entries[25]) and len(results[2]) == 2
+    assert searcher.search('Sentence number 7.', {'chapter_name': 'Other'}) == []
+    with pytest.raises(ValueError):
+        searcher.search_batch(['One', 'Two'], [None])
+
+
+def test_query_cache_expires_and_evicts(tmp_path):
+    clock = FakeClock()
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    with EmbeddingCache(str(tmp_path / 'queries.sqlite')) as disk:
+        cache = QueryEmbeddingCache('model', max_entries=2, ttl=60, disk_cache=disk, clock=clock)
+        assert cache.get_many(['a b', 'a  b', 'cd'], embed) == [[3.0], [3.0], [2.0]]
+        assert cache.get_many(['cd', 'a b'], embed) == [[2.0], [3.0]]
+        clock.now = 61
+        cache.get_many(['a b'], embed)     # expired in memory, found on disk
+        cache.get_many(['efg', 'hi'], embed)
+        cache.get_many(['a b'], embed)     # evicted from memory, found on disk
+
+        assert calls == [['a b', 'cd'], ['efg', 'hi']]
+        metrics = cache.metrics
+        assert (metrics['memory_hits'], metrics['disk_hits'], metrics['misses']) == (2, 2, 4)
+        assert metrics['hit_rate'] == 0.5 and metrics['entries'] == 2
+
+
+def test_query_cache_coalesces_in_flight_queries():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_embed(texts):
+        calls.append(texts)
+        started.set()
+        release.wait(5)
+        return [[1.0] for _ in texts]
+
+    cache = QueryEmbeddingCache('model')
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(cache.get_many, ['What is CBT?'], slow_embed)
+        started.wait(5)
+        others = [pool.submit(cache.get_many, ['What is CBT?'], slow_embed) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        assert [f.result() for f in [first] + others] == [[[1.0]]] * 4
+
+    assert calls == [['What is CBT?']]
+    assert cache.metrics['coalesced'] == 3
+
+
+def test_async_query_cache_coalesces_and_propagates_errors():
+    calls = []
+
+    async def embed(texts):
+        calls.append(texts)
+        await asyncio.sleep(0.05)
+        if texts == ['bad']:
+            raise RuntimeError('embedding failed')
+        return [[2.0] for _ in texts]
+
+    async def run():
+        cache = QueryEmbeddingCache('model')
+        results = await asyncio.gather(*(cache.get_many_async(['q'], embed) for _ in range(5)))
+        errors = await asyncio.gather(*(cache.get_many_async(['bad'], embed) for _ in range(2)),
+                                      return_exceptions=True)
+        return results, errors, cache
+
+    results, errors, cache = asyncio.run(run())
+    assert results == [[[2.0]]] * 5
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert calls == [['q'], ['bad']]
+    assert cache.metrics['coalesced'] == 5 and not cache._in_flight
+
+
+def test_async_query_cache_reads_disk_off_the_event_loop(tmp_path):
+    disk_threads = []
+
+    class RecordingCache(EmbeddingCache):
+        def get_many(self, model, texts):
+            disk_threads.append(threading.get_ident())
+            return super().get_many(model, texts)
+
+        def put_many(self, model, texts, vectors):
+            disk_threads.append(threading.get_ident())
+            return super().put_many(model, texts, vectors)
+
+    async def embed(texts):
+        return [[1.0] for _ in texts]
+
+    async def run(disk):
+        cache = QueryEmbeddingCache('model', disk_cache=disk)
+        return await cache.get_many_async(['q'], embed), threading.get_ident()
+
+    with RecordingCache(str(tmp_path / 'queries.sqlite')) as disk:
+        result, loop_thread = asyncio.run(run(disk))
+        # One lookup and one write, both in the executor
+        assert len(disk_threads) == 2 and loop_thread not in disk_threads
+        assert result == disk.get_many('model', ['q']) == [[1.0]]
+
+
+def numbered_entries(source_file, count):
+    return [dict(entry, source_file=source_file, sentence_index=i) for i, entry in enumerate(make_entries(count))]
+
+
+def test_search_returns_neighbouring_sentences(uploader, embedding_server):
+    # Same-named files in different directories are told apart by their relative paths
+    uploader.upload_to_qdrant(iter(numbered_entries('a/README.md', 20) + numbered_entries('b/README.md', 20)),
+                              batch_size=10)
+    searcher = QdrantSearcher(uploader.config, client=uploader.client)
+
+    results = searcher.search_batch(['Sentence number 0.', 'Sentence number 12.'],
+                                    [{'source_file': 'a/README.md'}, {'source_file': 'b/README.md'}],
+                                    limit=1, context_window=2)
+
+    assert [hit['sentence_index'] for hit in results[0][0]['context']] == [0, 1, 2]
+    context = results[1][0]['context']
+    assert [hit['text'] for hit in context] == [f"Sentence number {i}." for i in range(10, 15)]
+    assert {hit['source_file'] for hit in context} == {'b/README.md'}
+    assert 'context' not in searcher.search('Sentence number 3.')[0]
+
+
+def test_sync_renumbers_moved_sentences_without_embedding(uploader, embedding_server):
+    entries = numbered_entries('a.md', 10)
+    uploader.upload_to_qdrant(iter(entries), batch_size=10)
+    embedding_server.requests.clear()
+
+    inserted = dict(entries[0], text='An inserted sentence.')
+    edited = [dict(entry, sentence_index=i) for i, entry in enumerate(entries[:5] + [inserted] + entries[5:])]
+    counts = uploader.sync_to_qdrant(iter(edited), batch_size=10)
+
+    assert counts == {'uploaded': 1, 'unchanged': 10, 'deleted': 0}
+    assert [body['input'] for body in embedding_server.requests] == [['An inserted sentence.']]
+    point = uploader.client.retrieve('test_collection', [point_id(entries[7])])[0]
+    assert point.payload['sentence_index'] == 8
+
+
+def test_repeated_sentences_keep_their_own_points(uploader, embedding_server):
+    entries = numbered_entries('a.md', 6)
+    for entry in entries[1::2]:
+        entry['text'] = 'Yes.'
+    uploader.upload_to_qdrant(iter(entries), batch_size=10)
+    searcher = QdrantSearcher(uploader.config, client=uploader.client)
+
+    assert uploader.client.count('test_collection').count == 6
+    hit = searcher.search('Sentence number 2.', limit=1, context_window=3)[0]
+    assert [neighbour['sentence_index'] for neighbour in hit['context']] == [0, 1, 2, 3, 4, 5]
+
+    embedding_server.requests.clear()
+    resynced = [{k: v for k, v in entry.items() if k != 'occurrence'} for entry in entries]
+    assert uploader.sync_to_qdrant(iter(resynced)) == {'uploaded': 0, 'unchanged': 6, 'deleted': 0}
+    assert embedding_server.requests == []
+
+
+def hierarchical_entries(sections):
+    """
+    Records like chunk_markdown.py --strategy hierarchical writes, for
+    sections given as {section name: [[chunk sentences], ...]}.
+    """
+    entries = []
+    for section_name, chunks in sections.items():
+        headings = {'source_file': 'a.md', 'chapter_name': 'Intro', 'section_name': section_name}
+        entries.append(dict(headings, level='section', text=' '.join(' '.join(chunk) for chunk in chunks)))
+        for chunk in chunks:
+            entries.append(dict(headings, level='chunk', text=' '.join(chunk)))
+            entries.extend(dict(headings, level='sentence', text=sentence) for sentence in chunk)
+    return entries
+
+
+HIERARCHY = {
+    'Thought records': [['Write the thought down.', 'Rate how much you believe it.'], ['Look for evidence.']],
+    'Exposure': [['Make a fear ladder.', 'Start at the bottom.'], ['Stay until the fear drops.']],
+    'Summary': [['Practice daily.']],
+}
+
+
+@pytest.fixture
+def hierarchical_uploader(embedding_server):
+    uploader = QdrantUploader({
+        'qdrant_host': ':memory:',
+        'collection_name': 'test_collection',
+        'embedding_model': 'text-embedding-3-small',
+        'hierarchical': True,
+    })
+    uploader.create_collection(vector_size=VECTOR_SIZE)
+    return uploader
+
+
+def test_hierarchical_upload_links_levels_across_collections(hierarchical_uploader, embedding_server):
+    entries = hierarchical_entries(HIERARCHY)
+    hierarchical_uploader.upload_to_qdrant(iter(entries), batch_size=4)
+
+    client = hierarchical_uploader.client
+    counts = {name: client.count(name).count
+              for name in ('test_collection', 'test_collection_chunks', 'test_collection_sections')}
+    assert counts == {'test_collection': 7, 'test_collection_chunks': 5, 'test_collection_sections': 3}
+    # One-sentence chunks share their sentence's embedding (and Summary its section's too)
+    embedded = [text for body in embedding_server.requests for text in body['input']]
+    assert len(embedded) == len(set(embedded)) == 11
+
+    section, chunk, sentence = entries[6], entries[7], entries[8]
+    point = client.retrieve('test_collection', [point_id(sentence)])[0]
+    assert (point.payload['parent_id'], point.payload['section_id']) == (point_id(chunk), point_id(section))
+    point = client.retrieve('test_collection_chunks', [point_id(chunk)])[0]
+    assert point.payload['parent_id'] == point.payload['section_id'] == point_id(section)
+
+
+def test_coarse_to_fine_search_stays_in_top_sections(hierarchical_uploader):
+    entries = hierarchical_entries(HIERARCHY)
+    hierarchical_uploader.upload_to_qdrant(iter(entries), batch_size=4)
+    searcher = QdrantSearcher(hierarchical_uploader.config, client=hierarchical_uploader.client)
+
+    exposure = entries[6]
+    results = searcher.search_coarse_to_fine([exposure['text'], 'Practice daily.'], limit=10, sections=1)
+
+    assert sorted(hit['text'] for hit in results[0]) == sorted(HIERARCHY['Exposure'][0] + HIERARCHY['Exposure'][1])
+    assert [hit['section_score'] for hit in results[0]] == pytest.approx([1.0] * 3)
+    assert [hit['text'] for hit in results[1]] == ['Practice daily.']
+    chunks = searcher.search_coarse_to_fine([exposure['text']], {'section_name': 'Thought records'}, level='chunk')
+    assert {hit['section_name'] for hit in chunks[0]} == {'Thought records'}
+
+
+def test_sync_relinks_unchanged_points_to_edited_parents(hierarchical_uploader, embedding_server):
+    hierarchical_uploader.upload_to_qdrant(iter(hierarchical_entries(HIERARCHY)), batch_size=4)
+    embedding_server.requests.clear()
+
+    edited = dict(HIERARCHY, Exposure=[['Make a fear ladder.', 'Start at the bottom.'], ['Stay longer.']])
+    entries = list(link_hierarchy(hierarchical_entries(edited)))
+    counts = hierarchical_uploader.sync_to_qdrant(iter(entries), batch_size=4)
+
+    # The Exposure section, its second chunk and that chunk's sentence changed
+    assert counts == {'uploaded': 3, 'unchanged': 12, 'deleted': 3}
+    assert sorted(text for body in embedding_server.requests for text in body['input']) == \
+        sorted([entries[6]['text'], 'Stay longer.'])
+    kept_chunk = hierarchical_uploader.client.retrieve('test_collection_chunks', [point_id(entries[7])])[0]
+    assert kept_chunk.payload['section_id'] == point_id(entries[6])
@@ -0,0 +1,103 @@
+"""
+Deduplication of chunk texts before embedding.
+
+Chunk files repeat texts: boilerplate, exercise prompts and headings that
+recur across a book. TextDeduplicator passes the first entry of each
+normalized text on to be embedded and holds back the later ones, which reuse
+the first one's vector once it is in Qdrant. The dedup mode decides what the
+held-back entries become:
+
+- fanout: each still gets its own point (own ID and payload) carrying the
+  vector of the first occurrence, so the collection is the same as without
+  dedup;
+- merge: they get no point of their own; the first occurrence's point lists
+  their metadata in a 'duplicates' payload field;
+- off: every entry is embedded.
+"""
+
+import hashlib
+import logging
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ('off', 'fanout', 'merge')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as compared for dedup: NFKC-normalized with runs of whitespace
+    collapsed. Case is kept, since it can change the embedding.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def dedup_key(text: Any) -> Optional[bytes]:
+    """Hash of the normalized text, or None for texts that aren't strings."""
+    if not isinstance(text, str):
+        return None
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=16).digest()
+
+
+class TextDeduplicator:
+    """
+    Streaming dedup stage for chunk entries.
+
+    Only the point ID of the first entry of each text is kept, plus the
+    duplicate entries themselves, so memory grows with the number of unique
+    texts by a few dozen bytes each.
+    """
+
+    def __init__(self, mode: str = 'fanout', entry_id: Callable[[Dict[str, Any]], str] = None):
+        """entry_id maps an entry to the ID of its point (see upload_to_qdrant.point_id)."""
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode {mode!r}, expected one of {', '.join(DEDUP_MODES)}")
+        self.mode = mode
+        self.entry_id = entry_id
+        self.first_ids: Dict[bytes, str] = {}
+        # Point ID of a first occurrence -> its later duplicates
+        self.duplicates: Dict[str, List[Dict[str, Any]]] = {}
+        self.unique_count = 0
+        self.duplicate_count = 0
+
+    def push(self, entry: Dict[str, Any]) -> bool:
+        """Whether entry should be embedded; duplicates are held back for later."""
+        key = dedup_key(entry.get('text')) if self.mode != 'off' else None
+        if key is None:
+            return True
+        first_id = self.first_ids.get(key)
+        if first_id is None:
+            self.first_ids[key] = self.entry_id(entry)
+            self.unique_count += 1
+            return True
+        self.duplicates.setdefault(first_id, []).append(entry)
+        self.duplicate_count += 1
+        return False
+
+    def filter(self, entries: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """The entries to embed: the first of each text."""
+        for entry in entries:
+            if self.push(entry):
+                yield entry
+
+    def groups(self, size: int) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+        """The held-back duplicates, grouped by first occurrence, size first occurrences at a time."""
+        group = {}
+        for first_id, entries in self.duplicates.items():
+            group[first_id] = entries
+            if len(group) >= size:
+                yield group
+                group = {}
+        if group:
+            yield group
+
+    def log_summary(self):
+        """Log how many embeddings dedup saved."""
+        if self.mode == 'off':
+            return
+        total = self.unique_count + self.duplicate_count
+        logger.info(
+            f"Dedup ({self.mode}): {self.unique_count} unique texts, {self.duplicate_count} duplicates "
+            f"({self.duplicate_count / total if total else 0:.1%} of embeddings saved)"
+        )
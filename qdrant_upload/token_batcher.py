@@ -0,0 +1,195 @@
+"""
+Token-aware batching of chunk entries for embedding requests.
+
+Entries are packed into batches up to a token budget and an item cap, so
+short sentences share a request and long semantic chunks stay under the
+per-request limit. Tokens are counted with tiktoken when it is installed and
+otherwise estimated from the UTF-8 length, which overestimates English text
+and therefore keeps batches under the budget.
+"""
+
+import functools
+import logging
+import statistics
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-input token limit of the OpenAI embedding models
+DEFAULT_MAX_INPUT_TOKENS = 8191
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast upper estimate of the token count: one token per 3 UTF-8 bytes."""
+    return (len(text.encode('utf-8')) + 2) // 3
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model: str) -> Callable[[str], int]:
+    """Token counting function for model: tiktoken if available, else estimate_tokens."""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # e.g. the encoding file can't be downloaded
+        logger.warning(f"Falling back to estimated token counts: {e}")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenBatcher:
+    """
+    Packs entries into batches of at most max_items entries and max_tokens
+    tokens of text, splitting entries longer than max_input_tokens (or the
+    whole budget) into several entries with the same metadata. Pieces are
+    numbered by piece_index and, given an entry_id function, carry the ID of
+    the entry they were split from as split_from, so their own IDs can be
+    derived from it (see upload_to_qdrant.point_id).
+
+    Entries can be pushed one at a time (push/flush), which works for both
+    sync and async sources, or a whole iterable can be batched with
+    batches(). Sizes of the emitted batches are recorded for summary().
+    """
+
+    def __init__(self, max_tokens: int, max_items: int,
+                 max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 entry_id: Optional[Callable[[Dict[str, Any]], str]] = None):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_input_tokens = min(max_input_tokens, max_tokens)
+        self.count_tokens = count_tokens
+        self.entry_id = entry_id
+        self.batch_items = []
+        self.batch_tokens = []
+        self.split_inputs = 0
+        self._batch = []
+        self._tokens = 0
+
+    def split_text(self, text: str) -> List[str]:
+        """Split text at whitespace into pieces of at most max_input_tokens tokens."""
+        pieces = []
+        words = []
+        tokens = 0
+        for word in text.split():
+            word_tokens = self.count_tokens(' ' + word)
+            if word_tokens > self.max_input_tokens:
+                # A single huge "word": cut it in halves until the parts fit
+                pieces.extend(self._split_word(word))
+                continue
+            if words and tokens + word_tokens > self.max_input_tokens:
+                pieces.append(' '.join(words))
+                words = []
+                tokens = 0
+            words.append(word)
+            tokens += word_tokens
+        if words:
+            pieces.append(' '.join(words))
+        return pieces
+
+    def _split_word(self, word: str) -> List[str]:
+        if len(word) <= 1 or self.count_tokens(word) <= self.max_input_tokens:
+            return [word]
+        middle = len(word) // 2
+        return self._split_word(word[:middle]) + self._split_word(word[middle:])
+
+    def _pieces(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        origin = {'split_from': self.entry_id(entry)} if self.entry_id is not None else {}
+        return [
+            dict(entry, text=piece, piece_index=index, **origin)
+            for index, piece in enumerate(self.split_text(entry['text']))
+        ]
+
+    def split_entry(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The entries push() would batch for entry: itself, or its pieces if its text is too long."""
+        text = entry['text']
+        if not isinstance(text, str) or self.count_tokens(text) <= self.max_input_tokens:
+            return [entry]
+        return self._pieces(entry)
+
+    def push(self, entry: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+        """Add an entry, returning the batches it completed (usually none or one)."""
+        text = entry['text']
+        # Texts that won't be embedded still travel with their batch
+        tokens = self.count_tokens(text) if isinstance(text, str) else 0
+        if tokens <= self.max_input_tokens:
+            return self._add(entry, tokens)
+
+        pieces = self._pieces(entry)
+        self.split_inputs += 1
+        logger.info(f"Split a {tokens}-token text into {len(pieces)} parts")
+        completed = []
+        for piece in pieces:
+            completed.extend(self._add(piece, self.count_tokens(piece['text'])))
+        return completed
+
+    def _add(self, entry: Dict[str, Any], tokens: int) -> List[List[Dict[str, Any]]]:
+        completed = []
+        if self._batch and self._tokens + tokens > self.max_tokens:
+            completed.append(self.flush())
+        self._batch.append(entry)
+        self._tokens += tokens
+        if len(self._batch) >= self.max_items:
+            completed.append(self.flush())
+        return completed
+
+    def flush(self) -> Optional[List[Dict[str, Any]]]:
+        """Return the pending partial batch, if any, and start a new one."""
+        if not self._batch:
+            return None
+        batch = self._batch
+        self.batch_items.append(len(batch))
+        self.batch_tokens.append(self._tokens)
+        self._batch = []
+        self._tokens = 0
+        return batch
+
+    def batches(self, entries: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Batch all entries of an iterable."""
+        for entry in entries:
+            yield from self.push(entry)
+        batch = self.flush()
+        if batch:
+            yield batch
+
+    def summary(self) -> Dict[str, Any]:
+        """Distribution of the items and tokens per emitted batch."""
+        if not self.batch_items:
+            return {'batches': 0, 'split_inputs': self.split_inputs}
+        return {
+            'batches': len(self.batch_items),
+            'items': sum(self.batch_items),
+            'tokens': sum(self.batch_tokens),
+            'items_per_batch': _distribution(self.batch_items),
+            'tokens_per_batch': _distribution(self.batch_tokens),
+            'split_inputs': self.split_inputs,
+        }
+
+    def log_summary(self):
+        """Log the batch size distribution."""
+        summary = self.summary()
+        if not summary['batches']:
+            return
+        items = summary['items_per_batch']
+        tokens = summary['tokens_per_batch']
+        logger.info(
+            f"Sent {summary['batches']} embedding batches: "
+            f"{items['min']}/{items['median']}/{items['max']} items and "
+            f"{tokens['min']}/{tokens['median']}/{tokens['max']} tokens per batch (min/median/max), "
+            f"{summary['split_inputs']} oversized texts split"
+        )
+
+
+def _distribution(values: List[int]) -> Dict[str, float]:
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'max': max(values),
+        'mean': round(statistics.fmean(values), 1),
+    }
@@ -0,0 +1,126 @@
+"""
+Checkpoint journal for resumable uploads.
+
+The journal is a JSON Lines file. Each run appends a header line naming the
+collection and embedding model, then one line per batch once its points are
+in Qdrant, holding the batch's point IDs and the embedding spend of the run
+so far. A resumed run skips every entry whose point ID is already in the
+journal, so a crash late in a long upload only repeats the batches that were
+in flight.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+JOURNAL_VERSION = 1
+
+SPEND_FIELDS = ('requests', 'texts', 'tokens')
+
+
+class UploadJournal:
+    """Append-only record of the batches an upload has finished, safe to share between threads."""
+
+    def __init__(self, path: str, collection_name: str, embedding_model: str, resume: bool = False):
+        """
+        Open the journal at path. With resume, completed point IDs and the
+        spend of earlier runs are loaded from it (it must belong to the same
+        collection and model); otherwise any previous journal is replaced.
+        """
+        self.path = path
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.completed_ids: Set[str] = set()
+        self.completed_batches = 0
+        self.previous_spend = dict.fromkeys(SPEND_FIELDS, 0)
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if self._file.tell() and not self._ends_with_newline():
+            # Don't append to a line cut short by a crash
+            self._file.write('\n')
+        self._write({
+            'journal': JOURNAL_VERSION,
+            'collection': collection_name,
+            'embedding_model': embedding_model,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'resumed': resume,
+        })
+
+    def _load(self):
+        run_spend = None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash
+                    continue
+                if 'journal' in record:
+                    if (record['collection'], record['embedding_model']) != (self.collection_name, self.embedding_model):
+                        raise ValueError(
+                            f"Journal {self.path} belongs to collection '{record['collection']}' with model "
+                            f"'{record['embedding_model']}', not '{self.collection_name}' with '{self.embedding_model}'"
+                        )
+                    self._add_spend(run_spend)
+                    run_spend = None
+                elif 'batch' in record:
+                    self.completed_ids.update(record['ids'])
+                    self.completed_batches += 1
+                    run_spend = record.get('spend')
+                elif 'complete' in record:
+                    run_spend = record.get('spend')
+        self._add_spend(run_spend)
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _add_spend(self, spend: Optional[Dict[str, int]]):
+        # Spend is cumulative within a run, so the last batch line of each run has its total
+        if spend:
+            for field in SPEND_FIELDS:
+                self.previous_spend[field] += spend.get(field, 0)
+
+    def _write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the journal file."""
+        with self._lock:
+            self._file.close()
+
+    def is_completed(self, point_id: str) -> bool:
+        """Whether the point was uploaded by a run recorded in this journal."""
+        return point_id in self.completed_ids
+
+    def record_batch(self, batch_number: int, point_ids: Iterable[str], spend: Dict[str, int]):
+        """Record a batch whose points are in Qdrant, with this run's embedding spend so far."""
+        point_ids = list(point_ids)
+        with self._lock:
+            self.completed_ids.update(point_ids)
+            self.completed_batches += 1
+            self._write({'batch': batch_number, 'ids': point_ids, 'spend': spend})
+
+    def record_complete(self, uploaded_count: int, spend: Dict[str, int]):
+        """Mark the run as finished."""
+        with self._lock:
+            self._write({'complete': True, 'uploaded': uploaded_count, 'spend': spend})
+
+    def total_spend(self, spend: Dict[str, int]) -> Dict[str, int]:
+        """Embedding spend of earlier runs plus spend (this run's)."""
+        return {field: self.previous_spend[field] + spend.get(field, 0) for field in SPEND_FIELDS}
@@ -7,18 +7,31 @@ Each JSON entry should contain text content and metadata fields.
 
 Usage:
     python upload_to_qdrant.py --json-file path/to/file.json --collection-name my_collection
+    python upload_to_qdrant.py path/to/chunks/ 'more/**/*.jsonl' --config config.yaml
     python upload_to_qdrant.py --config config.yaml
 """
 
 import argparse
+import glob
+import itertools
 import json
 import logging
 import os
 import sys
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import yaml
 
+from embedding_cache import EmbeddingCache
+from embedding_backends import EMBEDDING_BACKENDS, EmbeddingSpend, create_embedding_backend
+from rate_controller import RateController
+from text_dedup import DEDUP_MODES, TextDeduplicator
+from token_batcher import DEFAULT_MAX_INPUT_TOKENS, TokenBatcher, get_token_counter
+from upload_journal import UploadJournal
+
 # Load environment variables from .env file if it exists
 try:
     from dotenv import load_dotenv
@@ -31,7 +44,6 @@ try:
     from qdrant_client import QdrantClient
     from qdrant_client.http import models
     from qdrant_client.http.models import Distance, VectorParams
-    from openai import OpenAI
 except ImportError as e:
     print(f"Missing required dependency: {e}")
     print("Please install required packages:")
@@ -45,6 +57,554 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Header tag and version of the compact (dictionary-encoded JSON Lines) format
+# written by chunk_markdown.py --format compact
+COMPACT_FORMAT = 'md-qd-compact'
+COMPACT_VERSION = 1
+
+# Checkpoint journal the CLI writes unless checkpoint_journal / --journal say
+# otherwise; {collection} is replaced by the collection name, so uploads to
+# different collections from one directory keep separate journals
+DEFAULT_JOURNAL_PATH = 'upload_journal.{collection}.jsonl'
+
+# Token budget of one embedding request (OpenAI allows up to 300k)
+DEFAULT_BATCH_MAX_TOKENS = 50000
+
+# Extensions of the files chunk_markdown.py writes (see its OUTPUT_EXTENSIONS)
+CHUNK_FILE_EXTENSIONS = ('.json', '.jsonl')
+
+# Namespace of the UUIDv5 point IDs derived from chunk content
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/NovaAI-innovation/md-qd/point')
+
+
+def _iter_json_lines(f, block_size: int = 1024):
+    """Parse JSON Lines from f, decoding blocks of lines with one json.loads call each."""
+    while True:
+        block = list(itertools.islice(f, block_size))
+        if not block:
+            return
+        lines = [line for line in block if line.strip()]
+        if lines:
+            yield from json.loads('[' + ','.join(lines) + ']')
+
+
+def _iter_json_array(f, chunk_size: int = 64 * 1024):
+    """
+    Incrementally parse a top-level JSON array from f, yielding one element
+    at a time while holding only a chunk-sized window of the text in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    expect = '['
+
+    while True:
+        # Skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer = f.read(chunk_size)
+            pos = 0
+            eof = not buffer
+
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        char = buffer[pos]
+
+        if expect == '[':
+            if char != '[':
+                raise ValueError("JSON data must be a list of objects")
+            pos += 1
+            expect = 'first'
+            continue
+        if char == ']' and expect in ('first', ','):
+            return
+        if expect == ',':
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            pos += 1
+            expect = 'value'
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # A value not yet followed by a delimiter (e.g. a number) may be cut short
+            complete = eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]')
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            more = f.read(chunk_size)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+
+        yield item
+        pos = end
+        expect = ','
+        # Drop the consumed part of the buffer
+        if pos >= chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_json_records(json_file_path: str):
+    """
+    Stream records from a chunk file: a JSON array (parsed incrementally),
+    JSON Lines, or compact JSON Lines (a header line, then distinct heading
+    values as bare JSON lines and records as arrays referring to them by
+    index). Reads what chunk_markdown.read_records does; an empty file has
+    no records.
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+        if first_line.lstrip().startswith('['):
+            f.seek(0)
+            yield from _iter_json_array(f)
+            return
+        if not first_line.strip():
+            # Empty JSON Lines file, e.g. of a markdown file without prose
+            return
+
+        header = json.loads(first_line)
+        if not (isinstance(header, dict) and header.get('format') == COMPACT_FORMAT):
+            # Plain JSON Lines: the first line was already a record
+            yield header
+            yield from _iter_json_lines(f)
+            return
+        if header.get('version') != COMPACT_VERSION:
+            raise ValueError(
+                f"Unsupported {COMPACT_FORMAT} version {header.get('version')!r} in {json_file_path} "
+                f"(expected {COMPACT_VERSION})"
+            )
+
+        fields = header['fields']
+        indexed = [i for i, field in enumerate(fields) if field in header['indexed']]
+        values = []
+        for item in _iter_json_lines(f):
+            if not isinstance(item, list):
+                values.append(item)
+                continue
+            for i in indexed:
+                if item[i] is not None:
+                    item[i] = values[item[i]]
+            yield dict(zip(fields, item))
+
+
+def find_chunk_files(inputs: Iterable[str]) -> Iterator[str]:
+    """
+    Resolve chunk files, directories and glob patterns to chunk file paths.
+
+    Directories are searched recursively for .json and .jsonl files
+    (including .compact.jsonl); hidden files such as chunk_markdown.py's
+    manifest are skipped. Files given directly are used whatever their name.
+    """
+    for input_path in inputs:
+        matches = glob.glob(input_path, recursive=True) if glob.has_magic(input_path) else [input_path]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                    for filename in sorted(files):
+                        if filename.endswith(CHUNK_FILE_EXTENSIONS) and not filename.startswith('.'):
+                            yield os.path.join(root, filename)
+            elif os.path.isfile(match):
+                yield match
+
+
+def journal_path(config: Dict[str, Any], collection_name: str) -> str:
+    """Path of the checkpoint journal of an upload to collection_name (see DEFAULT_JOURNAL_PATH)."""
+    return (config.get('checkpoint_journal') or DEFAULT_JOURNAL_PATH).replace('{collection}', collection_name)
+
+
+def qdrant_connection_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Keyword arguments for QdrantClient / AsyncQdrantClient from the config."""
+    host = config.get('qdrant_host', 'localhost')
+    api_key = config.get('qdrant_api_key')
+    
+    # In-process instance, e.g. for tests
+    if host == ':memory:':
+        return {'location': ':memory:'}
+    # Cloud connection (URL contains https://) - use URL directly
+    if host.startswith('https://'):
+        return {'url': host, 'api_key': api_key}
+    # Local connection - use host and port
+    kwargs = {'host': host, 'port': config.get('qdrant_port', 6333)}
+    if api_key:
+        kwargs['api_key'] = api_key
+    return kwargs
+
+
+def describe_qdrant_connection(config: Dict[str, Any]) -> str:
+    """Human-readable location of the Qdrant instance in the config, for logging."""
+    host = config.get('qdrant_host', 'localhost')
+    if host == ':memory:' or host.startswith('https://'):
+        return host
+    return f"{host}:{config.get('qdrant_port', 6333)}"
+
+
+QUANTIZATION_MODES = ('none', 'scalar', 'binary', 'product')
+
+# Heading path payload fields of every chunk entry, indexed for filtered search
+PAYLOAD_INDEX_FIELDS = ('source_file', 'chapter_name', 'section_name', 'subsection_name')
+
+# Payload fields indexed by default: the heading path, the sentence ordinal
+# that neighbouring sentences are looked up by, and the links of
+# hierarchical records to the section and chunk they belong to
+DEFAULT_PAYLOAD_INDEXES = PAYLOAD_INDEX_FIELDS + ('sentence_index', 'section_id', 'parent_id')
+
+# Index types of payload fields that aren't keywords
+PAYLOAD_INDEX_SCHEMAS = {'sentence_index': models.PayloadSchemaType.INTEGER}
+
+# Record levels of hierarchical chunk files (chunk_markdown.py --strategy
+# hierarchical), coarsest first
+HIERARCHY_LEVELS = ('section', 'chunk', 'sentence')
+
+# Payload fields placing a point in its file and hierarchy, which change
+# when text is inserted or edited around it (see sync_to_qdrant)
+STRUCTURE_FIELDS = ('sentence_index', 'chunk_index', 'section_index', 'parent_id', 'section_id')
+
+
+def level_collection(config: Dict[str, Any], level: Optional[str] = None) -> str:
+    """
+    Name of the collection holding points of a record level: sentences (and
+    records without a level) go to collection_name, chunks and sections to
+    its "_chunks" and "_sections" siblings.
+    """
+    name = config.get('collection_name', 'default_collection')
+    if level is None or level == 'sentence':
+        return name
+    if level not in HIERARCHY_LEVELS:
+        raise ValueError(f"Unknown record level {level!r}, expected one of {', '.join(HIERARCHY_LEVELS)}")
+    return f"{name}_{level}s"
+
+
+def collection_names(config: Dict[str, Any]) -> List[str]:
+    """Collections the config uploads to: collection_name, plus its siblings if hierarchical is set."""
+    if not config.get('hierarchical'):
+        return [level_collection(config)]
+    return [level_collection(config, level) for level in reversed(HIERARCHY_LEVELS)]
+
+
+def payload_index_fields(config: Dict[str, Any]) -> List[Tuple[str, models.PayloadSchemaType]]:
+    """
+    (field, index type) of the payload fields to index (payload_indexes in
+    the config; none in local mode).
+    """
+    if config.get('qdrant_host') == ':memory:':
+        # Payload indexes have no effect in the in-process Qdrant
+        return []
+    return [
+        (field, PAYLOAD_INDEX_SCHEMAS.get(field, models.PayloadSchemaType.KEYWORD))
+        for field in config.get('payload_indexes', DEFAULT_PAYLOAD_INDEXES)
+    ]
+
+
+def quantization_config(config: Dict[str, Any]) -> Optional[models.QuantizationConfig]:
+    """Quantization of the stored vectors chosen by quantization in the config, if any."""
+    mode = config.get('quantization') or 'none'
+    always_ram = config.get('quantization_always_ram', True)
+    if mode == 'none':
+        return None
+    if mode == 'scalar':
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=config.get('quantization_quantile'),
+            always_ram=always_ram
+        ))
+    if mode == 'binary':
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    if mode == 'product':
+        return models.ProductQuantization(product=models.ProductQuantizationConfig(
+            compression=models.CompressionRatio(config.get('product_compression', 'x16')),
+            always_ram=always_ram
+        ))
+    raise ValueError(f"Unknown quantization {mode!r}, expected one of {', '.join(QUANTIZATION_MODES)}")
+
+
+def collection_params(config: Dict[str, Any], vector_size: int) -> Dict[str, Any]:
+    """
+    Keyword arguments of create_collection for the collection settings in
+    the config: vector storage (vectors_on_disk), quantization, HNSW graph
+    (hnsw_m, hnsw_ef_construct), payload storage (payload_on_disk) and
+    distribution (shard_number, replication_factor). Unset settings keep
+    Qdrant's defaults.
+    """
+    params = {
+        'vectors_config': VectorParams(
+            size=vector_size,
+            distance=Distance.COSINE,
+            on_disk=config.get('vectors_on_disk')
+        ),
+        'quantization_config': quantization_config(config),
+        'on_disk_payload': config.get('payload_on_disk'),
+        'shard_number': config.get('shard_number'),
+        'replication_factor': config.get('replication_factor'),
+    }
+    if config.get('hnsw_m') is not None or config.get('hnsw_ef_construct') is not None:
+        params['hnsw_config'] = models.HnswConfigDiff(m=config.get('hnsw_m'),
+                                                      ef_construct=config.get('hnsw_ef_construct'))
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def estimate_collection_memory(config: Dict[str, Any], vector_size: int, points: int) -> Dict[str, int]:
+    """
+    Rough bytes of RAM and disk a collection with these settings needs for
+    points vectors: float32 vectors, their quantized copies and the HNSW
+    links (about 2 * m four-byte links per point). Payload and indexes
+    are not included.
+    """
+    vectors = points * vector_size * 4
+    mode = config.get('quantization') or 'none'
+    if mode == 'scalar':
+        quantized = points * vector_size
+    elif mode == 'binary':
+        quantized = points * ((vector_size + 7) // 8)
+    elif mode == 'product':
+        ratio = int(str(config.get('product_compression', 'x16')).lstrip('x'))
+        quantized = points * vector_size * 4 // ratio
+    else:
+        quantized = 0
+    graph = points * 2 * (config.get('hnsw_m') or 16) * 4
+    vectors_on_disk = bool(config.get('vectors_on_disk'))
+    quantized_in_ram = quantized if config.get('quantization_always_ram', True) or not vectors_on_disk else 0
+    return {
+        'ram': (0 if vectors_on_disk else vectors) + quantized_in_ram + graph,
+        'disk': vectors + quantized + graph,
+    }
+
+
+def build_payload(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Qdrant payload (metadata) for a chunk entry, without None values."""
+    payload = {
+        'text': entry['text'],
+        'source_file': entry.get('source_file', ''),
+        'chapter_name': entry.get('chapter_name', ''),
+        'section_name': entry.get('section_name', ''),
+        'subsection_name': entry.get('subsection_name', ''),
+        'sentence_index': entry.get('sentence_index'),
+        'level': entry.get('level'),
+        'section_index': entry.get('section_index'),
+        'chunk_index': entry.get('chunk_index'),
+        'parent_id': entry.get('parent_id'),
+        'section_id': entry.get('section_id'),
+        'split_from': entry.get('split_from'),
+        'piece_index': entry.get('piece_index')
+    }
+    return {k: v for k, v in payload.items() if v is not None}
+
+
+def point_id(entry: Dict[str, Any]) -> str:
+    """
+    Deterministic point ID of a chunk entry: a UUIDv5 of its source file,
+    heading path and text, so re-uploading unchanged entries overwrites the
+    same points regardless of their position in the file. Section and chunk
+    records also hash their level, so they don't share an ID with a
+    sentence of the same text, and repeats of a record in the same file hash
+    their occurrence (see link_entry), so they don't collapse into one point.
+
+    Pieces of a text too long to embed in one go (see TokenBatcher) get IDs
+    derived from their entry's ID and their piece_index, so an unchanged
+    entry maps to the same pieces on every upload.
+    """
+    if entry.get('split_from') is not None:
+        return str(uuid.uuid5(uuid.UUID(entry['split_from']), str(entry.get('piece_index', 0))))
+    fields = ('source_file', 'chapter_name', 'section_name', 'subsection_name', 'text')
+    if entry.get('level') not in (None, 'sentence'):
+        fields += ('level',)
+    key = '\x1f'.join(entry.get(field) or '' for field in fields)
+    if entry.get('occurrence'):
+        key += f"\x1f{entry['occurrence']}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+
+def link_hierarchy(entries: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Set section_id and parent_id of hierarchical entries to the point IDs of
+    the section and chunk records before them (chunk_markdown.py writes
+    each record ahead of those it contains), and number repeats of a record
+    within its source file in occurrence, so that point_id tells them apart.
+    Entries already linked by an earlier pass keep their links and
+    occurrence, so a stream can be filtered after linking.
+    """
+    state = {}
+    for entry in entries:
+        yield link_entry(entry, state)
+
+
+def link_entry(entry: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Link one entry of a stream (see link_hierarchy); state holds the point
+    IDs of the current section and chunk and the records seen so far in the
+    current source file, and is updated for the next entry.
+    """
+    source_file = entry.get('source_file') or ''
+    if state.get('source_file') != source_file:
+        state.clear()
+        state['source_file'] = source_file
+        state['seen'] = {}
+    if 'occurrence' not in entry:
+        # Entries of a file are contiguous, so only its records need counting
+        seen = state['seen']
+        base_id = point_id(entry)
+        entry['occurrence'] = seen.get(base_id, 0)
+        seen[base_id] = entry['occurrence'] + 1
+
+    level = entry.get('level')
+    if level == 'section':
+        state.pop('chunk', None)
+        state['section'] = point_id(entry)
+    elif level is not None:
+        entry.setdefault('section_id', state.get('section'))
+        entry.setdefault('parent_id', state.get('section' if level == 'chunk' else 'chunk'))
+        if level == 'chunk':
+            state['chunk'] = point_id(entry)
+    return entry
+
+
+def make_points(batch: List[Dict[str, Any]],
+                embeddings: List[Optional[List[float]]]) -> List[models.PointStruct]:
+    """
+    Pair a batch of entries with their index-aligned embeddings as Qdrant
+    points, leaving out entries without an embedding (None).
+    """
+    if len(embeddings) != len(batch):
+        raise ValueError(f"Got {len(embeddings)} embeddings for {len(batch)} entries")
+    return [
+        models.PointStruct(id=point_id(entry), vector=embedding, payload=build_payload(entry))
+        for entry, embedding in zip(batch, embeddings)
+        if embedding is not None
+    ]
+
+
+def duplicate_metadata(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload of an entry without its text, as listed under 'duplicates' by merge dedup."""
+    return {k: v for k, v in build_payload(entry).items() if k != 'text'}
+
+
+def resolve_duplicates(group: Dict[str, List[Dict[str, Any]]], found: Dict[str, Optional[List[float]]],
+                       mode: str) -> Tuple[List[models.PointStruct], Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Turn duplicates held back by a TextDeduplicator into Qdrant writes.
+
+    group maps first occurrence point IDs to their duplicates, found maps
+    the IDs of those first occurrences that are in the collection to their
+    vectors. Returns the points of fanned-out duplicates, the payload
+    updates of merged first occurrences and the duplicates whose first
+    occurrence is missing (e.g. it was split for being too long), which
+    have to be embedded themselves.
+    """
+    points = []
+    payloads = {}
+    unresolved = []
+    for first_id, entries in group.items():
+        if first_id not in found:
+            unresolved.extend(entries)
+        elif mode == 'merge':
+            payloads[first_id] = {'duplicates': [duplicate_metadata(entry) for entry in entries]}
+        else:
+            points.extend(make_points(entries, [found[first_id]] * len(entries)))
+    return points, payloads, unresolved
+
+
+def embeddable_text(text: Any) -> Optional[str]:
+    """The text to embed for an entry's text: stripped, or None if it is empty or not a string."""
+    if not isinstance(text, str):
+        return None
+    return text.strip() or None
+
+
+def lookup_embeddings(texts: List[Any], cache: Optional[EmbeddingCache],
+                      model: str) -> Tuple[List[Optional[str]], List[Optional[List[float]]], List[int]]:
+    """
+    First step of embedding a batch of texts: clean them with
+    embeddable_text and look them up in the cache.
+
+    Returns the cleaned texts, index-aligned embeddings found so far (None
+    elsewhere) and the indices of the texts still to send to the API.
+    """
+    cleaned = [embeddable_text(text) for text in texts]
+    embeddings = [None] * len(texts)
+    valid = [i for i, text in enumerate(cleaned) if text is not None]
+    if cache is not None and valid:
+        for i, embedding in zip(valid, cache.get_many(model, [cleaned[i] for i in valid])):
+            embeddings[i] = embedding
+    missing = [i for i in valid if embeddings[i] is None]
+    return cleaned, embeddings, missing
+
+
+def store_embeddings(embeddings: List[Optional[List[float]]], missing: List[int], cleaned: List[Optional[str]],
+                     vectors: List[List[float]], cache: Optional[EmbeddingCache],
+                     model: str) -> List[Optional[List[float]]]:
+    """
+    Second step of embedding a batch: put the vectors generated for the
+    missing indices into place and into the cache.
+    """
+    if len(vectors) != len(missing):
+        raise ValueError(f"Embeddings API returned {len(vectors)} vectors for {len(missing)} texts")
+    for i, vector in zip(missing, vectors):
+        embeddings[i] = vector
+    if cache is not None:
+        cache.put_many(model, [cleaned[i] for i in missing], vectors)
+    return embeddings
+
+
+def make_token_batcher(config: Dict[str, Any], batch_size: int, embedding_model: str) -> TokenBatcher:
+    """
+    Batcher packing up to batch_size entries and batch_max_tokens tokens per
+    embedding request; texts over max_input_tokens are split.
+    """
+    return TokenBatcher(
+        max_tokens=config.get('batch_max_tokens', DEFAULT_BATCH_MAX_TOKENS),
+        max_items=batch_size,
+        max_input_tokens=config.get('max_input_tokens', DEFAULT_MAX_INPUT_TOKENS),
+        count_tokens=get_token_counter(embedding_model),
+        entry_id=point_id
+    )
+
+
+def open_embedding_cache(config: Dict[str, Any]) -> Optional[EmbeddingCache]:
+    """Open the embedding cache named by embedding_cache in the config, if any."""
+    cache_path = config.get('embedding_cache')
+    if not cache_path:
+        return None
+    try:
+        cache = EmbeddingCache(cache_path, max_entries=config.get('embedding_cache_max_entries', 1_000_000))
+        logger.info(f"Using embedding cache {cache_path} ({cache.stats['entries']} entries)")
+        return cache
+    except Exception as e:
+        logger.error(f"Failed to open embedding cache: {e}")
+        raise
+
+
+def log_rate_controller_stats(controller: Optional[RateController]):
+    """Log request, retry and rate limit counts of a rate controller."""
+    if controller is None:
+        return
+    stats = controller.stats
+    logger.info(
+        f"Embedding requests: {stats['requests']} sent, {stats['retries']} retried, "
+        f"{stats['rate_limited']} rate limited, {stats['waited']:.1f}s waiting; "
+        f"concurrency limit now {int(controller.limit)}"
+    )
+
+
+def log_cache_stats(cache: Optional[EmbeddingCache]):
+    """Log hit/miss statistics of an embedding cache."""
+    if cache is None:
+        return
+    stats = cache.stats
+    logger.info(
+        f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.1%} hit rate), {stats['entries']} entries, "
+        f"{stats['evictions']} evicted"
+    )
+
 
 class QdrantUploader:
     """Handles uploading of chunked JSON files to Qdrant vector database."""
@@ -53,193 +613,506 @@ class QdrantUploader:
         """Initialize the uploader with configuration."""
         self.config = config
         self.client = None
-        self.openai_client = None
+        self.embedding_backend = None
         self.embedding_model_name = None
+        self.embedding_cache = None
+        self.embedding_spend = EmbeddingSpend()
+        self.rate_controller = None
         self.collection_name = config.get('collection_name', 'default_collection')
+        # Sentence collection first, then the chunk and section ones if hierarchical
+        self.collection_names = collection_names(config)
         
         # Initialize Qdrant client
         self._init_qdrant_client()
         
-        # Initialize OpenAI client and embedding model
-        self._init_openai_client()
+        # Initialize the embedding backend and model
+        self._init_embedding_backend()
+        
+        # Optional persistent cache of embeddings from earlier runs
+        self._init_embedding_cache()
     
     def _init_qdrant_client(self):
         """Initialize Qdrant client connection."""
         try:
-            host = self.config.get('qdrant_host', 'localhost')
-            port = self.config.get('qdrant_port', 6333)
-            api_key = self.config.get('qdrant_api_key')
-            
-            # Check if this is a cloud connection (URL contains https://)
-            if host.startswith('https://'):
-                # Cloud connection - use URL directly
-                self.client = QdrantClient(url=host, api_key=api_key)
-                logger.info(f"Connected to Qdrant Cloud at {host}")
-            else:
-                # Local connection - use host and port
-                if api_key:
-                    self.client = QdrantClient(host=host, port=port, api_key=api_key)
-                else:
-                    self.client = QdrantClient(host=host, port=port)
-                logger.info(f"Connected to Qdrant at {host}:{port}")
+            self.client = QdrantClient(**qdrant_connection_kwargs(self.config))
+            logger.info(f"Connected to Qdrant at {describe_qdrant_connection(self.config)}")
             
         except Exception as e:
             logger.error(f"Failed to connect to Qdrant: {e}")
             raise
     
-    def _init_openai_client(self):
-        """Initialize the OpenAI client for embeddings."""
+    def _init_embedding_backend(self):
+        """Initialize the embedding backend chosen by embedding_backend (OpenAI by default)."""
         try:
-            # Initialize OpenAI client - API key should be set via OPENAI_API_KEY environment variable
-            self.openai_client = OpenAI()
-            
-            # Set embedding model name
-            self.embedding_model_name = self.config.get('embedding_model', 'text-embedding-3-small')
-            logger.info(f"Initialized OpenAI client with embedding model: {self.embedding_model_name}")
+            self.embedding_backend = create_embedding_backend(self.config, self.embedding_spend)
+            self.embedding_model_name = self.embedding_backend.model_name
+            self.rate_controller = self.embedding_backend.rate_controller
+            logger.info(
+                f"Initialized {self.config.get('embedding_backend', 'openai')} embedding backend "
+                f"with model: {self.embedding_model_name}"
+            )
             
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {e}")
-            logger.error("Make sure OPENAI_API_KEY environment variable is set")
+            logger.error(f"Failed to initialize embedding backend: {e}")
+            if self.config.get('embedding_backend', 'openai') == 'openai':
+                logger.error("Make sure OPENAI_API_KEY environment variable is set")
             raise
     
+    def _init_embedding_cache(self):
+        """Open the persistent embedding cache if embedding_cache is set in the config."""
+        self.embedding_cache = open_embedding_cache(self.config)
+    
+    def log_cache_stats(self):
+        """Log hit/miss statistics of the embedding cache, if any."""
+        log_cache_stats(self.embedding_cache)
+    
     def create_collection(self, vector_size: int = 1536, recreate: bool = False):
-        """Create or recreate the collection in Qdrant."""
+        """
+        Create or recreate the collection in Qdrant (and, if hierarchical is
+        set, its chunk and section siblings).
+        """
         try:
-            if recreate:
-                # Delete existing collection if it exists
-                try:
-                    self.client.delete_collection(self.collection_name)
-                    logger.info(f"Deleted existing collection: {self.collection_name}")
-                except Exception:
-                    pass  # Collection might not exist
-            
-            # Create new collection
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=vector_size,
-                    distance=Distance.COSINE
+            for collection_name in self.collection_names:
+                if recreate:
+                    # Delete existing collection if it exists
+                    try:
+                        self.client.delete_collection(collection_name)
+                        logger.info(f"Deleted existing collection: {collection_name}")
+                    except Exception:
+                        pass  # Collection might not exist
+                elif self.client.collection_exists(collection_name):
+                    # Keep existing points so re-uploads can update them in place
+                    logger.info(f"Using existing collection: {collection_name}")
+                    continue
+                
+                # Create new collection
+                self.client.create_collection(
+                    collection_name=collection_name,
+                    **collection_params(self.config, vector_size)
                 )
-            )
-            logger.info(f"Created collection: {self.collection_name}")
+                logger.info(
+                    f"Created collection: {collection_name} "
+                    f"(quantization: {self.config.get('quantization') or 'none'}, "
+                    f"vectors on disk: {bool(self.config.get('vectors_on_disk'))})"
+                )
+                self.create_payload_indexes(collection_name)
             
         except Exception as e:
             logger.error(f"Failed to create collection: {e}")
             raise
     
-    def load_json_data(self, json_file_path: str) -> List[Dict[str, Any]]:
-        """Load and validate JSON data from file."""
+    def create_payload_indexes(self, collection_name: Optional[str] = None):
+        """Create indexes on the heading path fields, sentence ordinal and hierarchy links, for filtered search."""
+        collection_name = collection_name or self.collection_name
+        for field, schema in payload_index_fields(self.config):
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=schema
+            )
+            logger.info(f"Created payload index on {field} of {collection_name}")
+    
+    def point_collection(self, payload: Dict[str, Any]) -> str:
+        """Collection a point belongs in, by the level in its payload."""
+        collection_name = level_collection(self.config, payload.get('level'))
+        if collection_name not in self.collection_names:
+            raise ValueError(
+                f"Got {payload.get('level')} records; set hierarchical to upload hierarchical chunk files"
+            )
+        return collection_name
+    
+    def iter_json_data(self, json_file_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Stream and validate entries from a JSON, JSON Lines or compact chunk
+        file, yielding only entries with non-empty text.
+        """
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if not isinstance(data, list):
-                raise ValueError("JSON data must be a list of objects")
-            
-            # Validate each entry has required fields
-            required_fields = ['text']
-            for i, entry in enumerate(data):
+            loaded = 0
+            skipped = 0
+            for i, entry in enumerate(iter_json_records(json_file_path)):
                 if not isinstance(entry, dict):
                     raise ValueError(f"Entry {i} must be a dictionary")
                 
                 if 'text' not in entry:
                     raise ValueError(f"Entry {i} missing required field 'text'")
                 
-                if not entry['text'].strip():
+                if embeddable_text(entry['text']) is None:
                     logger.warning(f"Entry {i} has empty text, skipping")
+                    skipped += 1
                     continue
+                
+                loaded += 1
+                yield entry
             
-            logger.info(f"Loaded {len(data)} entries from {json_file_path}")
-            return data
+            logger.info(f"Loaded {loaded} entries from {json_file_path} ({skipped} skipped)")
             
         except Exception as e:
             logger.error(f"Failed to load JSON data: {e}")
             raise
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts using OpenAI."""
+    def iter_files_data(self, json_file_paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Stream validated entries from several chunk files as one sequence."""
+        for json_file_path in json_file_paths:
+            yield from self.iter_json_data(json_file_path)
+    
+    def load_json_data(self, json_file_path: str) -> List[Dict[str, Any]]:
+        """Load and validate JSON, JSON Lines or compact chunk data from file."""
+        return list(self.iter_json_data(json_file_path))
+    
+    def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Generate embeddings for a list of texts with the embedding backend.
+
+        The result is aligned with texts: None for texts that can't be
+        embedded (see embeddable_text). Only texts missing from the embedding
+        cache (if one is configured) are sent to the backend.
+        """
         try:
-            # Filter out empty texts
-            valid_texts = [text.strip() for text in texts if text.strip()]
-            
-            if not valid_texts:
-                return []
+            cleaned, embeddings, missing = lookup_embeddings(texts, self.embedding_cache, self.embedding_model_name)
+            if not missing:
+                return embeddings
             
-            logger.info(f"Generating embeddings for {len(valid_texts)} texts using OpenAI {self.embedding_model_name}")
+            logger.info(f"Generating embeddings for {len(missing)} texts using {self.embedding_model_name}")
             
-            # Generate embeddings using OpenAI API
-            response = self.openai_client.embeddings.create(
-                input=valid_texts,
-                model=self.embedding_model_name
-            )
-            
-            # Extract embedding vectors from response
-            embeddings = [embedding.embedding for embedding in response.data]
+            vectors = self.embedding_backend.embed([cleaned[i] for i in missing])
             
-            logger.info(f"Generated embeddings for {len(embeddings)} texts")
-            return embeddings
+            logger.info(f"Generated embeddings for {len(vectors)} texts")
+            return store_embeddings(embeddings, missing, cleaned, vectors,
+                                    self.embedding_cache, self.embedding_model_name)
             
         except Exception as e:
             logger.error(f"Failed to generate embeddings: {e}")
             raise
     
-    def upload_to_qdrant(self, data: List[Dict[str, Any]], batch_size: int = 100):
-        """Upload data to Qdrant in batches."""
-        try:
-            total_entries = len(data)
-            uploaded_count = 0
-            
-            # Process in batches
-            for i in range(0, total_entries, batch_size):
-                batch = data[i:i + batch_size]
-                batch_texts = [entry['text'] for entry in batch]
-                
-                # Generate embeddings for this batch
-                batch_embeddings = self.generate_embeddings(batch_texts)
-                
-                if not batch_embeddings:
-                    logger.warning(f"Batch {i//batch_size + 1}: No valid embeddings generated")
+    def _build_points(self, batch: List[Dict[str, Any]]) -> List[models.PointStruct]:
+        """Embed a batch of entries and turn them into Qdrant points."""
+        batch_texts = [entry['text'] for entry in batch]
+        
+        # Generate embeddings for this batch
+        batch_embeddings = self.generate_embeddings(batch_texts)
+        
+        return make_points(batch, batch_embeddings)
+    
+    def _upsert_points(self, batch_number: int, points: List[models.PointStruct],
+                       journal: Optional[UploadJournal] = None,
+                       spend_start: Optional[Dict[str, int]] = None) -> int:
+        """
+        Upload one batch of points to Qdrant, each to the collection of its
+        level, then record it in the journal.
+        """
+        by_collection = {}
+        for point in points:
+            by_collection.setdefault(self.point_collection(point.payload), []).append(point)
+        for collection_name, collection_points in by_collection.items():
+            self.client.upsert(
+                collection_name=collection_name,
+                points=collection_points
+            )
+        logger.info(f"Uploaded batch {batch_number}: {len(points)} points")
+        if journal is not None:
+            journal.record_batch(batch_number, [point.id for point in points],
+                                 self.embedding_spend.snapshot(since=spend_start))
+        return len(points)
+    
+    def _upload_duplicates(self, dedup: TextDeduplicator, batch_number: int, batch_size: int,
+                           journal: Optional[UploadJournal] = None,
+                           spend_start: Optional[Dict[str, int]] = None) -> int:
+        """
+        Write the duplicates dedup held back, once their first occurrences
+        are in Qdrant: fanned-out points reuse the stored vectors, merged
+        ones become payload updates. Batches are numbered on from
+        batch_number. Returns the number of points written.
+        """
+        uploaded_count = 0
+        unresolved = []
+        for group in dedup.groups(batch_size):
+            if journal is not None:
+                group = {first_id: pending for first_id, entries in group.items()
+                         if (pending := [entry for entry in entries if not journal.is_completed(point_id(entry))])}
+                if not group:
                     continue
-                
-                # Prepare points for upload
-                points = []
-                for j, (entry, embedding) in enumerate(zip(batch, batch_embeddings)):
-                    point_id = i + j
-                    
-                    # Prepare payload (metadata)
-                    payload = {
-                        'text': entry['text'],
-                        'source_file': entry.get('source_file', ''),
-                        'chapter_name': entry.get('chapter_name', ''),
-                        'section_name': entry.get('section_name', ''),
-                        'subsection_name': entry.get('subsection_name', '')
-                    }
-                    
-                    # Remove None values
-                    payload = {k: v for k, v in payload.items() if v is not None}
-                    
-                    points.append(models.PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload=payload
-                    ))
-                
-                # Upload batch to Qdrant
-                self.client.upsert(
+            # First occurrences may be in any collection (a sentence can repeat its section's text)
+            found = {}
+            for collection_name in self.collection_names:
+                records = self.client.retrieve(
+                    collection_name=collection_name,
+                    ids=list(group),
+                    with_payload=False,
+                    with_vectors=dedup.mode == 'fanout'
+                )
+                found.update((str(r.id), r.vector) for r in records)
+            points, payloads, missing = resolve_duplicates(group, found, dedup.mode)
+            if points:
+                batch_number += 1
+                uploaded_count += self._upsert_points(batch_number, points, journal, spend_start)
+            if payloads:
+                # Merge dedup only runs on flat uploads, which have one collection
+                self.client.batch_update_points(
                     collection_name=self.collection_name,
-                    points=points
+                    update_operations=[
+                        models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[first_id]))
+                        for first_id, payload in payloads.items()
+                    ]
                 )
-                
-                uploaded_count += len(points)
-                logger.info(f"Uploaded batch {i//batch_size + 1}: {len(points)} points")
+                logger.info(f"Merged duplicates into {len(payloads)} points")
+            unresolved.extend(missing)
+        
+        if unresolved:
+            logger.info(f"Embedding {len(unresolved)} duplicates whose first occurrence wasn't uploaded")
+            batcher = make_token_batcher(self.config, batch_size, self.embedding_model_name)
+            for batch in batcher.batches(unresolved):
+                points = self._build_points(batch)
+                if points:
+                    batch_number += 1
+                    uploaded_count += self._upsert_points(batch_number, points, journal, spend_start)
+        return uploaded_count
+    
+    def upload_to_qdrant(self, data: Iterable[Dict[str, Any]], batch_size: int = 100,
+                         embedding_concurrency: Optional[int] = None,
+                         upsert_concurrency: Optional[int] = None,
+                         max_pending_batches: Optional[int] = None,
+                         journal: Optional[UploadJournal] = None,
+                         dedup: Optional[str] = None):
+        """
+        Upload data to Qdrant in batches.
+
+        data can be any iterable of entries, e.g. iter_json_data(). Batches
+        hold up to batch_size entries and batch_max_tokens tokens of text
+        (see make_token_batcher). Embedding
+        and upserting run as a pipeline: up to embedding_concurrency embedding
+        requests are in flight while earlier batches are upserted by up to
+        upsert_concurrency workers, with at most max_pending_batches embedded
+        batches waiting for an upsert worker. When either stage is full,
+        reading further batches blocks, so memory stays bounded by a few
+        batches. Unset limits come from the config.
+
+        With a journal, entries whose points it lists as uploaded are left
+        out of their batches (batches left empty are skipped) and each batch
+        is recorded once upserted, so a failed upload can be resumed.
+
+        dedup (default: the dedup setting, 'fanout') picks how entries
+        repeating an earlier text are handled; see text_dedup. Their points
+        are written after all other batches.
+
+        Hierarchical entries (see link_hierarchy) are linked to their section
+        and chunk and upserted into the collection of their level. Merging
+        would drop sentences their chunks link to, so they are fanned out.
+        """
+        if embedding_concurrency is None:
+            embedding_concurrency = self.config.get('embedding_concurrency', 4)
+        if upsert_concurrency is None:
+            upsert_concurrency = self.config.get('upsert_concurrency', 1)
+        if max_pending_batches is None:
+            max_pending_batches = self.config.get('max_pending_batches', 2)
+        if dedup is None:
+            dedup = self.config.get('dedup', 'fanout')
+        if dedup == 'merge' and self.config.get('hierarchical'):
+            logger.warning("Using dedup 'fanout': merged duplicates would leave hierarchy links dangling")
+            dedup = 'fanout'
+        
+        deduplicator = TextDeduplicator(dedup, entry_id=point_id)
+        batcher = make_token_batcher(self.config, batch_size, self.embedding_model_name)
+        spend_start = self.embedding_spend.snapshot()
+        batch_number = 0
+        uploaded_count = 0
+        skipped_count = 0
+        # Futures of batches being embedded / upserted, oldest first
+        embedding = deque()
+        upserting = deque()
+        
+        def start_upsert(batch_number, future):
+            """Hand the oldest embedded batch to the upsert stage, waiting if it is full."""
+            nonlocal uploaded_count
+            points = future.result()
+            if not points:
+                logger.warning(f"Batch {batch_number}: No valid embeddings generated")
+                return
+            upserting.append(upsert_pool.submit(self._upsert_points, batch_number, points, journal, spend_start))
+            while len(upserting) > upsert_concurrency + max_pending_batches:
+                uploaded_count += upserting.popleft().result()
+        
+        try:
+            with ThreadPoolExecutor(embedding_concurrency, thread_name_prefix='embed') as embed_pool, \
+                    ThreadPoolExecutor(upsert_concurrency, thread_name_prefix='upsert') as upsert_pool:
+                try:
+                    # Process in batches
+                    for batch in batcher.batches(deduplicator.filter(link_hierarchy(data))):
+                        batch_number += 1
+                        if journal is not None:
+                            pending = [entry for entry in batch if not journal.is_completed(point_id(entry))]
+                            skipped_count += len(batch) - len(pending)
+                            if not pending:
+                                continue
+                            batch = pending
+                        embedding.append((batch_number, embed_pool.submit(self._build_points, batch)))
+                        # Move finished batches on in order; block while too many are in flight
+                        while embedding and (len(embedding) > embedding_concurrency or embedding[0][1].done()):
+                            start_upsert(*embedding.popleft())
+                    
+                    while embedding:
+                        start_upsert(*embedding.popleft())
+                    while upserting:
+                        uploaded_count += upserting.popleft().result()
+                except BaseException:
+                    # Don't start queued work once a batch has failed
+                    for _, future in embedding:
+                        future.cancel()
+                    for future in upserting:
+                        future.cancel()
+                    raise
+            
+            uploaded_count += self._upload_duplicates(deduplicator, batch_number, batch_size, journal, spend_start)
             
             logger.info(f"Successfully uploaded {uploaded_count} points to collection '{self.collection_name}'")
+            batcher.log_summary()
+            deduplicator.log_summary()
+            log_rate_controller_stats(self.rate_controller)
+            self.log_cache_stats()
+            spend = self.embedding_spend.snapshot(since=spend_start)
+            if journal is not None:
+                journal.record_complete(uploaded_count, spend)
+                logger.info(f"Skipped {skipped_count} entries uploaded by earlier runs")
+                spend = journal.total_spend(spend)
+            logger.info(
+                f"Embedding spend: {spend['requests']} requests, {spend['texts']} texts, {spend['tokens']} tokens"
+            )
             return uploaded_count
             
         except Exception as e:
             logger.error(f"Failed to upload to Qdrant: {e}")
             raise
     
+    def fetch_point_payloads(self, fields: List[str], page_size: int = 1000) -> Dict[str, Dict[str, Any]]:
+        """Map the ID of every point in the collection(s) to the given fields of its payload."""
+        payloads = {}
+        for collection_name in self.collection_names:
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=fields,
+                    with_vectors=False
+                )
+                for point in points:
+                    payloads[str(point.id)] = point.payload or {}
+                if offset is None:
+                    break
+        return payloads
+    
+    def renumber_points(self, structure: Dict[str, Dict[str, Any]], batch_size: int = 1000) -> int:
+        """
+        Set the structure fields (see STRUCTURE_FIELDS) of existing points,
+        given as point ID -> payload including the point's level, in batches.
+        """
+        by_collection = {}
+        for existing_id, payload in structure.items():
+            update = {k: v for k, v in payload.items() if k != 'level' and v is not None}
+            by_collection.setdefault(self.point_collection(payload), []).append((existing_id, update))
+        for collection_name, items in by_collection.items():
+            for start in range(0, len(items), batch_size):
+                self.client.batch_update_points(
+                    collection_name=collection_name,
+                    update_operations=[
+                        models.SetPayloadOperation(set_payload=models.SetPayload(
+                            payload=update, points=[existing_id]
+                        ))
+                        for existing_id, update in items[start:start + batch_size]
+                    ]
+                )
+        return len(structure)
+    
+    def delete_points(self, point_ids: List[str], batch_size: int = 1000) -> int:
+        """Delete points by ID from the collection(s), in batches."""
+        for collection_name in self.collection_names:
+            for start in range(0, len(point_ids), batch_size):
+                self.client.delete(
+                    collection_name=collection_name,
+                    points_selector=models.PointIdsList(points=point_ids[start:start + batch_size])
+                )
+        return len(point_ids)
+    
+    def sync_to_qdrant(self, data: Iterable[Dict[str, Any]], batch_size: int = 100,
+                       prune_other_sources: bool = False,
+                       journal: Optional[UploadJournal] = None) -> Dict[str, int]:
+        """
+        Bring the collection in line with data, embedding only what changed.
+
+        Entries whose point ID (see point_id()) is already in the collection
+        are skipped, as are entries split for length whose pieces all are;
+        new ones are embedded and upserted, and points that are
+        no longer in data are deleted. Only points from source files present
+        in data are deleted, unless prune_other_sources is set, so one file
+        can be synced into a collection holding others. Returns counts of
+        uploaded, unchanged and deleted points.
+
+        Unchanged points whose sentence_index moved (e.g. a sentence was
+        inserted before them) get the new one without being embedded again,
+        as do hierarchical points whose chunk or section changed.
+
+        Merge dedup can't be tracked point by point, so duplicates are
+        fanned out instead.
+        """
+        dedup = self.config.get('dedup', 'fanout')
+        if dedup == 'merge':
+            logger.warning("Syncing with dedup 'fanout': merged duplicates have no points to compare")
+            dedup = 'fanout'
+        try:
+            existing = self.fetch_point_payloads(['source_file', 'level', *STRUCTURE_FIELDS])
+            logger.info(f"Collection '{self.collection_name}' has {len(existing)} points")
+            
+            seen_ids = set()
+            seen_sources = set()
+            moved = {}
+            unchanged_count = 0
+            
+            # Tells which pieces an entry too long to embed whole was stored as
+            splitter = make_token_batcher(self.config, batch_size, self.embedding_model_name)
+            
+            def new_entries():
+                nonlocal unchanged_count
+                # Link before skipping unchanged entries, whose children may still change
+                for entry in link_hierarchy(data):
+                    seen_sources.add(entry.get('source_file') or '')
+                    entry_id = point_id(entry)
+                    if entry_id in seen_ids:
+                        continue
+                    seen_ids.add(entry_id)
+                    stored_ids = [entry_id] if entry_id in existing else [
+                        point_id(piece) for piece in splitter.split_entry(entry)
+                    ]
+                    seen_ids.update(stored_ids)
+                    if all(stored_id in existing for stored_id in stored_ids):
+                        unchanged_count += 1
+                        structure = {field: entry.get(field) for field in STRUCTURE_FIELDS}
+                        for stored_id in stored_ids:
+                            if any(structure[field] != existing[stored_id].get(field) for field in STRUCTURE_FIELDS):
+                                moved[stored_id] = dict(structure, level=entry.get('level'))
+                        continue
+                    yield entry
+            
+            uploaded_count = self.upload_to_qdrant(new_entries(), batch_size=batch_size, journal=journal,
+                                                  dedup=dedup)
+            
+            vanished = [
+                existing_id for existing_id, payload in existing.items()
+                if existing_id not in seen_ids
+                and (prune_other_sources or (payload.get('source_file') or '') in seen_sources)
+            ]
+            deleted_count = self.delete_points(vanished)
+            renumbered_count = self.renumber_points(moved)
+            
+            logger.info(
+                f"Synced collection '{self.collection_name}': {uploaded_count} uploaded, "
+                f"{unchanged_count} unchanged ({renumbered_count} renumbered), {deleted_count} deleted"
+            )
+            return {'uploaded': uploaded_count, 'unchanged': unchanged_count, 'deleted': deleted_count}
+            
+        except Exception as e:
+            logger.error(f"Failed to sync collection: {e}")
+            raise
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection."""
         try:
@@ -274,8 +1147,41 @@ def create_default_config(config_path: str):
         'qdrant_port': 6333,
         'qdrant_api_key': None,
         'collection_name': 'cbt_documents',
+        'embedding_backend': 'openai',
         'embedding_model': 'text-embedding-3-small',
+        'local_model': 'sentence-transformers/all-MiniLM-L6-v2',
+        'local_batch_size': 32,
+        'local_threads': None,
         'batch_size': 100,
+        'embedding_concurrency': 4,
+        'upsert_concurrency': 1,
+        'max_pending_batches': 2,
+        'embedding_min_concurrency': 1,
+        'embedding_requests_per_minute': None,
+        'embedding_tokens_per_minute': None,
+        'embedding_max_retries': 6,
+        'batch_max_tokens': 50000,
+        'max_input_tokens': 8191,
+        'embedding_cache': None,
+        'embedding_cache_max_entries': 1000000,
+        'checkpoint_journal': DEFAULT_JOURNAL_PATH,
+        'dedup': 'fanout',
+        'hierarchical': False,
+        'quantization': 'none',
+        'quantization_always_ram': True,
+        'vectors_on_disk': False,
+        'payload_on_disk': False,
+        'hnsw_m': 16,
+        'hnsw_ef_construct': 100,
+        'shard_number': 1,
+        'replication_factor': 1,
+        'payload_indexes': list(DEFAULT_PAYLOAD_INDEXES),
+        'search_limit': 5,
+        'search_context_window': 0,
+        'search_sections': 3,
+        'query_cache_max_entries': 10000,
+        'query_cache_ttl': 3600,
+        'query_cache_path': None,
         'recreate_collection': False
     }
     
@@ -294,10 +1200,18 @@ def main():
         description='Upload chunked JSON files to Qdrant vector database'
     )
     
+    parser.add_argument(
+        'inputs',
+        nargs='*',
+        help='Chunk files, directories (searched recursively) or glob patterns to upload'
+    )
+    
     parser.add_argument(
         '--json-file', '-j',
         type=str,
-        help='Path to the JSON file to upload'
+        action='append',
+        default=[],
+        help='Path to a JSON file to upload (may be repeated)'
     )
     
     parser.add_argument(
@@ -331,6 +1245,62 @@ def main():
         help='Batch size for uploads (default: 100)'
     )
     
+    parser.add_argument(
+        '--embedding-concurrency',
+        type=int,
+        help='Embedding requests in flight at once (overrides config)'
+    )
+    
+    parser.add_argument(
+        '--upsert-concurrency',
+        type=int,
+        help='Parallel upserts to Qdrant (overrides config)'
+    )
+    
+    parser.add_argument(
+        '--embedding-backend',
+        choices=EMBEDDING_BACKENDS,
+        help='Compute embeddings with the OpenAI API or a local sentence-transformers model (overrides config)'
+    )
+    
+    parser.add_argument(
+        '--embedding-cache',
+        type=str,
+        help='SQLite file caching embeddings between runs (overrides config)'
+    )
+    
+    parser.add_argument(
+        '--dedup',
+        choices=DEDUP_MODES,
+        help='Embed repeated texts once and fan the vector out to every entry, merge them into one point, '
+             'or turn dedup off (overrides config)'
+    )
+    
+    parser.add_argument(
+        '--hierarchical',
+        action='store_true',
+        help='Upload hierarchical chunk files, with chunks and sections in sibling collections'
+    )
+    
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        help='Only embed new or changed entries and delete points of the file that are gone'
+    )
+    
+    parser.add_argument(
+        '--journal',
+        type=str,
+        help=f'Checkpoint journal of uploaded batches; {{collection}} is replaced by the collection name '
+             f'(default: config or {DEFAULT_JOURNAL_PATH})'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Skip entries the journal records as uploaded by an earlier, interrupted run'
+    )
+    
     args = parser.parse_args()
     
     # Handle config creation
@@ -354,36 +1324,78 @@ def main():
             'recreate_collection': args.recreate_collection
         }
     
+    if args.embedding_concurrency is not None:
+        config['embedding_concurrency'] = args.embedding_concurrency
+    if args.upsert_concurrency is not None:
+        config['upsert_concurrency'] = args.upsert_concurrency
+    if args.embedding_backend is not None:
+        config['embedding_backend'] = args.embedding_backend
+    if args.embedding_cache is not None:
+        config['embedding_cache'] = args.embedding_cache
+    if args.journal is not None:
+        config['checkpoint_journal'] = args.journal
+    if args.dedup is not None:
+        config['dedup'] = args.dedup
+    if args.hierarchical:
+        config['hierarchical'] = True
+    
     # Validate required arguments
-    if not args.json_file:
+    inputs = args.json_file + args.inputs
+    if not inputs:
         logger.error("JSON file path is required")
         parser.print_help()
         return
     
-    if not os.path.exists(args.json_file):
-        logger.error(f"JSON file not found: {args.json_file}")
+    missing = [path for path in inputs if not glob.has_magic(path) and not os.path.exists(path)]
+    if missing:
+        logger.error(f"JSON file not found: {', '.join(missing)}")
         return
     
+    json_files = list(find_chunk_files(inputs))
+    if not json_files:
+        logger.error(f"No chunk files found in: {', '.join(inputs)}")
+        return
+    logger.info(f"Uploading {len(json_files)} chunk file(s)")
+    
+    journal = None
     try:
         # Initialize uploader
         uploader = QdrantUploader(config)
         
+        # Record finished batches so an interrupted upload can be resumed
+        path = journal_path(config, uploader.collection_name)
+        journal = UploadJournal(path, uploader.collection_name, uploader.embedding_model_name,
+                                resume=args.resume)
+        if args.resume:
+            logger.info(f"Resuming from {path}: {journal.completed_batches} batches already uploaded")
+        
         # Create collection with appropriate vector size
-        vector_size = config.get('vector_size', 1536)
-        uploader.create_collection(vector_size=vector_size, recreate=config.get('recreate_collection', False))
+        # (local models know their size; OpenAI's comes from the config)
+        vector_size = uploader.embedding_backend.dimensions or config.get('vector_size', 1536)
+        recreate = config.get('recreate_collection', False)
+        if (args.diff or args.resume) and recreate:
+            logger.warning("Ignoring recreate_collection in --diff/--resume mode")
+            recreate = False
+        uploader.create_collection(vector_size=vector_size, recreate=recreate)
         
-        # Load JSON data
-        data = uploader.load_json_data(args.json_file)
+        # Stream all files through one pipeline, packing batches across file boundaries
+        data = uploader.iter_files_data(json_files)
         
-        if not data:
-            logger.warning("No valid data found in JSON file")
-            return
+        if args.diff:
+            # Only embed what changed since the last upload
+            counts = uploader.sync_to_qdrant(data, batch_size=config.get('batch_size', 100), journal=journal)
+            uploaded_count = counts['uploaded'] + counts['unchanged']
+        else:
+            # Upload to Qdrant
+            uploaded_count = uploader.upload_to_qdrant(
+                data, 
+                batch_size=config.get('batch_size', 100),
+                journal=journal
+            )
         
-        # Upload to Qdrant
-        uploaded_count = uploader.upload_to_qdrant(
-            data, 
-            batch_size=config.get('batch_size', 100)
-        )
+        if not uploaded_count and not journal.completed_ids:
+            logger.warning("No valid data found in the JSON files")
+            return
         
         # Display collection info
         collection_info = uploader.get_collection_info()
@@ -393,7 +1405,12 @@ def main():
         
     except Exception as e:
         logger.error(f"Upload failed: {e}")
+        if journal is not None:
+            logger.error(f"Finished batches are recorded in {journal.path}; rerun with --resume to continue")
         sys.exit(1)
+    finally:
+        if journal is not None:
+            journal.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""Tests for the Markdown chunker."""
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from chunk_markdown import (
+    OUTPUT_EXTENSIONS,
+    OUTPUT_WRITERS,
+    SentenceSplitter,
+    _iter_json_array,
+    chunk_directory,
+    chunk_markdown_file,
+    iter_chunk_markdown_file,
+    iter_markdown_blocks,
+    plan_file_segments,
+    read_records,
+    sentence_spans,
+    split_into_sentences,
+    write_json_records,
+    write_jsonl_records,
+)
+
+CBT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CBT')
+CBT_MD = os.path.join(CBT_DIR, 'Self_Administered_CBT.md')
+CBT_JSON = os.path.join(CBT_DIR, 'Self_Administered_CBT.json')
+
+
+def test_chunk_markdown_file_matches_reference_output():
+    with open(CBT_JSON, 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+
+    assert chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md') == expected
+
+
+def test_split_into_sentences_protects_abbreviations_and_numbers():
+    text = "Dr. Smith lives in the U.S.A. now. It rose 3.14 percent! See file.py for details. Really?! Yes."
+
+    assert split_into_sentences(text) == [
+        "Dr. Smith lives in the U.S.A. now.",
+        "It rose 3.14 percent!",
+        "See file.py for details.",
+        "Really?!",
+        "Yes.",
+    ]
+
+
+def test_split_into_sentences_initials():
+    assert split_into_sentences("Written by J. R. R. Tolkien. Then Aaron T. Beck agreed.") == [
+        "Written by J. R. R. Tolkien.",
+        "Then Aaron T. Beck agreed.",
+    ]
+
+
+def test_sentence_splitter_custom_abbreviations():
+    splitter = SentenceSplitter(abbreviations={'Approx'})
+
+    assert splitter.split("It costs approx. Ten dollars. Dr. Who?") == [
+        "It costs approx. Ten dollars.",
+        "Dr.",
+        "Who?",
+    ]
+
+
+def test_sentence_spans_index_original_text():
+    text = "  Dr. Smith arrived at 3.5 p.m. today.  Then he left!  "
+    spans = sentence_spans(text)
+
+    assert spans == [(2, 38), (40, 53)]
+    assert [text[start:end] for start, end in spans] == split_into_sentences(text)
+
+
+def test_streaming_writers_match_json_dump(tmp_path):
+    json_path = tmp_path / 'out.json'
+    jsonl_path = tmp_path / 'out.jsonl'
+
+    count = write_json_records(iter_chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md'), json_path)
+    write_jsonl_records(iter_chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md'), jsonl_path)
+
+    with open(CBT_JSON, 'r', encoding='utf-8') as f:
+        reference = f.read()
+    assert json_path.read_text(encoding='utf-8') == reference
+    assert count == len(json.loads(reference))
+
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == json.loads(reference)
+
+
+def test_parallel_chunk_directory_matches_serial(tmp_path):
+    with open(CBT_MD, 'rb') as f:
+        source = f.read()
+    (tmp_path / 'small.md').write_bytes(source)
+    (tmp_path / 'nested').mkdir()
+    (tmp_path / 'nested' / 'big.md').write_bytes(source.replace(b'\n', b'\r\n') * 4)
+
+    chunk_directory(tmp_path, workers=1)
+    serial = {path: path.read_bytes() for path in tmp_path.rglob('*.json')}
+
+    assert len(plan_file_segments(tmp_path / 'nested' / 'big.md', split_bytes=50000)) > 1
+    chunk_directory(tmp_path, workers=2, chunksize=2, split_bytes=50000)
+    assert {path: path.read_bytes() for path in tmp_path.rglob('*.json')} == serial
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_same_named_files_keep_their_relative_paths(tmp_path, workers):
+    for directory in ('a', 'b'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'README.md').write_text(f"# {directory}\nFirst.\n", encoding='utf-8')
+
+    chunk_directory(tmp_path, workers=workers)
+
+    for directory in ('a', 'b'):
+        records = json.loads((tmp_path / directory / 'README.json').read_text(encoding='utf-8'))
+        assert [record['source_file'] for record in records] == [f'{directory}/README.md']
+
+
+def test_import_does_not_load_gui_or_process_pool():
+    code = (
+        "import sys, chunk_markdown; "
+        "print(sorted(m for m in ('tkinter', 'argparse', 'multiprocessing') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == '[]'
+
+
+def test_cli_writes_output_directory(tmp_path):
+    (tmp_path / 'in' / 'book').mkdir(parents=True)
+    with open(CBT_MD, 'rb') as f:
+        (tmp_path / 'in' / 'book' / 'cbt.md').write_bytes(f.read())
+
+    subprocess.run(
+        [sys.executable, 'chunk_markdown.py', str(tmp_path / 'in'), '-o', str(tmp_path / 'out'),
+         '--workers', '1', '--strategy', 'semantic'],
+        cwd=REPO_DIR,
+        check=True,
+        capture_output=True
+    )
+
+    records = json.loads((tmp_path / 'out' / 'book' / 'cbt.json').read_text(encoding='utf-8'))
+    assert records == chunk_markdown_file(CBT_MD, 'book/cbt.md', strategy='semantic')
+    assert 0 < len(records) < 668
+
+
+def test_incremental_chunking_skips_unchanged_and_removes_deleted(tmp_path):
+    source_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    manifest_path = output_dir / '.chunk_manifest.json'
+    source_dir.mkdir()
+    (source_dir / 'keep.md').write_text("# Title\nFirst sentence. Second one.\n", encoding='utf-8')
+    (source_dir / 'gone.md').write_text("Gone soon.\n", encoding='utf-8')
+
+    assert chunk_directory(source_dir, output_dir, workers=1, manifest_path=manifest_path) == 2
+    assert chunk_directory(source_dir, output_dir, workers=1, manifest_path=manifest_path) == 0
+
+    # A touched file with the same content stays current
+    os.utime(source_dir / 'keep.md', ns=(0, 0))
+    (source_dir / 'gone.md').unlink()
+    assert chunk_directory(source_dir, output_dir, workers=1, manifest_path=manifest_path) == 0
+    assert not (output_dir / 'gone.json').exists()
+
+    (source_dir / 'keep.md').write_text("# Title\nChanged sentence.\n", encoding='utf-8')
+    assert chunk_directory(source_dir, output_dir, workers=1, manifest_path=manifest_path) == 1
+    assert [r['text'] for r in json.loads((output_dir / 'keep.json').read_text(encoding='utf-8'))] == [
+        "Changed sentence."
+    ]
+
+    # A different chunker config re-chunks everything
+    assert chunk_directory(source_dir, output_dir, workers=1, strategy='semantic', manifest_path=manifest_path) == 1
+    assert list(json.loads(manifest_path.read_text(encoding='utf-8'))['files']) == [
+        os.path.abspath(source_dir / 'keep.md')
+    ]
+
+
+def test_output_formats_round_trip(tmp_path):
+    records = chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md')
+    records.append({**records[-1], 'chapter_name': None, 'text': "Headless."})
+
+    for output_format, write_records in OUTPUT_WRITERS.items():
+        output_path = tmp_path / ('records' + OUTPUT_EXTENSIONS[output_format])
+        assert write_records(iter(records), output_path) == len(records)
+        assert list(read_records(output_path)) == records
+
+    compact_size = (tmp_path / 'records.compact.jsonl').stat().st_size
+    assert compact_size * 3 < (tmp_path / 'records.json').stat().st_size
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_iter_json_array_streams_elements(chunk_size):
+    data = chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md')[:25] + [1.5e10, "text", None, [1, {'a': True}]]
+    text = json.dumps(data, indent=4, ensure_ascii=False)
+
+    assert list(_iter_json_array(io.StringIO(text), chunk_size)) == data
+
+
+def test_records_are_numbered_per_file():
+    records = chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md')
+
+    assert [record['sentence_index'] for record in records] == list(range(len(records)))
+
+
+def test_hierarchical_records_follow_their_parents(tmp_path):
+    records = chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md', strategy='hierarchical')
+    sentences = chunk_markdown_file(CBT_MD, 'Self_Administered_CBT.md')
+
+    # The sentence level is the sentence strategy's output, each after its chunk and section
+    assert [r['text'] for r in records if r['level'] == 'sentence'] == [r['text'] for r in sentences]
+    section = chunk = None
+    for record in records:
+        if record['level'] == 'section':
+            section = record
+            assert record['chunk_index'] is None and record['sentence_index'] is None
+        elif record['level'] == 'chunk':
+            chunk = record
+            assert record['section_index'] == section['section_index']
+            assert record['text'] in section['text']
+        else:
+            assert (record['section_index'], record['chunk_index']) == (section['section_index'], chunk['chunk_index'])
+            assert record['text'] in chunk['text']
+    for level in ('section', 'chunk', 'sentence'):
+        indexes = [r[f'{level}_index'] for r in records if r['level'] == level]
+        assert indexes == list(range(len(indexes)))
+
+    (tmp_path / 'big.md').write_bytes(open(CBT_MD, 'rb').read() * 3)
+    chunk_directory(tmp_path, strategy='hierarchical', workers=1)
+    serial = (tmp_path / 'big.json').read_bytes()
+    chunk_directory(tmp_path, strategy='hierarchical', workers=2, split_bytes=50000)
+    assert (tmp_path / 'big.json').read_bytes() == serial
+
+
+BLOCKS_MD = """---
+title: Notes
+# not a heading
+---
+# Guide
+
+A paragraph that wraps
+over two lines. Second sentence.
+
+```python
+# not a heading either
+print("Hi. There.")
+```
+
+| Step | Action |
+|------|--------|
+| 1 | Breathe. |
+
+- First item,
+  continued. Still the first.
+2. Second item.
+
+> Quoted text
+> on two lines.
+
+***
+"""
+
+
+def test_markdown_blocks_are_chunked_by_kind(tmp_path):
+    assert [kind for kind, _ in iter_markdown_blocks(BLOCKS_MD.splitlines(True))] == [
+        'front_matter', 'heading', 'paragraph', 'code', 'table', 'list_item', 'list_item', 'quote', 'rule'
+    ]
+    md_file = tmp_path / 'blocks.md'
+    md_file.write_text(BLOCKS_MD, encoding='utf-8')
+
+    records = chunk_markdown_file(md_file, 'blocks.md')
+    assert [record['text'] for record in records] == [
+        'A paragraph that wraps over two lines.', 'Second sentence.',
+        'First item, continued.', 'Still the first.', 'Second item.',
+        'Quoted text on two lines.',
+    ]
+    assert {record['chapter_name'] for record in records} == {'Guide'}
+
+    kept = chunk_markdown_file(md_file, 'blocks.md', keep_blocks=('code', 'table'))
+    assert kept[2]['text'] == '# not a heading either\nprint("Hi. There.")'
+    assert kept[3]['text'].splitlines()[-1] == '| 1 | Breathe. |'
+
+    # Comments inside fences longer than a segment can't start a parallel segment
+    long_fence = BLOCKS_MD.replace('# not a heading either\n', '# not a heading either\n' * 50)
+    (tmp_path / 'blocks.md').write_text(long_fence * 20, encoding='utf-8')
+    chunk_directory(tmp_path, workers=1, keep_blocks=('code',))
+    serial = (tmp_path / 'blocks.json').read_bytes()
+    assert len(plan_file_segments(tmp_path / 'blocks.md', split_bytes=1000)) > 10
+    chunk_directory(tmp_path, workers=2, split_bytes=1000, keep_blocks=('code',))
+    assert (tmp_path / 'blocks.json').read_bytes() == serial